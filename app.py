@@ -1,19 +1,114 @@
-from flask import Flask, jsonify
+import click
+from flask import Flask, jsonify, request
 from flask_cors import CORS
 from routes.user import user_bp
-from routes.analytics import analytics_bp
-from auth import auth_bp
+from routes.analytics import analytics_bp, refresh_user_risk_report
+from auth import admin_required, auth_bp
+from config import db, pool_metrics
+from detection import DetectionEngine
+from indexes import ensure_indexes, print_index_report
+from instrumentation import init_app as instrument, metrics_response
+from json_provider import MongoJSONProvider
+from rollups import rebuild as rebuild_rollups, rebuild_usage_stats
+from slow_queries import SLOW_QUERY_MS, worst_offenders_query
+from write_behind import WRITE_BEHIND_ENABLED, activity_queue
 
 app = Flask(__name__)
+app.json = MongoJSONProvider(app)
 CORS(app)
+instrument(app)
 
 app.register_blueprint(user_bp)
 app.register_blueprint(analytics_bp)
 app.register_blueprint(auth_bp)
 
+ensure_indexes()
+
+
+@app.cli.command("index-report")
+def index_report_command():
+    """Report missing, unused and undeclared indexes using $indexStats."""
+    print_index_report()
+
+
+@app.cli.command("rebuild-rollups")
+def rebuild_rollups_command():
+    """Recompute the dashboard rollup from the source collections."""
+    doc = rebuild_rollups()
+    if doc.get("errors"):
+        for field, message in doc["errors"].items():
+            print(f"  {field}: {message}")
+        raise SystemExit("dashboard rollup only partially rebuilt")
+    print(f"dashboard rollup rebuilt at {doc['rebuilt_at'].isoformat()}")
+
+
+@app.cli.command("repair-usage-stats")
+def repair_usage_stats_command():
+    """Recompute every user's usage_stats running totals from usage_logs."""
+    result = rebuild_usage_stats()
+    print(f"usage_stats rebuilt at {result['rebuilt_at'].isoformat()}: "
+          f"{result['with_usage']} users with usage, {result['without_usage']} without")
+
+
+@app.cli.command("refresh-risk-report")
+def refresh_risk_report_command():
+    """Rebuild the materialized user_risk_report collection with $merge."""
+    result = refresh_user_risk_report()
+    print(f"user_risk_report refreshed at {result['refreshed_at'].isoformat()}: "
+          f"{result['users']} users, {result['removed']} removed")
+
+
+@app.cli.command("detect-anomalies")
+@click.option("--once", is_flag=True, help="Process pending events and exit instead of polling.")
+@click.option("--interval", default=2.0, show_default=True, help="Seconds between polls.")
+def detect_anomalies_command(once, interval):
+    """Tail activity and usage logs and write anomaly flags as rules trip."""
+    engine = DetectionEngine()
+    if once:
+        engine.warm()
+        print(f"{len(engine.poll_once())} anomaly flags raised")
+    else:
+        engine.run(poll_interval=interval)
+
+
 @app.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "API is running"}), 200
 
+
+@app.route("/health/pool", methods=["GET"])
+def pool_health():
+    return jsonify(pool_metrics.snapshot()), 200
+
+
+@app.route("/health/ingest", methods=["GET"])
+def ingest_health():
+    return jsonify({"write_behind": WRITE_BEHIND_ENABLED, **activity_queue.snapshot()}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    pool   = pool_metrics.snapshot()
+    ingest = activity_queue.snapshot()
+    return metrics_response({
+        "mongodb_pool_checked_out_connections": ("Connections currently checked out of the pool.", pool["checked_out"]),
+        "mongodb_pool_open_connections":        ("Connections currently open.", pool["open_connections"]),
+        "activity_write_behind_queue_depth":    ("Activity logs waiting to be written.", ingest["queue_depth"]),
+    })
+
+
+@app.route("/admin/slow-queries", methods=["GET"])
+@admin_required
+def slow_queries():
+    query, error = worst_offenders_query(request.args)
+    if error:
+        message, field, code = error
+        return jsonify({"error": message, "field": field}), code
+    if "filter" in query:
+        samples = list(db["slow_queries"].find(query["filter"]).sort("at", -1).limit(query["limit"]))
+        return jsonify({"threshold_ms": SLOW_QUERY_MS, "count": len(samples), "samples": samples}), 200
+    offenders = list(db["slow_queries"].aggregate(query["pipeline"]))
+    return jsonify({"threshold_ms": SLOW_QUERY_MS, "count": len(offenders), "offenders": offenders}), 200
+
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
\ No newline at end of file
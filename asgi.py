@@ -0,0 +1,400 @@
+import asyncio
+from datetime import datetime
+from functools import wraps
+
+import pymongo
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, g, jsonify, make_response, request
+from pymongo.errors import ExecutionTimeout, NetworkTimeout, PyMongoError
+from werkzeug.exceptions import HTTPException
+
+import response_cache
+import rollups
+from app import app as flask_app
+from auth import verify_token
+from config import ANALYTICS_READ_PREFERENCE, MONGO_DB_NAME, create_async_client
+from instrumentation import SERVER_TIMING, command_metrics, finish_request, start_request
+from json_provider import MongoJSONProvider
+from pagination import finish_page, plan_page
+from routes.analytics import (
+    ANALYTICS_TIMEOUT_MS,
+    ANOMALY_SUMMARY_PIPELINE,
+    avg_api_calls_by_tier_query,
+    avg_api_calls_query,
+    failed_logins_pipelines,
+    high_usage_pipelines,
+    nearby_activity_pipeline,
+    ops_breakdown_query,
+    results_body,
+    risk_report_page,
+    search_logs_filter,
+    user_risk_report_query,
+)
+from routes.user import activity_log_filters, build_activity_log
+from slow_queries import slow_query_monitor
+from write_behind import WRITE_BEHIND_ENABLED, activity_queue
+
+# ---------------------------------------------------------------------------
+# ASGI ENTRY POINT — async handlers on the asyncio MongoDB driver
+#
+#   uvicorn asgi:application --port 5002 --workers 4
+#
+# The read-heavy routes (dashboard summary, activity log list/create and
+# every /analytics/* aggregation) are served here by a Quart app on an
+# AsyncMongoClient, so a slow aggregation waits on the event loop instead
+# of holding a thread. Their validation and pipelines are the functions the
+# Flask views use, so both entry points answer identically. Every other
+# route falls through to the Flask app in asgiref's thread pool.
+# ---------------------------------------------------------------------------
+
+quart_app = Quart(__name__)
+quart_app.json = MongoJSONProvider(quart_app)
+
+# bound in before_serving — the async client must be created in the loop that uses it
+db           = None
+analytics_db = None
+
+
+@quart_app.before_serving
+async def connect():
+    global db, analytics_db
+    db           = create_async_client(listeners=[command_metrics, slow_query_monitor])[MONGO_DB_NAME]
+    analytics_db = db.with_options(read_preference=ANALYTICS_READ_PREFERENCE)
+
+
+@quart_app.after_serving
+async def disconnect():
+    await db.client.close()
+
+
+@quart_app.before_request
+async def start_timing():
+    # each request runs in its own task, so the context variable needs no reset afterwards
+    g.timing, _ = start_request(request.url_rule.rule if request.url_rule else "unmatched")
+
+
+@quart_app.after_request
+async def record_timing(response):
+    timing = finish_request(g.timing, request.method, response.status_code)
+    if quart_app.debug or SERVER_TIMING:
+        response.headers["Server-Timing"] = timing
+    return response
+
+
+@quart_app.teardown_request
+async def record_failure(exc):
+    state = g.pop("timing", None)
+    if state is not None and not state["recorded"]:
+        finish_request(state, request.method, 500)
+
+
+@quart_app.after_request
+async def allow_cross_origin(response):
+    # matches flask_cors' defaults on the WSGI app; preflight requests are answered in application()
+    response.headers.setdefault("Access-Control-Allow-Origin", "*")
+    return response
+
+
+# ---------------------------------------------------------------------------
+# HELPERS — async counterparts of auth, response_cache and pagination
+# ---------------------------------------------------------------------------
+
+def err(msg, field=None, code=400):
+    body = {"error": msg}
+    if field:
+        body["field"] = field
+    return jsonify(body), code
+
+
+def requires(*roles, denied="Access denied"):
+    def decorator(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            # a bloom-filter hit in the revocation cache queries Mongo, so keep it off the loop
+            payload, error = await asyncio.to_thread(verify_token, request.headers.get("x-access-token"))
+            if error:
+                return jsonify({"error": error[0]}), error[1]
+            if payload["role"] not in roles:
+                return jsonify({"error": denied}), 403
+            return await f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+analyst_or_admin = requires("admin", "analyst")
+admin_required   = requires("admin", denied="Admin access required")
+
+
+async def conditional(entry):
+    response = await make_response(entry["body"], entry["status"])
+    response.mimetype = entry["mimetype"]
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.headers["Cache-Control"] = "private, no-cache"
+    return await response.make_conditional(request)
+
+
+def cached(*tags):
+    """Async @response_cache.cached — shares the same backend and keys."""
+    def decorator(f):
+        @wraps(f)
+        async def decorated(*args, **kwargs):
+            key   = response_cache.cache_key(request.path, request.args)
+            entry = response_cache.lookup(key)
+            if entry is None:
+                since    = response_cache.generation(tags)
+                response = await make_response(await f(*args, **kwargs))
+                if response.status_code != 200 or "no-store" in response.headers.get("Cache-Control", ""):
+                    return response
+                entry = response_cache.store(key, await response.get_data(), response.status_code,
+                                             response.mimetype, tags, since)
+                if entry is None:
+                    return response
+            return await conditional(entry)
+        return decorated
+    return decorator
+
+
+async def aggregate(col, pipeline):
+    return await (await col.aggregate(pipeline)).to_list()
+
+
+async def run_pipelines(col, pipelines):
+    """Async fanout.run_parallel: aggregate each {name: pipeline} concurrently under ANALYTICS_TIMEOUT_MS."""
+    seconds = ANALYTICS_TIMEOUT_MS / 1000
+
+    async def run(pipeline):
+        with pymongo.timeout(seconds):
+            return await asyncio.wait_for(aggregate(col, pipeline), seconds)
+
+    names   = [name for name, p in pipelines.items() if p]
+    settled = await asyncio.gather(*(run(pipelines[name]) for name in names), return_exceptions=True)
+
+    results, errors = {}, {}
+    for name, outcome in zip(names, settled):
+        if isinstance(outcome, (asyncio.TimeoutError, ExecutionTimeout, NetworkTimeout)):
+            errors[name] = f"timed out after {ANALYTICS_TIMEOUT_MS} ms"
+        elif isinstance(outcome, PyMongoError):
+            errors[name] = str(outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results[name] = outcome
+    return results, errors
+
+
+def partial_response(body, found, errors):
+    if not errors:
+        return jsonify(body), 200
+    if not found:
+        return jsonify({"error": "Query failed or timed out", "errors": errors}), 504
+    return jsonify({**body, "errors": errors}), 200, {"Cache-Control": "no-store"}
+
+
+async def paginate(col, query, sort_field=None, projection=None, direction=-1):
+    plan, error = plan_page(query, sort_field, direction, request.args)
+    if error:
+        return None, None, err(*error)
+
+    cursor = col.find(plan["filter"], projection).sort(plan["sort"]).skip(plan["skip"]).limit(plan["limit"])
+    docs, meta = finish_page(await cursor.to_list(), plan)
+    if plan["total"] == "true":
+        meta["total"] = await col.count_documents(query)
+    elif plan["total"] == "estimate":
+        meta["total_estimate"] = await col.estimated_document_count()
+    meta["next_cursor"] = meta.pop("next_cursor")
+    return docs, meta, None
+
+
+# ---------------------------------------------------------------------------
+# ROUTES
+# ---------------------------------------------------------------------------
+
+@quart_app.route("/health", methods=["GET"])
+async def health_check():
+    return jsonify({"status": "API is running"}), 200
+
+
+@quart_app.route("/dashboard/summary", methods=["GET"])
+@analyst_or_admin
+async def dashboard_summary():
+    fresh = request.args.get("fresh", "false").lower() == "true"
+    now   = datetime.utcnow()
+    doc   = None if fresh else await analytics_db[rollups.rollups_col.name].find_one({"_id": rollups.ROLLUP_ID})
+    if doc is None:
+        doc = await asyncio.to_thread(rollups.rebuild)     # occasional multi-query rebuild
+    elif rollups.is_stale(doc, now):
+        rollups.refresh_in_background()
+    return jsonify(rollups.format_summary(doc, now)), 200
+
+
+@quart_app.route("/activity-logs", methods=["GET"])
+@analyst_or_admin
+async def get_activity_logs():
+    query, error = activity_log_filters(request.args)
+    if error:
+        return err(*error)
+
+    logs, meta, error = await paginate(db["activity_logs"], query, "timestamp")
+    if error:
+        return error
+
+    return jsonify({**meta, "logs": logs}), 200
+
+
+@quart_app.route("/activity-logs", methods=["POST"])
+@admin_required
+async def create_activity_log():
+    log, error = build_activity_log(await request.get_json(silent=True) or {})
+    if error:
+        return err(*error)
+
+    if WRITE_BEHIND_ENABLED:
+        if not activity_queue.put(log):
+            body, code = err("Ingestion queue is full, retry shortly", code=429)
+            return body, code, {"Retry-After": "1"}
+        return jsonify({"message": "Activity log queued", "log_id": str(log["_id"])}), 202
+
+    result = await db["activity_logs"].insert_one(log)
+    await db[rollups.rollups_col.name].update_one(
+        {"_id": rollups.ROLLUP_ID}, {"$inc": rollups.activity_increments([log["timestamp"]])}, upsert=True,
+    )
+    response_cache.invalidate("activity_logs")
+    return jsonify({"message": "Activity log created", "log_id": str(result.inserted_id)}), 201
+
+
+@quart_app.route("/analytics/avg-api-calls", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs", "users")
+async def avg_api_calls_per_user():
+    query, error = avg_api_calls_query(request.args)
+    if error:
+        return err(*error)
+    return jsonify(await aggregate(analytics_db[query["collection"]], query["pipeline"])), 200
+
+
+@quart_app.route("/analytics/avg-api-calls-by-tier", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs")
+async def avg_api_calls_by_tier():
+    query, error = avg_api_calls_by_tier_query(request.args)
+    if error:
+        return err(*error)
+    return jsonify(await aggregate(analytics_db[query["collection"]], query["pipeline"])), 200
+
+
+@quart_app.route("/analytics/high-usage", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs", "users")
+async def high_usage_anomalies():
+    pipelines, error = high_usage_pipelines(request.args)
+    if error:
+        return err(*error)
+
+    found, errors = await run_pipelines(analytics_db["usage_logs"], {"results": pipelines["results"], "buckets": pipelines["buckets"]})
+    return partial_response(results_body(pipelines, found, "count"), found, errors)
+
+
+@quart_app.route("/analytics/failed-logins", methods=["GET"])
+@analyst_or_admin
+@cached("activity_logs")
+async def detect_failed_logins():
+    pipelines, error = failed_logins_pipelines(request.args)
+    if error:
+        return err(*error)
+
+    found, errors = await run_pipelines(analytics_db["activity_logs"], {"results": pipelines["results"], "buckets": pipelines["buckets"]})
+    return partial_response(results_body(pipelines, found, "flagged_users"), found, errors)
+
+
+@quart_app.route("/analytics/anomaly-summary", methods=["GET"])
+@analyst_or_admin
+@cached("anomaly_flags")
+async def anomaly_summary():
+    return jsonify(await aggregate(analytics_db["anomaly_flags"], ANOMALY_SUMMARY_PIPELINE)), 200
+
+
+@quart_app.route("/analytics/search-logs", methods=["GET"])
+@analyst_or_admin
+async def search_activity_logs():
+    query, error = search_logs_filter(request.args)
+    if error:
+        return err(*error)
+
+    logs, meta, error = await paginate(analytics_db["activity_logs"], query, "timestamp")
+    if error:
+        return error
+
+    return jsonify({**meta, "logs": logs}), 200
+
+
+@quart_app.route("/analytics/nearby-activity", methods=["GET"])
+@analyst_or_admin
+async def nearby_activity():
+    pipeline, error = nearby_activity_pipeline(request.args)
+    if error:
+        return err(*error)
+    results = await aggregate(analytics_db["activity_logs"], pipeline)
+    return jsonify({"count": len(results), "results": results}), 200
+
+
+@quart_app.route("/analytics/user-risk-report", methods=["GET"])
+@analyst_or_admin
+@cached("users", "anomaly_flags")
+async def user_risk_report():
+    query, error = user_risk_report_query(request.args)
+    if error:
+        return err(*error)
+    rows = await aggregate(analytics_db[query["collection"]], query["pipeline"])
+    return jsonify(risk_report_page(rows, query)), 200
+
+
+@quart_app.route("/analytics/ops-breakdown", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs")
+async def ops_breakdown():
+    query, error = ops_breakdown_query(request.args)
+    if error:
+        return err(*error)
+    return jsonify(await aggregate(analytics_db[query["collection"]], query["pipeline"])), 200
+
+
+# ---------------------------------------------------------------------------
+# DISPATCH — async routes above, everything else via the WSGI app
+# ---------------------------------------------------------------------------
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+async_routes  = quart_app.url_map.bind("localhost")
+flask_routes  = flask_app.url_map.bind("localhost")
+
+# flask_cors' defaults on the WSGI app: any origin, every method, the requested headers
+CORS_ALLOW_METHODS = "DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"
+
+
+async def preflight(scope, send, allowed):
+    """The empty 200 Flask's automatic OPTIONS handler sends, with the headers flask_cors adds to it."""
+    headers = [
+        (b"allow", ", ".join(sorted(allowed)).encode()),
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-allow-methods", CORS_ALLOW_METHODS.encode()),
+        (b"content-length", b"0"),
+    ]
+    requested = dict(scope["headers"]).get(b"access-control-request-headers")
+    if requested:
+        headers.append((b"access-control-allow-headers", requested))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "http":
+        if scope["method"] == "OPTIONS":
+            allowed = flask_routes.allowed_methods(scope["path"])
+            if allowed:
+                return await preflight(scope, send, allowed)
+            return await wsgi_fallback(scope, receive, send)     # unknown path — Flask's 404
+        try:
+            async_routes.match(scope["path"], method=scope["method"])
+        except HTTPException:
+            return await wsgi_fallback(scope, receive, send)
+    return await quart_app(scope, receive, send)
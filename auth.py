@@ -1,12 +1,15 @@
 import os
 import datetime
+import uuid
 from functools import wraps
 
-import bcrypt
 import jwt
 from flask import Blueprint, jsonify, make_response, request
+from pymongo.errors import DuplicateKeyError
 
 from config import db
+from passwords import PasswordPoolBusy, check_password, hash_password, login_limiter
+from revocation import RevocationCache, revocation_id
 
 auth_bp = Blueprint("auth", __name__)
 login_collection   = db["login"]
@@ -14,6 +17,14 @@ blacklisted_tokens = db["blacklisted_tokens"]
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "saas-monitoring-secret-2026")
 
+revocation_cache = RevocationCache(
+    blacklisted_tokens,
+    capacity=int(os.environ.get("REVOCATION_BLOOM_CAPACITY", 100_000)),
+    max_size=int(os.environ.get("REVOCATION_CACHE_SIZE", 10_000)),
+    poll_interval=int(os.environ.get("REVOCATION_POLL_SECONDS", 5)),
+    rebuild_interval=int(os.environ.get("REVOCATION_REBUILD_SECONDS", 3600)),
+)
+
 # LOGIN
 
 @auth_bp.route("/login", methods=["POST"])
@@ -28,12 +39,39 @@ def login():
     if not email or not password:
         return make_response(jsonify({"error": "Email and password required"}), 400)
 
+    # checked before the lookup so a locked-out email costs no database or bcrypt work
+    retry_after = login_limiter.retry_after(email)
+    if retry_after:
+        response = make_response(jsonify({"error": "Too many failed login attempts"}), 429)
+        response.headers["Retry-After"] = str(retry_after)
+        return response
+
     user = login_collection.find_one({"email": email})
     if not user:
+        login_limiter.failed(email)
         return make_response(jsonify({"error": "Invalid credentials"}), 401)
 
-    if not bcrypt.checkpw(password.encode("utf-8"), user["password"].encode("utf-8")):
+    try:
+        matches, needs_rehash = check_password(password, user["password"])
+    except PasswordPoolBusy:
+        response = make_response(jsonify({"error": "Login is busy, try again shortly"}), 503)
+        response.headers["Retry-After"] = "1"
+        return response
+
+    if not matches:
+        login_limiter.failed(email)
         return make_response(jsonify({"error": "Invalid credentials"}), 401)
+    login_limiter.succeeded(email)
+
+    if needs_rehash:
+        # BCRYPT_ROUNDS changed since this hash was made; a busy pool just leaves it for the next login
+        try:
+            login_collection.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": hash_password(password)}},
+            )
+        except PasswordPoolBusy:
+            pass
 
     role = user["role"]
     if role not in ("admin", "analyst"):
@@ -44,6 +82,7 @@ def login():
             "user":    email,
             "role":    role,
             "user_id": str(user.get("user_id", "")),
+            "jti":     uuid.uuid4().hex,
             "exp":     datetime.datetime.now(datetime.UTC) + datetime.timedelta(hours=24),
         },
         SECRET_KEY,
@@ -88,34 +127,50 @@ def logout():
     except jwt.InvalidTokenError:
         return make_response(jsonify({"error": "Token is invalid"}), 401)
 
-    if blacklisted_tokens.find_one({"token": token}):
+    jti = revocation_id(token, payload)
+    if revocation_cache.is_revoked(jti):
         return make_response(jsonify({"error": "Token already invalidated"}), 401)
 
-    blacklisted_tokens.insert_one({
-        "token":      token,
-        "email":      payload.get("user"),
-        "invalidated_at": datetime.datetime.now(datetime.UTC).isoformat(),
-    })
+    # expires_at drives the TTL index — entries are dropped once the token would have expired anyway
+    try:
+        blacklisted_tokens.insert_one({
+            "jti":            jti,
+            "email":          payload.get("user"),
+            "invalidated_at": datetime.datetime.now(datetime.UTC),
+            "expires_at":     datetime.datetime.fromtimestamp(payload["exp"], datetime.UTC),
+        })
+    except DuplicateKeyError:
+        # a concurrent logout with the same token got there first
+        revocation_cache.mark_revoked(jti)
+        return make_response(jsonify({"error": "Token already invalidated"}), 401)
+    revocation_cache.mark_revoked(jti)
     return make_response(jsonify({"message": "Logged out successfully"}), 200)
 
 
 # DECORATORS
 
-def _decode_token():
-    """Return decoded payload or None."""
-    token = request.headers.get("x-access-token")
+def verify_token(token):
+    """Decode a raw token and check it isn't revoked. Returns (payload, error) — error is (message, status)."""
     if not token:
-        return None, make_response(jsonify({"error": "Token is missing"}), 401)
+        return None, ("Token is missing", 401)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
-        return None, make_response(jsonify({"error": "Token has expired"}), 401)
+        return None, ("Token has expired", 401)
     except jwt.InvalidTokenError:
-        return None, make_response(jsonify({"error": "Token is invalid"}), 401)
+        return None, ("Token is invalid", 401)
+
+    if revocation_cache.is_revoked(revocation_id(token, payload)):
+        return None, ("Token has been invalidated — please log in again", 401)
+
+    return payload, None
 
-    if blacklisted_tokens.find_one({"token": token}):
-        return None, make_response(jsonify({"error": "Token has been invalidated — please log in again"}), 401)
 
+def _decode_token():
+    """Return decoded payload or None."""
+    payload, error = verify_token(request.headers.get("x-access-token"))
+    if error:
+        return None, make_response(jsonify({"error": error[0]}), error[1])
     return payload, None
 
 
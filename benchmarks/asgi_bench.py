@@ -0,0 +1,106 @@
+"""
+Load test: the WSGI app vs the ASGI entry point on GET /dashboard/summary,
+GET /activity-logs and POST /activity-logs, over real HTTP.
+
+    python app.py                                       # WSGI on :5001
+    uvicorn asgi:application --port 5002 --workers 4
+    python benchmarks/asgi_bench.py [--requests 2000] [--concurrency 64]
+
+Both servers must point at the same MongoDB. Requests are sent from a thread
+pool with keep-alive off, so each one includes connection setup on both
+sides. POSTed events are tagged with a session_id and deleted afterwards.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import db  # noqa: E402
+
+SESSION_ID = "asgi-bench"
+SCENARIOS  = [
+    ("GET",  "/dashboard/summary"),
+    ("GET",  "/activity-logs?ps=20"),
+    ("POST", "/activity-logs"),
+]
+
+
+def call(base, method, path, token=None, body=None):
+    data    = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["x-access-token"] = token
+    req   = urllib.request.Request(base + path, data=data, headers=headers, method=method)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req) as resp:
+            payload, status = resp.read(), resp.status
+    except urllib.error.HTTPError as e:
+        payload, status = e.read(), e.code
+    return status, (time.perf_counter() - start) * 1000, payload
+
+
+def login(base, email, password):
+    status, _, payload = call(base, "POST", "/login", body={"email": email, "password": password})
+    if status != 200:
+        sys.exit(f"login against {base} failed: {payload[:200]!r}")
+    return json.loads(payload)["token"]
+
+
+def run(base, token, method, path, requests, concurrency, user_id):
+    body = {
+        "user_id": user_id, "action_type": "login", "region": "eu-west",
+        "response_time_ms": 120, "status_code": 200, "session_id": SESSION_ID,
+    } if method == "POST" else None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: call(base, method, path, token, body), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(ms for _, ms, _ in results)
+    cuts      = statistics.quantiles(latencies, n=100)
+    return {
+        "rps":    requests / elapsed,
+        "p50":    cuts[49],
+        "p95":    cuts[94],
+        "errors": sum(1 for status, _, _ in results if status >= 400),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WSGI vs ASGI load test")
+    parser.add_argument("--wsgi", default="http://127.0.0.1:5001")
+    parser.add_argument("--asgi", default="http://127.0.0.1:5002")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint per server")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--email", default="admin@cloudmetrics.io")
+    parser.add_argument("--password", default="password123")
+    args = parser.parse_args()
+
+    user    = db["users"].find_one({}, {"_id": 1})
+    user_id = str(user["_id"]) if user else "bench-user"
+    servers = {"wsgi": args.wsgi, "asgi": args.asgi}
+    tokens  = {name: login(base, args.email, args.password) for name, base in servers.items()}
+
+    print(f"{args.requests} requests per endpoint, concurrency {args.concurrency}\n")
+    print(f"{'endpoint':<28}{'server':<7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    try:
+        for method, path in SCENARIOS:
+            label = f"{method} {path.split('?')[0]}"
+            for name, base in servers.items():
+                r = run(base, tokens[name], method, path, args.requests, args.concurrency, user_id)
+                print(f"{label:<28}{name:<7}{r['rps']:>9.0f}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['errors']:>8}")
+    finally:
+        db["activity_logs"].delete_many({"session_id": SESSION_ID})
+
+
+if __name__ == "__main__":
+    main()
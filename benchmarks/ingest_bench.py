@@ -0,0 +1,77 @@
+"""
+Throughput benchmark: POST /activity-logs (one event per request) vs
+POST /activity-logs/bulk (JSON arrays of --batch events).
+
+    python benchmarks/ingest_bench.py [--events 2000] [--batch 500]
+
+Runs through Flask's test client against the MongoDB configured in .env,
+so JWT checks and database round trips are included but HTTP is not.
+Needs the seeded admin account; every event it writes is tagged with a
+session_id and deleted afterwards.
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import app  # noqa: E402
+from config import db  # noqa: E402
+
+SESSION_ID = "ingest-bench"
+REGIONS    = ["eu-west", "us-east", "us-west", "ap-south", "ap-northeast", "sa-east", "af-south"]
+ACTIONS    = ["login", "logout", "upload", "download", "failed_login", "export"]
+
+
+def make_event(user_id):
+    return {
+        "user_id":          user_id,
+        "action_type":      random.choice(ACTIONS),
+        "region":           random.choice(REGIONS),
+        "response_time_ms": random.randint(20, 2000),
+        "status_code":      random.choice([200, 200, 201, 401, 500]),
+        "session_id":       SESSION_ID,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Activity log ingestion throughput")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500, help="events per bulk request")
+    parser.add_argument("--email", default="admin@cloudmetrics.io")
+    parser.add_argument("--password", default="password123")
+    args = parser.parse_args()
+
+    client = app.test_client()
+    login  = client.post("/login", json={"email": args.email, "password": args.password})
+    if login.status_code != 200:
+        sys.exit(f"login failed: {login.get_json()}")
+    headers = {"x-access-token": login.get_json()["token"]}
+
+    user    = db["users"].find_one({}, {"_id": 1})
+    user_id = str(user["_id"]) if user else "bench-user"
+    events  = [make_event(user_id) for _ in range(args.events)]
+
+    try:
+        start = time.perf_counter()
+        for event in events:
+            client.post("/activity-logs", json=event, headers=headers)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, len(events), args.batch):
+            client.post("/activity-logs/bulk", json=events[i: i + args.batch], headers=headers)
+        bulk = time.perf_counter() - start
+    finally:
+        db["activity_logs"].delete_many({"session_id": SESSION_ID})
+
+    print(f"events            : {args.events}")
+    print(f"single insert     : {args.events / single:10.0f} events/sec")
+    print(f"bulk (batch {args.batch:<5}): {args.events / bulk:10.0f} events/sec")
+    print(f"speed-up          : {single / bulk:10.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Load-test suite: builds a scaled synthetic dataset from seed_data's document
+builders, then drives every route with configurable concurrency and reports
+throughput, p50/p95/p99 latency and MongoDB ops per request as JSON.
+
+    python -m benchmarks.loadtest --build --users 10000 --activity 1000000 --anomalies 50000
+    python -m benchmarks.loadtest --concurrency 32 --requests 500 --out results.json
+    python -m benchmarks.loadtest --compare before.json after.json
+
+Runs against MONGO_BENCH_DB (default saas_monitoring_bench) on MONGO_URI, never
+the development database. Requests go through Flask's test client in this
+process by default, or over HTTP to a running server with --url (start it with
+MONGO_DB_NAME set to the same benchmark database).
+"""
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+# config.py picks the database at import, so point it at the benchmark database first
+os.environ["MONGO_DB_NAME"] = os.environ.get("MONGO_BENCH_DB", "saas_monitoring_bench")
+
+from benchmarks.loadtest import dataset, runner  # noqa: E402
+from benchmarks.loadtest.scenarios import ADMIN_EMAIL, ADMIN_PASSWORD, SCENARIOS, load_fixtures  # noqa: E402
+
+COLUMNS = f"{'scenario':<52}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ops/req':>9}  statuses"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+7.1f}%" if old else "     n/a"
+
+    print(f"{before.get('commit')} -> {after.get('commit')}\n")
+    print(f"{'scenario':<52}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'ops/req':>9}")
+    for name, new in after["scenarios"].items():
+        old = before["scenarios"].get(name)
+        if old is None:
+            continue
+        print(f"{name:<52}" + "".join(
+            f"{change(old[key], new[key]):>9}"
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "mongo_ops_per_request")
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description="API load-test suite")
+    parser.add_argument("--build", action="store_true", help="rebuild the benchmark dataset first")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--activity", type=int, default=100_000)
+    parser.add_argument("--anomalies", type=int, default=5_000)
+    parser.add_argument("--batch", type=int, default=5_000, help="documents per insert_many when building")
+    parser.add_argument("--seed", type=int, help="random seed for a reproducible dataset")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="seeding processes for --build")
+    parser.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--only", action="append", default=[], help="run scenarios whose name contains this (repeatable)")
+    parser.add_argument("--warm-cache", action="store_true", help="let cached analytics responses be reused")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if args.build:
+        print(f"building dataset in {os.environ['MONGO_DB_NAME']}...")
+        dataset.build(args.users, args.activity, args.anomalies, args.batch, args.seed, args.workers)
+
+    if args.url:
+        transport = runner.HttpTransport(args.url)
+    else:
+        from app import app     # imported after --build so indexes are created on the loaded data
+        transport = runner.TestClientTransport(app)
+
+    fixtures  = load_fixtures()
+    token     = runner.login(transport, ADMIN_EMAIL, ADMIN_PASSWORD)
+    scenarios = [s for s in SCENARIOS if not args.only or any(part in s.name for part in args.only)]
+    results   = {
+        "commit":      git_commit(),
+        "started_at":  datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target":      args.url or "in-process",
+        "database":    os.environ["MONGO_DB_NAME"],
+        "dataset":     dataset.describe(),
+        "concurrency": args.concurrency,
+        "requests":    args.requests,
+        "warm_cache":  args.warm_cache,
+        "scenarios":   {},
+    }
+
+    print(COLUMNS)
+    for scenario in scenarios:
+        r = runner.run_scenario(transport, scenario, fixtures, token,
+                                args.requests, args.concurrency, args.warm_cache)
+        results["scenarios"][scenario.name] = r
+        statuses = " ".join(f"{code}x{count}" for code, count in r["statuses"].items())
+        print(f"{scenario.name:<52}{r['throughput_rps']:>9.0f}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}"
+              f"{r['p99_ms']:>9.1f}{r['mongo_ops_per_request']:>9.1f}  {statuses}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
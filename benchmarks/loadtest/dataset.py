@@ -0,0 +1,33 @@
+"""Scaled synthetic datasets built from seed_data's document builders."""
+import os
+import time
+
+import seed_data
+from config import db
+from indexes import ensure_indexes
+
+
+def build(users, activity, anomalies, batch=5000, seed=None, workers=1, log=print):
+    """
+    Replace the benchmark database with a dataset of the given size, written by
+    seed_data's parallel seeder, then create the indexes. Documents are loaded
+    before indexing, which is much faster at scale. Returns the counts and elapsed seconds.
+    """
+    if db.name == seed_data.DATABASE_NAME:
+        raise SystemExit(f"refusing to rebuild {db.name} — point MONGO_BENCH_DB at a scratch database")
+
+    start = time.perf_counter()
+    db.client.drop_database(db.name)
+    counts = seed_data.seed_database(
+        os.environ.get("MONGO_URI", seed_data.MONGO_URI), db.name, users, activity, anomalies,
+        workers=workers, batch=batch, seed=seed, log=log,
+    )
+    ensure_indexes()
+    elapsed = time.perf_counter() - start
+    log(f"  indexed, {elapsed:.1f}s total")
+    return {**counts, "seconds": round(elapsed, 1)}
+
+
+def describe():
+    """Document counts of the current benchmark dataset, recorded with every run."""
+    return {name: db[name].count_documents({}) for name in seed_data.SEEDED_COLLECTIONS}
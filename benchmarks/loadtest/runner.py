@@ -0,0 +1,106 @@
+"""Drives a scenario with N concurrent workers and measures latency, throughput and MongoDB ops."""
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from config import db
+
+OPCOUNTERS = ("insert", "query", "update", "delete", "getmore", "command")
+
+
+class TestClientTransport:
+    """Requests through Flask's test client in this process, one client per worker thread."""
+
+    def __init__(self, app):
+        self.app    = app
+        self._local = threading.local()
+
+    def send(self, method, path, body=None, token=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers  = {"x-access-token": token} if token else {}
+        response = client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()     # get_data drains streamed exports
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server (keep-alive off, so connection setup is included)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["x-access-token"] = token
+        data = json.dumps(body).encode() if body is not None else None
+        req  = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def login(transport, email, password):
+    status, payload = transport.send("POST", "/login", {"email": email, "password": password})
+    if status != 200:
+        raise SystemExit(f"benchmark login failed ({status}): {payload[:200]!r}")
+    return json.loads(payload)["token"]
+
+
+def mongo_ops():
+    """Operations the server has executed so far, summed over serverStatus opcounters."""
+    counters = db.command("serverStatus")["opcounters"]
+    return sum(counters[name] for name in OPCOUNTERS)
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _bust_cache(path, n):
+    # a distinct query string gives every request its own response-cache key; views ignore the arg
+    return f"{path}{'&' if '?' in path else '?'}_bench={n}"
+
+
+def run_scenario(transport, scenario, fixtures, token, requests, concurrency, warm_cache=False):
+    items = scenario.requests(fixtures, requests)
+    if scenario.method == "GET" and not warm_cache:
+        items = [(_bust_cache(path, n), body, tok) for n, (path, body, tok) in enumerate(items)]
+
+    def timed(item):
+        path, body, tok = item
+        start     = time.perf_counter()
+        status, _ = transport.send(scenario.method, path, body, tok or token)
+        return status, (time.perf_counter() - start) * 1000
+
+    ops_before = mongo_ops()
+    start      = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, items))
+    elapsed = time.perf_counter() - start
+    ops     = mongo_ops() - ops_before - 1          # the second serverStatus counts itself
+
+    latencies = sorted(ms for _, ms in results)
+    statuses  = Counter(status for status, _ in results)
+    return {
+        "requests":              len(results),
+        "concurrency":           concurrency,
+        "seconds":               round(elapsed, 3),
+        "throughput_rps":        round(len(results) / elapsed, 1),
+        "mean_ms":               round(sum(latencies) / len(latencies), 2),
+        "p50_ms":                round(percentile(latencies, 50), 2),
+        "p95_ms":                round(percentile(latencies, 95), 2),
+        "p99_ms":                round(percentile(latencies, 99), 2),
+        "max_ms":                round(latencies[-1], 2),
+        "statuses":              {str(code): count for code, count in sorted(statuses.items())},
+        "mongo_ops_per_request": round(ops / len(results), 2),
+    }
@@ -0,0 +1,208 @@
+"""
+One scenario per route. Paths are templates filled from fixtures sampled out
+of the benchmark dataset, so scenario names stay the same across runs and
+results can be diffed. Routes that consume their target (DELETE, logout) get
+a fresh document or token per request, created with seed_data's builders
+before the timed run starts.
+"""
+import datetime
+import itertools
+import random
+import uuid
+
+import jwt
+from bson import ObjectId
+
+import seed_data
+from auth import SECRET_KEY
+from config import db
+
+ADMIN_EMAIL    = "admin@cloudmetrics.io"
+ADMIN_PASSWORD = "password123"
+
+# indexes for build_user() well clear of anything the dataset builder used, so emails stay unique
+_user_numbers = itertools.count(10 ** 9 + random.randrange(10 ** 8))
+
+
+class Scenario:
+    def __init__(self, method, path, body=None, prepare=None):
+        self.method  = method
+        self.path    = path
+        self.body    = body        # dict, or callable(fixtures) for a fresh body per request
+        self.prepare = prepare     # callable(fixtures, n) -> [(path, body, token)] for consuming routes
+
+    @property
+    def name(self):
+        return f"{self.method} {self.path}"
+
+    def requests(self, fixtures, n):
+        """n (path, body, token) tuples; token None means the admin token."""
+        if self.prepare:
+            return self.prepare(fixtures, n)
+        path = self.path.format(**fixtures)
+        return [(path, self.body(fixtures) if callable(self.body) else self.body, None) for _ in range(n)]
+
+
+def load_fixtures():
+    """Ids and values from the dataset that the path templates and bodies refer to."""
+    user  = db["users"].find_one({"api_keys.0": {"$exists": True}, "alerts.0": {"$exists": True}})
+    if user is None:
+        raise SystemExit("benchmark dataset is empty — run with --build first")
+    usage    = db["usage_logs"].find_one({"meta.user_id": user["_id"]})
+    activity = db["activity_logs"].find_one()
+    flag     = db["anomaly_flags"].find_one()
+    admins   = list(db["login"].find({"role": "admin"}))
+    return {
+        "user_id":      str(user["_id"]),
+        "user_email":   user["profile"]["email"],
+        "tier":         user["subscription"]["tier"],
+        "prefix":       user["search"]["last_name"][:3],
+        "key_id":       str(user["api_keys"][0]["_id"]),
+        "alert_id":     str(user["alerts"][0]["_id"]),
+        "log_id":       str(usage["_id"]),
+        "activity_id":  str(activity["_id"]),
+        "flag_id":      str(flag["_id"]),
+        "admin_ids":    [a["user_id"] for a in admins],
+        "admin_emails": [a["email"] for a in admins],
+    }
+
+
+# ---------------------------------------------------------------------------
+# BODIES
+# ---------------------------------------------------------------------------
+
+def new_user(fx):
+    return {"email": f"bench.{uuid.uuid4().hex[:12]}@example.com", "password": "password123",
+            "first_name": "Bench", "last_name": "User", "subscription_tier": "pro"}
+
+
+def activity_event(fx):
+    return {"user_id": fx["user_id"], "user_email": fx["user_email"], "action_type": random.choice(seed_data.ACTION_TYPES),
+            "region": random.choice(seed_data.REGIONS), "response_time_ms": random.randint(20, 2000)}
+
+
+# ---------------------------------------------------------------------------
+# FRESH TARGETS — one per request for routes that delete or revoke what they hit
+# ---------------------------------------------------------------------------
+
+def _collect(generate, n):
+    docs = []
+    while len(docs) < n:
+        docs.extend(generate())
+    return docs[:n]
+
+
+def fresh_users(fx, n):
+    docs = [seed_data.build_user(next(_user_numbers)) for _ in range(n)]
+    db["users"].insert_many(docs)
+    return [(f"/users/{d['_id']}", None, None) for d in docs]
+
+
+def fresh_usage_logs(fx, n):
+    user = {"_id": ObjectId(fx["user_id"]), "subscription": {"tier": fx["tier"]}}
+    docs = _collect(lambda: seed_data.build_usage_logs(user), n)
+    db["usage_logs"].insert_many(docs)
+    return [(f"/users/{fx['user_id']}/usage/{d['_id']}", None, None) for d in docs]
+
+
+def _pushed(field, generate, route):
+    def prepare(fx, n):
+        docs = _collect(generate(fx), n)
+        db["users"].update_one({"_id": ObjectId(fx["user_id"])}, {"$push": {field: {"$each": docs}}})
+        return [(f"/users/{fx['user_id']}/{route}/{d['_id']}", None, None) for d in docs]
+    return prepare
+
+
+fresh_api_keys = _pushed("api_keys", lambda fx: lambda: seed_data.generate_api_keys(fx["tier"]), "api-keys")
+fresh_alerts   = _pushed("alerts", lambda fx: seed_data.generate_alerts, "alerts")
+
+
+def fresh_activity_logs(fx, n):
+    docs = [seed_data.build_activity_log([ObjectId(fx["user_id"])], [fx["user_email"]]) for _ in range(n)]
+    db["activity_logs"].insert_many(docs)
+    return [(f"/activity-logs/{d['_id']}", None, None) for d in docs]
+
+
+def fresh_anomaly_flags(fx, n):
+    docs = [seed_data.build_anomaly_flag([ObjectId(fx["user_id"])], [fx["user_email"]],
+                                         fx["admin_ids"], fx["admin_emails"]) for _ in range(n)]
+    db["anomaly_flags"].insert_many(docs)
+    return [(f"/anomaly-flags/{d['_id']}", None, None) for d in docs]
+
+
+def fresh_resolutions(fx, n):
+    docs = _collect(lambda: seed_data.generate_resolution_logs(fx["admin_ids"], fx["admin_emails"]), n)
+    db["anomaly_flags"].update_one({"_id": ObjectId(fx["flag_id"])},
+                                   {"$push": {"resolution_logs": {"$each": docs}}})
+    return [(f"/anomaly-flags/{fx['flag_id']}/resolve/{d['_id']}", None, None) for d in docs]
+
+
+def fresh_tokens(fx, n):
+    # minted like POST /login does, so logout can be measured without n bcrypt checks first
+    expires = datetime.datetime.now(datetime.UTC) + datetime.timedelta(hours=1)
+    return [("/logout", None, jwt.encode(
+        {"user": ADMIN_EMAIL, "role": "admin", "user_id": fx["admin_ids"][0], "jti": uuid.uuid4().hex, "exp": expires},
+        SECRET_KEY, algorithm="HS256",
+    )) for _ in range(n)]
+
+
+# ---------------------------------------------------------------------------
+# CATALOGUE — reads, then writes, then deletes, logout last
+# ---------------------------------------------------------------------------
+
+SCENARIOS = [
+    Scenario("GET",  "/health"),
+    Scenario("GET",  "/health/pool"),
+    Scenario("GET",  "/health/ingest"),
+    Scenario("POST", "/login", {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}),
+    Scenario("GET",  "/me"),
+
+    Scenario("GET",  "/users?ps=20"),
+    Scenario("GET",  "/users/search?last_name={prefix}"),
+    Scenario("GET",  "/users/{user_id}"),
+    Scenario("GET",  "/users/{user_id}/usage"),
+    Scenario("GET",  "/users/{user_id}/api-keys"),
+    Scenario("GET",  "/users/{user_id}/alerts"),
+    Scenario("GET",  "/activity-logs?ps=20"),
+    Scenario("GET",  "/activity-logs/export?window=1h"),
+    Scenario("GET",  "/activity-logs/{activity_id}"),
+    Scenario("GET",  "/anomaly-flags?ps=20"),
+    Scenario("GET",  "/anomaly-flags/export?severity=critical&resolved=false"),
+    Scenario("GET",  "/anomaly-flags/{flag_id}"),
+
+    Scenario("GET",  "/dashboard/summary"),
+    Scenario("GET",  "/analytics/avg-api-calls"),
+    Scenario("GET",  "/analytics/avg-api-calls-by-tier"),
+    Scenario("GET",  "/analytics/high-usage"),
+    Scenario("GET",  "/analytics/failed-logins"),
+    Scenario("GET",  "/analytics/anomaly-summary"),
+    Scenario("GET",  "/analytics/search-logs?action_types=login,logout&ps=20"),
+    Scenario("GET",  "/analytics/nearby-activity?lat=51.5074&lng=-0.1278"),
+    Scenario("GET",  "/analytics/user-risk-report"),
+    Scenario("GET",  "/analytics/user-risk-report?severity=high,critical&tier=pro&limit=50"),
+    Scenario("GET",  "/analytics/ops-breakdown"),
+
+    Scenario("POST", "/users", new_user),
+    Scenario("PUT",  "/users/{user_id}", {"first_name": "Bench"}),
+    Scenario("POST", "/users/{user_id}/usage", {"api_calls": 1200, "storage_mb": 40.5}),
+    Scenario("PUT",  "/users/{user_id}/usage/{log_id}", {"api_calls": 1500}),
+    Scenario("POST", "/users/{user_id}/api-keys", {"permissions": ["read"]}),
+    Scenario("PUT",  "/users/{user_id}/api-keys/{key_id}/revoke"),
+    Scenario("POST", "/users/{user_id}/alerts", {"message": "Benchmark alert", "severity": "low"}),
+    Scenario("PUT",  "/users/{user_id}/alerts/{alert_id}/acknowledge"),
+    Scenario("POST", "/activity-logs", activity_event),
+    Scenario("POST", "/activity-logs/bulk", lambda fx: [activity_event(fx) for _ in range(50)]),
+    Scenario("PUT",  "/activity-logs/{activity_id}", {"status_code": 200}),
+    Scenario("POST", "/anomaly-flags", lambda fx: {"user_id": fx["user_id"], "reason": "Benchmark flag"}),
+    Scenario("PUT",  "/anomaly-flags/{flag_id}", {"severity": "high"}),
+    Scenario("POST", "/anomaly-flags/{flag_id}/resolve", {"note": "Benchmark resolution"}),
+
+    Scenario("DELETE", "/users/{id}/usage/{log_id}",          prepare=fresh_usage_logs),
+    Scenario("DELETE", "/users/{id}/api-keys/{key_id}",       prepare=fresh_api_keys),
+    Scenario("DELETE", "/users/{id}/alerts/{alert_id}",       prepare=fresh_alerts),
+    Scenario("DELETE", "/users/{id}",                         prepare=fresh_users),
+    Scenario("DELETE", "/activity-logs/{id}",                 prepare=fresh_activity_logs),
+    Scenario("DELETE", "/anomaly-flags/{id}/resolve/{res_id}", prepare=fresh_resolutions),
+    Scenario("DELETE", "/anomaly-flags/{id}",                 prepare=fresh_anomaly_flags),
+    Scenario("POST",   "/logout",                             prepare=fresh_tokens),
+]
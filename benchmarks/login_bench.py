@@ -0,0 +1,103 @@
+"""
+Login benchmark: POST /login throughput and latency under a login storm,
+and how much the storm slows an unrelated route.
+
+    BCRYPT_ROUNDS=12 BCRYPT_WORKERS=4 python benchmarks/login_bench.py [--requests 200] [--concurrency 32]
+
+Runs through Flask's test client against the MongoDB configured in .env, one
+client per thread, so bcrypt runs on this process's bounded pool exactly as
+it does in the server. A throwaway analyst account hashed at BCRYPT_ROUNDS is
+created for the run and removed afterwards. Three phases:
+
+  valid        correct password; 503s mean the bcrypt queue was full
+  locked out   wrong password for an email already over LOGIN_MAX_FAILURES (429, no hashing)
+  /health      GET /health latency alone, then while valid logins are running
+"""
+import argparse
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import app  # noqa: E402
+from config import db  # noqa: E402
+from passwords import BCRYPT_MAX_PENDING, BCRYPT_ROUNDS, BCRYPT_WORKERS, LOGIN_MAX_FAILURES, hash_password  # noqa: E402
+
+BENCH_EMAIL  = "login-bench@cloudmetrics.io"
+LOCKED_EMAIL = "login-bench-locked@cloudmetrics.io"
+PASSWORD     = "bench-password"
+
+_local = threading.local()
+
+
+def call(method, path, body=None):
+    client = getattr(_local, "client", None)
+    if client is None:
+        client = _local.client = app.test_client()
+    start    = time.perf_counter()
+    response = client.open(path, method=method, json=body)
+    return response.status_code, (time.perf_counter() - start) * 1000
+
+
+def run(method, path, body, requests, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: call(method, path, body), range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(ms for _, ms in results)
+    cuts      = statistics.quantiles(latencies, n=100)
+    return {
+        "rps":      requests / elapsed,
+        "p50":      cuts[49],
+        "p95":      cuts[94],
+        "p99":      cuts[98],
+        "statuses": " ".join(f"{code}x{n}" for code, n in sorted(Counter(s for s, _ in results).items())),
+    }
+
+
+def report(label, r):
+    print(f"{label:<30}{r['rps']:>9.0f}{r['p50']:>9.1f}{r['p95']:>9.1f}{r['p99']:>9.1f}  {r['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POST /login throughput and latency")
+    parser.add_argument("--requests", type=int, default=200, help="requests per phase")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    login_col = db["login"]
+    login_col.delete_many({"email": {"$in": [BENCH_EMAIL, LOCKED_EMAIL]}})
+    login_col.insert_many([
+        {"email": BENCH_EMAIL, "password": hash_password(PASSWORD), "role": "analyst"},
+        {"email": LOCKED_EMAIL, "password": hash_password(PASSWORD), "role": "analyst"},
+    ])
+
+    print(f"bcrypt rounds {BCRYPT_ROUNDS}, workers {BCRYPT_WORKERS}, max pending {BCRYPT_MAX_PENDING}; "
+          f"{args.requests} requests per phase, concurrency {args.concurrency}\n")
+    print(f"{'phase':<30}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    try:
+        valid = {"email": BENCH_EMAIL, "password": PASSWORD}
+        report("valid", run("POST", "/login", valid, args.requests, args.concurrency))
+
+        wrong = {"email": LOCKED_EMAIL, "password": "wrong"}
+        for _ in range(LOGIN_MAX_FAILURES):
+            call("POST", "/login", wrong)
+        report("locked out", run("POST", "/login", wrong, args.requests, args.concurrency))
+
+        report("/health alone", run("GET", "/health", None, args.requests, args.concurrency))
+        storm = threading.Thread(target=run, args=("POST", "/login", valid, args.requests * 2, args.concurrency))
+        storm.start()
+        report("/health during login storm", run("GET", "/health", None, args.requests, args.concurrency))
+        storm.join()
+    finally:
+        login_col.delete_many({"email": {"$in": [BENCH_EMAIL, LOCKED_EMAIL]}})
+
+
+if __name__ == "__main__":
+    main()
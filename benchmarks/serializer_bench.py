@@ -0,0 +1,95 @@
+"""
+Micro-benchmark: recursive serialize_doc + jsonify vs MongoJSONProvider.
+
+    python benchmarks/serializer_bench.py [--logs 500] [--repeat 200]
+
+Builds a /users/<id>-shaped document with N embedded usage logs and times
+turning it into a JSON response body both ways. No database needed.
+"""
+import argparse
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from json_provider import MongoJSONProvider  # noqa: E402
+
+
+def serialize_doc(doc):
+    """The per-route helper this benchmark compares against."""
+    if isinstance(doc, list):
+        return [serialize_doc(d) for d in doc]
+    if isinstance(doc, dict):
+        return {k: serialize_doc(v) for k, v in doc.items()}
+    if isinstance(doc, ObjectId):
+        return str(doc)
+    if isinstance(doc, datetime):
+        return doc.isoformat()
+    return doc
+
+
+def build_user(num_logs):
+    now = datetime.utcnow()
+    return {
+        "_id": ObjectId(),
+        "profile": {"first_name": "Alice", "last_name": "Smith", "email": "alice@cloudmetrics.io",
+                    "created_at": now - timedelta(days=300), "last_login": now},
+        "subscription": {"tier": "pro", "status": "active",
+                         "features_enabled": {"sso": False, "rate_limits": {"requests_per_minute": 500}}},
+        "usage_logs": [
+            {
+                "_id":       ObjectId(),
+                "timestamp": now - timedelta(minutes=i),
+                "metrics": {
+                    "api_calls":  random.randint(100, 100_000),
+                    "storage_mb": round(random.uniform(10, 10_000), 2),
+                    "breakdown":  {"read_ops": 600, "write_ops": 300, "delete_ops": 100, "cache_hit_pct": 87.3},
+                },
+                "request":  {"endpoint": "/api/upload", "region": "eu-west", "method": "POST",
+                             "response_time_ms": 200, "status_code": 200},
+                "location": {"type": "Point", "coordinates": [-0.1278, 51.5074]},
+            }
+            for i in range(num_logs)
+        ],
+        "api_keys": [{"_id": ObjectId(), "key_prefix": "sk_live_abc123de", "created_at": now, "revoked": False}],
+        "alerts":   [{"_id": ObjectId(), "message": "API call limit 90% reached", "triggered_at": now}],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logs", type=int, default=500, help="embedded usage logs per user document")
+    parser.add_argument("--repeat", type=int, default=200, help="serializations per timing run")
+    args = parser.parse_args()
+
+    doc = build_user(args.logs)
+
+    old_app = Flask("old")
+    old_app.json = DefaultJSONProvider(old_app)
+    new_app = Flask("new")
+    new_app.json = MongoJSONProvider(new_app)
+
+    with old_app.app_context():
+        old = min(timeit.repeat(lambda: old_app.json.response(serialize_doc(doc)).get_data(),
+                                number=args.repeat, repeat=5))
+    with new_app.app_context():
+        new = min(timeit.repeat(lambda: new_app.json.response(doc).get_data(),
+                                number=args.repeat, repeat=5))
+
+    per_old = old / args.repeat * 1000
+    per_new = new / args.repeat * 1000
+    print(f"usage_logs per doc : {args.logs}")
+    print(f"serialize_doc      : {per_old:8.3f} ms/doc")
+    print(f"MongoJSONProvider  : {per_new:8.3f} ms/doc")
+    print(f"speed-up           : {per_old / per_new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,128 @@
-from pymongo import MongoClient
+import os
+import threading
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+from instrumentation import command_metrics
+from slow_queries import slow_query_monitor
+
+load_dotenv()
+
+
+# ---------------------------------------------------------------------------
+# POOL METRICS — CMAP events from every connection pool the client opens
+# ---------------------------------------------------------------------------
+
+class PoolMetrics(ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked_out       = 0
+        self.checkouts         = 0
+        self.checkout_failures = 0
+        self.wait_seconds      = 0.0
+        self.max_wait_seconds  = 0.0
+        self.connections       = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checked_out":       self.checked_out,
+                "open_connections":  self.connections,
+                "checkouts":         self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_wait_ms":       round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms":       round(self.max_wait_seconds * 1000, 3),
+            }
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out      += 1
+            self.checkouts        += 1
+            self.wait_seconds     += event.duration
+            self.max_wait_seconds = max(self.max_wait_seconds, event.duration)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections -= 1
+
+    # remaining CMAP events carry nothing we report on
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+
+# ---------------------------------------------------------------------------
+# CONNECTION FACTORY — pool, timeouts and compression come from the environment
+# ---------------------------------------------------------------------------
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def client_options(listeners=()):
+    options = {
+        "maxPoolSize":              _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize":              _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "waitQueueTimeoutMS":       _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+        "connectTimeoutMS":         _env_int("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        "socketTimeoutMS":          _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "retryWrites":              True,
+        "event_listeners":          list(listeners),
+    }
+    # e.g. "zstd,snappy" — needs the zstandard / python-snappy packages installed
+    compressors = os.environ.get("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+
+def create_client(uri=None, listeners=()):
+    return MongoClient(uri or os.environ.get("MONGO_URI", "mongodb://localhost:27017"), **client_options(listeners))
+
+
+def create_async_client(uri=None, listeners=()):
+    """Same settings for the asyncio driver used by asgi.py. Create it inside the event loop that uses it."""
+    return AsyncMongoClient(uri or os.environ.get("MONGO_URI", "mongodb://localhost:27017"), **client_options(listeners))
+
+
+# read preference names accepted by MONGO_ANALYTICS_READ_PREFERENCE
+READ_PREFERENCES = {
+    "primary":            ReadPreference.PRIMARY,
+    "primaryPreferred":   ReadPreference.PRIMARY_PREFERRED,
+    "secondary":          ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest":            ReadPreference.NEAREST,
+}
+
+pool_metrics = PoolMetrics()
 
 # MongoDB connection
-client = MongoClient("mongodb://localhost:27017")
+client = create_client(listeners=[pool_metrics, command_metrics, slow_query_monitor])
+slow_query_monitor.use_client(client)
+
+# Database used for the project — writes and user_bp reads go to the primary
+MONGO_DB_NAME = os.environ.get("MONGO_DB_NAME", "saas_monitoring")
+db = client[MONGO_DB_NAME]
 
-# Database used for the project
-db = client["saas_monitoring"]
\ No newline at end of file
+# analytics_bp aggregations can run on secondaries (falls back to primary on a standalone server)
+ANALYTICS_READ_PREFERENCE = READ_PREFERENCES[os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred")]
+analytics_db = db.with_options(read_preference=ANALYTICS_READ_PREFERENCE)
@@ -0,0 +1,288 @@
+import os
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+
+import rollups
+from config import db
+from timestamps import to_datetime
+
+# ---------------------------------------------------------------------------
+# ANOMALY DETECTION ENGINE — incremental rules over new activity / usage events
+#
+# A tailing poller reads activity_logs and usage_logs in timestamp order,
+# on their timestamp indexes, from a checkpoint kept in detector_state, so
+# detection cost follows the event rate rather than the size of the history.
+# _id order is not insert order (ObjectIds come from many client processes,
+# and write-behind flushes late), so every poll re-reads DETECT_OVERLAP_SECONDS
+# before the checkpoint and skips the _ids it handled within that overlap;
+# on restart everything up to the saved checkpoint counts as handled. (Change
+# streams are not used: they need a replica set and don't support
+# time-series collections.) Each user has small sliding windows in memory,
+# dropped once the user has been idle for DETECT_IDLE_HOURS; when a rule
+# trips, an anomaly_flags document is written in the same shape as
+# POST /anomaly-flags. On start the windows are warmed from the events just
+# before the checkpoint without raising flags.
+#
+#   flask --app app detect-anomalies [--once]
+# ---------------------------------------------------------------------------
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+FAILED_LOGIN_THRESHOLD = _env_int("DETECT_FAILED_LOGIN_THRESHOLD", 5)
+FAILED_LOGIN_WINDOW    = timedelta(minutes=_env_int("DETECT_FAILED_LOGIN_WINDOW_MINUTES", 15))
+REGION_WINDOW          = timedelta(hours=1)
+SPIKE_FACTOR           = float(os.environ.get("DETECT_SPIKE_FACTOR", 3.0))
+SPIKE_MIN_CALLS        = _env_int("DETECT_SPIKE_MIN_CALLS", 10_000)
+SPIKE_HISTORY          = 20           # usage samples forming a user's baseline
+COOLDOWN               = timedelta(hours=1)
+BATCH_SIZE             = 1000
+# late writers: at least the write-behind flush lag plus clock skew between app hosts
+OVERLAP                = timedelta(seconds=_env_int("DETECT_OVERLAP_SECONDS", 120))
+IDLE                   = timedelta(hours=_env_int("DETECT_IDLE_HOURS", 24))
+
+# reasons match the ANOMALY_REASONS used when seeding
+REASON_FAILED_LOGINS = "Excessive failed logins"
+REASON_API_SPIKE     = "Unusual API call volume spike"
+REASON_MULTI_REGION  = "Access from multiple countries within 1 hour"
+
+
+def severity_for(score):
+    if score >= 0.9:
+        return "critical"
+    if score >= 0.7:
+        return "high"
+    if score >= 0.5:
+        return "medium"
+    return "low"
+
+
+class UserWindow:
+    def __init__(self):
+        self.failed_logins = deque()                     # timestamps
+        self.regions       = deque()                     # (timestamp, region, ip)
+        self.api_calls     = deque(maxlen=SPIKE_HISTORY)
+        self.email         = ""
+        self.last_event    = None                        # newest event time, for pruning idle users
+
+
+class DetectionEngine:
+    def __init__(self, database=db):
+        self.db           = database
+        self.flags_col    = database["anomaly_flags"]
+        self.state_col    = database["detector_state"]
+        self.windows      = defaultdict(UserWindow)
+        self.last_flagged = {}                           # (user_id, reason) -> event time
+        self.seen         = defaultdict(dict)            # source -> {_id: event time} for events within OVERLAP of the checkpoint
+        self.sources = [
+            ("activity_logs", database["activity_logs"], self.on_activity),
+            ("usage_logs",    database["usage_logs"],    self.on_usage),
+        ]
+
+    # -- rules ---------------------------------------------------------------
+
+    def on_activity(self, doc, emit=True):
+        ts = to_datetime(doc.get("timestamp"))
+        if not isinstance(ts, datetime):
+            return []
+        user_id = doc.get("user_id")
+        window  = self._window(user_id, ts)
+        window.email = doc.get("user_email") or window.email
+        flags = []
+
+        if doc.get("action_type") == "failed_login":
+            window.failed_logins.append(ts)
+            while window.failed_logins and window.failed_logins[0] < ts - FAILED_LOGIN_WINDOW:
+                window.failed_logins.popleft()
+            count = len(window.failed_logins)
+            if count >= FAILED_LOGIN_THRESHOLD:
+                flags.append(self._flag(user_id, REASON_FAILED_LOGINS, "security", ts,
+                                        min(1.0, 0.5 + 0.5 * (count - FAILED_LOGIN_THRESHOLD) / FAILED_LOGIN_THRESHOLD),
+                                        {"failed_login_count": count,
+                                         "time_window_hours": FAILED_LOGIN_WINDOW.total_seconds() / 3600},
+                                        emit))
+
+        network = doc.get("network", {})
+        if network.get("region"):
+            window.regions.append((ts, network["region"], network.get("ip_address")))
+            while window.regions and window.regions[0][0] < ts - REGION_WINDOW:
+                window.regions.popleft()
+            regions = sorted({r for _, r, _ in window.regions})
+            if len(regions) >= 2:
+                flags.append(self._flag(user_id, REASON_MULTI_REGION, "security", ts,
+                                        min(1.0, 0.4 + 0.2 * len(regions)),
+                                        {"countries_accessed": regions,
+                                         "suspicious_ips":     sorted({ip for _, _, ip in window.regions if ip}),
+                                         "time_window_hours":  1},
+                                        emit))
+
+        return [f for f in flags if f]
+
+    def on_usage(self, doc, emit=True):
+        ts        = to_datetime(doc.get("timestamp"))
+        user_id   = doc.get("meta", {}).get("user_id")
+        api_calls = doc.get("metrics", {}).get("api_calls")
+        if not isinstance(ts, datetime) or not isinstance(api_calls, (int, float)):
+            return []
+
+        window   = self._window(user_id, ts)
+        baseline = sum(window.api_calls) / len(window.api_calls) if window.api_calls else None
+        window.api_calls.append(api_calls)
+
+        if baseline and api_calls >= SPIKE_MIN_CALLS and api_calls > SPIKE_FACTOR * baseline:
+            ratio = api_calls / baseline
+            flag  = self._flag(user_id, REASON_API_SPIKE, "performance", ts,
+                               min(1.0, 0.4 + 0.1 * ratio),
+                               {"flagged_endpoints": [doc.get("request", {}).get("endpoint")],
+                                "api_calls":         api_calls,
+                                "baseline_api_calls": round(baseline, 2)},
+                               emit)
+            return [flag] if flag else []
+        return []
+
+    def _window(self, user_id, ts):
+        window = self.windows[user_id]
+        window.last_event = max(window.last_event or ts, ts)
+        return window
+
+    def prune(self, now=None):
+        """Forget users idle for IDLE and cooldowns that have expired, so memory follows active users."""
+        now = now or datetime.utcnow()
+        self.last_flagged = {k: ts for k, ts in self.last_flagged.items() if now - ts < COOLDOWN}
+        flagged = {user_id for user_id, _ in self.last_flagged}
+        for user_id in [u for u, w in self.windows.items()
+                        if u not in flagged and (w.last_event is None or now - w.last_event >= IDLE)]:
+            del self.windows[user_id]
+
+    def _flag(self, user_id, reason, category, ts, score, evidence, emit):
+        key  = (user_id, reason)
+        last = self.last_flagged.get(key)
+        if last is not None and ts - last < COOLDOWN:
+            return None
+        self.last_flagged[key] = ts
+        if not emit:
+            return None
+
+        score = round(score, 4)
+        flag  = {
+            "user_id":       user_id,
+            "user_email":    self.windows[user_id].email,
+            "reason":        reason,
+            "anomaly_score": score,
+            "severity":      severity_for(score),
+            "category":      category,
+            "detected_at":   ts,
+            "resolved":      False,
+            "resolution_logs": [],
+            "evidence": {
+                "failed_login_count": 0,
+                "suspicious_ips":     [],
+                "time_window_hours":  1,
+                "flagged_endpoints":  [],
+                "countries_accessed": [],
+                **evidence,
+            },
+            "auto_actions_taken": {
+                "account_locked":    False,
+                "notification_sent": True,
+                "admin_alerted":     True,
+            },
+            "source": "detector",
+        }
+        self.flags_col.insert_one(flag)
+        rollups.record_anomaly(after=flag)
+        return flag
+
+    # -- event source --------------------------------------------------------
+
+    def _checkpoint(self, name):
+        state = self.state_col.find_one({"_id": name})
+        return state["last_timestamp"] if state else None
+
+    def _mark_seen(self, name, doc, default_ts):
+        """False if doc was already handled in the overlap window; otherwise remembers it."""
+        seen = self.seen[name]
+        if doc["_id"] in seen:
+            return False
+        ts = to_datetime(doc.get("timestamp"))
+        seen[doc["_id"]] = ts if isinstance(ts, datetime) else default_ts
+        return True
+
+    def _forget_seen(self, name, checkpoint):
+        """Drop _ids older than the next poll's overlap — it can't read them again."""
+        seen    = self.seen[name]
+        horizon = checkpoint - OVERLAP
+        for _id in [i for i, ts in seen.items() if ts < horizon]:
+            del seen[_id]
+
+    def _tail(self, col, since, until=None):
+        """Every event with since <= timestamp (<= until), in (timestamp, _id) order, BATCH_SIZE at a time."""
+        bounds = {"$gte": since, **({"$lte": until} if until else {})}
+        after  = None
+        while True:
+            query = {"timestamp": bounds}
+            if after is not None:
+                query["$or"] = [
+                    {"timestamp": {"$gt": after["timestamp"]}},
+                    {"timestamp": after["timestamp"], "_id": {"$gt": after["_id"]}},
+                ]
+            batch = list(col.find(query).sort([("timestamp", 1), ("_id", 1)]).limit(BATCH_SIZE))
+            yield from batch
+            if len(batch) < BATCH_SIZE:
+                return
+            after = batch[-1]
+
+    def warm(self):
+        """
+        Replay the hour before each checkpoint into the windows without raising flags, marking
+        the overlap's events as handled so the first poll doesn't count them a second time.
+        """
+        for name, col, handler in self.sources:
+            checkpoint = self._checkpoint(name)
+            if checkpoint is None:
+                continue
+            overlap = checkpoint - OVERLAP
+            for doc in self._tail(col, overlap - REGION_WINDOW, until=checkpoint):
+                if to_datetime(doc.get("timestamp")) >= overlap:
+                    self._mark_seen(name, doc, checkpoint)
+                handler(doc, emit=False)
+        # flags raised shortly before a restart keep their cooldown
+        since = datetime.utcnow() - COOLDOWN
+        for flag in self.flags_col.find({"source": "detector", "detected_at": {"$gte": since}},
+                                        {"user_id": 1, "reason": 1, "detected_at": 1}):
+            key = (flag.get("user_id"), flag.get("reason"))
+            self.last_flagged[key] = max(self.last_flagged.get(key, flag["detected_at"]), flag["detected_at"])
+
+    def poll_once(self):
+        """Process every event not yet handled since the checkpoint (minus OVERLAP). Returns the flags raised."""
+        raised = []
+        for name, col, handler in self.sources:
+            checkpoint = self._checkpoint(name)
+            if checkpoint is None:
+                # first run — start from the last hour rather than all of history
+                checkpoint = datetime.utcnow() - REGION_WINDOW
+            newest = checkpoint
+            for doc in self._tail(col, checkpoint - OVERLAP):
+                if not self._mark_seen(name, doc, checkpoint):
+                    continue
+                raised.extend(handler(doc))
+                ts = to_datetime(doc.get("timestamp"))
+                if isinstance(ts, datetime) and ts > newest:
+                    newest = ts
+            newest = min(newest, datetime.utcnow())             # a future-dated event mustn't jump the checkpoint
+            if newest > checkpoint:
+                self.state_col.update_one({"_id": name}, {"$set": {"last_timestamp": newest}}, upsert=True)
+            self._forget_seen(name, newest)
+        self.prune()
+        return raised
+
+    def run(self, poll_interval=2):
+        self.warm()
+        while True:
+            for flag in self.poll_once():
+                print(f"[{flag['detected_at']}] {flag['severity']:8} {flag['reason']} — {flag['user_email'] or flag['user_id']}")
+            time.sleep(poll_interval)
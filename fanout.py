@@ -0,0 +1,59 @@
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pymongo
+from pymongo.errors import ExecutionTimeout, NetworkTimeout, PyMongoError
+
+# ---------------------------------------------------------------------------
+# QUERY FAN-OUT — run independent counts / aggregations at the same time
+#
+# Endpoints that need several unrelated results (the dashboard rollup
+# rebuild, analytics endpoints with ?bucket=) submit them to one shared
+# thread pool. The sub-queries share the process-wide MongoClient and its
+# connection pool, so the endpoint's latency is the slowest sub-query
+# instead of the sum of all of them.
+#
+# Each call has a deadline. Sub-queries run under pymongo.timeout(), so the
+# server abandons work that overruns it; anything not finished by then is
+# reported in `errors` by name while the rest are still returned.
+# ---------------------------------------------------------------------------
+
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", 16))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+
+def _with_deadline(fn, seconds):
+    # pymongo.timeout is a context variable, so it has to be entered on the worker thread
+    with pymongo.timeout(seconds):
+        return fn()
+
+
+def run_parallel(tasks, timeout_ms):
+    """
+    Run {name: callable} concurrently. Returns (results, errors): results maps
+    each name that finished to its return value, errors maps each name that
+    timed out or raised a PyMongoError to a message.
+    """
+    seconds = timeout_ms / 1000
+    # each task runs in a copy of the caller's context, so its commands are attributed to the caller's request
+    futures = {
+        name: _executor.submit(contextvars.copy_context().run, _with_deadline, fn, seconds)
+        for name, fn in tasks.items()
+    }
+    done, _ = wait(futures.values(), timeout=seconds)
+
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if future not in done:
+            future.cancel()
+            errors[name] = f"timed out after {timeout_ms} ms"
+            continue
+        try:
+            results[name] = future.result()
+        except (ExecutionTimeout, NetworkTimeout):
+            errors[name] = f"timed out after {timeout_ms} ms"
+        except PyMongoError as e:
+            errors[name] = str(e)
+    return results, errors
@@ -0,0 +1,195 @@
+import os
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+
+from config import db
+
+# ---------------------------------------------------------------------------
+# TIME-SERIES COLLECTIONS — must exist before any index (or insert) would
+# implicitly create them as ordinary collections. USAGE_TIMESERIES=false
+# falls back to a plain collection for servers that can't update/delete
+# individual measurements.
+# ---------------------------------------------------------------------------
+
+TIMESERIES = {
+    "usage_logs": {"timeField": "timestamp", "metaField": "meta", "granularity": "hours"},
+}
+
+# capped collections keep only their most recent entries — used for diagnostic logs
+CAPPED = {
+    "slow_queries": {
+        "size": int(os.environ.get("SLOW_QUERY_CAP_BYTES", 32 * 1024 * 1024)),
+        "max":  int(os.environ.get("SLOW_QUERY_CAP_DOCS", 20_000)),
+    },
+}
+
+# ---------------------------------------------------------------------------
+# INDEX REGISTRY — every index the routes rely on, keyed by collection.
+# Applied once at startup by ensure_indexes(); create_indexes is a no-op for
+# indexes that already exist with the same spec.
+# ---------------------------------------------------------------------------
+
+INDEXES = {
+    "users": [
+        # create_user duplicate check
+        IndexModel([("profile.email", ASCENDING)]),
+        # get_users filters (tier, status or both), paged in _id order
+        IndexModel([("subscription.tier", ASCENDING), ("subscription.status", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("subscription.status", ASCENDING), ("_id", ASCENDING)]),
+        # search_users — anchored prefix match on the lowercase search.* copies, paged in field order
+        IndexModel([("search.email", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("search.last_name", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("search.first_name", ASCENDING), ("_id", ASCENDING)]),
+        # avg-api-calls from the usage_stats running totals, highest average first
+        IndexModel([("usage_stats.avg_api_calls", DESCENDING)],
+                   partialFilterExpression={"usage_stats.count": {"$gt": 0}}),
+    ],
+    "login": [
+        # auth.login lookup
+        IndexModel([("email", ASCENDING)], unique=True),
+        # delete_user removes the matching login record
+        IndexModel([("user_id", ASCENDING)]),
+    ],
+    "blacklisted_tokens": [
+        # revocation cache confirms bloom-filter hits by jti
+        IndexModel([("jti", ASCENDING)], unique=True, sparse=True),
+        # revocation cache polling
+        IndexModel([("invalidated_at", ASCENDING)]),
+        # entries expire with the token they revoke
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "activity_logs": [
+        # get_activity_logs / search_activity_logs — unfiltered listing in (timestamp, _id) keyset order
+        IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        # equality filter + keyset sort/range for each filterable field
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("action_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("network.region", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("performance.status_code", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+        # detect_failed_logins — $match on action_type then $group by user_id
+        IndexModel([("action_type", ASCENDING), ("user_id", ASCENDING)]),
+        # nearby_activity $geoNear
+        IndexModel([("network.location", GEOSPHERE)]),
+    ],
+    "usage_logs": [
+        # get_usage_logs — one user's logs newest first; analytics time-range $match
+        IndexModel([("meta.user_id", ASCENDING), ("timestamp", DESCENDING)]),
+        IndexModel([("meta.tier", ASCENDING), ("timestamp", DESCENDING)]),
+        # detection.py tails by timestamp; a bare range can't seek into the meta-prefixed indexes above
+        IndexModel([("timestamp", ASCENDING)]),
+    ],
+    "anomaly_flags": [
+        # get_anomaly_flags — unfiltered listing in (detected_at, _id) keyset order
+        IndexModel([("detected_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("resolved", ASCENDING), ("severity", ASCENDING), ("detected_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("severity", ASCENDING), ("detected_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("category", ASCENDING), ("detected_at", DESCENDING), ("_id", DESCENDING)]),
+        # ?source=detector — only engine-raised flags carry the field
+        IndexModel([("source", ASCENDING), ("detected_at", DESCENDING), ("_id", DESCENDING)],
+                   partialFilterExpression={"source": {"$exists": True}}),
+        # user_risk_report $group by user — covers every field the grouping reads
+        IndexModel([("user_id", ASCENDING), ("severity", ASCENDING), ("resolved", ASCENDING),
+                    ("anomaly_score", ASCENDING)]),
+    ],
+    "user_risk_report": [
+        # ?materialized=true pages, with and without ?tier=
+        IndexModel([("critical_count", DESCENDING), ("unresolved_count", DESCENDING), ("_id", ASCENDING)]),
+        IndexModel([("tier", ASCENDING), ("critical_count", DESCENDING), ("unresolved_count", DESCENDING),
+                    ("_id", ASCENDING)]),
+    ],
+    "slow_queries": [
+        # GET /admin/slow-queries?shape= — one shape's samples, newest first
+        IndexModel([("shape_hash", ASCENDING), ("at", DESCENDING)]),
+    ],
+}
+
+
+# search_users ?q= free-text search; a text index is costly to maintain, so it's opt-in
+USERS_TEXT_SEARCH = os.environ.get("USERS_TEXT_SEARCH", "false").lower() == "true"
+if USERS_TEXT_SEARCH:
+    INDEXES["users"].append(IndexModel(
+        [("profile.first_name", TEXT), ("profile.last_name", TEXT), ("profile.email", TEXT)],
+        name="users_text",
+    ))
+
+# Indexes that older versions of the registry created and that now get in the way.
+RETIRED_INDEXES = {
+    # blacklist entries are keyed by jti; new entries have no token, which a unique index rejects
+    "blacklisted_tokens": ["token_1"],
+    # superseded by the same keys with an _id tiebreaker for keyset pagination
+    "users": [
+        "subscription.tier_1_subscription.status_1",
+        "subscription.status_1",
+    ],
+    "activity_logs": [
+        "timestamp_-1",
+        "user_id_1_timestamp_-1",
+        "action_type_1_timestamp_-1",
+        "network.region_1_timestamp_-1",
+        "performance.status_code_1_timestamp_-1",
+    ],
+    "anomaly_flags": [
+        "detected_at_-1",
+        "resolved_1_severity_1_detected_at_-1",
+        "severity_1_detected_at_-1",
+        "category_1_detected_at_-1",
+        # superseded by the covering user_id index behind user_risk_report
+        "user_id_1",
+    ],
+}
+
+
+def ensure_collections(database=db):
+    """Create registered time-series and capped collections that don't exist yet."""
+    existing = set(database.list_collection_names())
+    if os.environ.get("USAGE_TIMESERIES", "true").lower() != "false":
+        for name, options in TIMESERIES.items():
+            if name not in existing:
+                database.create_collection(name, timeseries=options)
+    for name, options in CAPPED.items():
+        if name not in existing:
+            database.create_collection(name, capped=True, **options)
+
+
+def ensure_indexes():
+    """Create every registered collection and index. Safe to call on each startup."""
+    ensure_collections()
+
+    for name, index_names in RETIRED_INDEXES.items():
+        existing = db[name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                db[name].drop_index(index_name)
+
+    for name, models in INDEXES.items():
+        db[name].create_indexes(models)
+
+
+# ---------------------------------------------------------------------------
+# REPORT — declared vs existing indexes, with usage from $indexStats
+# ---------------------------------------------------------------------------
+
+def index_report():
+    """Return per-collection lists of missing, unused and undeclared indexes."""
+    report = {}
+    for name, models in INDEXES.items():
+        declared = {m.document["name"] for m in models}
+        stats    = {s["name"]: s["accesses"]["ops"] for s in db[name].aggregate([{"$indexStats": {}}])}
+
+        report[name] = {
+            "missing":    sorted(declared - stats.keys()),
+            "unused":     sorted(n for n, ops in stats.items() if ops == 0 and n != "_id_"),
+            "undeclared": sorted(stats.keys() - declared - {"_id_"}),
+            "ops":        stats,
+        }
+    return report
+
+
+def print_index_report():
+    for name, entry in index_report().items():
+        print(f"{name}")
+        for idx, ops in sorted(entry["ops"].items()):
+            print(f"  {idx:55} {ops:>10} ops")
+        for key in ("missing", "unused", "undeclared"):
+            if entry[key]:
+                print(f"  {key:10}: {', '.join(entry[key])}")
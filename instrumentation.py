@@ -0,0 +1,214 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, current_app, request
+from pymongo.monitoring import CommandListener
+
+# ---------------------------------------------------------------------------
+# INSTRUMENTATION — request latency and MongoDB commands, per route
+#
+# init_app() times every request into a histogram keyed by route, method and
+# status. RequestCommands, registered on the MongoClient, attributes each
+# command (count, duration, documents returned) to the request whose context
+# issued it. The request is carried in a context variable, so commands run on
+# fanout workers still count against it, and commands from background threads
+# (write-behind, detector) are reported under route="background". Everything
+# is rendered in Prometheus text format at GET /metrics. With DEBUG or
+# SERVER_TIMING=true, responses also carry a Server-Timing header.
+#
+# Command replies don't include documents examined, only documents returned;
+# explain output for slow commands (slow_queries.py) has the examined counts.
+# ---------------------------------------------------------------------------
+
+SERVER_TIMING   = os.environ.get("SERVER_TIMING", "false").lower() == "true"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKGROUND      = "background"
+
+# per-request counters: {"route", "start", "commands", "mongo_seconds", "recorded"}
+_current = contextvars.ContextVar("instrumented_request", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts  = [0] * (len(buckets) + 1)      # last slot is +Inf
+        self.sum     = 0.0
+        self.count   = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum   += value
+        self.count += 1
+
+
+class Metrics:
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self.requests  = {}       # (route, method, status) -> Histogram
+        self.commands  = {}       # (route, command, collection) -> Histogram
+        self.failures  = {}       # (route, command, collection) -> count
+        self.returned  = {}       # (route, command, collection) -> documents returned
+
+    def observe_request(self, route, method, status, seconds):
+        with self._lock:
+            self.requests.setdefault((route, method, str(status)), Histogram()).observe(seconds)
+
+    def observe_command(self, route, command, collection, seconds, returned=0, failed=False):
+        key = (route, command, collection)
+        with self._lock:
+            self.commands.setdefault(key, Histogram()).observe(seconds)
+            if returned:
+                self.returned[key] = self.returned.get(key, 0) + returned
+            if failed:
+                self.failures[key] = self.failures.get(key, 0) + 1
+
+    def render(self, gauges=None):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            lines = []
+            _histogram(lines, "http_request_duration_seconds", "Request latency by route, method and status.",
+                       ("route", "method", "status"), self.requests)
+            _histogram(lines, "mongodb_command_duration_seconds",
+                       "MongoDB command latency by the route that issued it.",
+                       ("route", "command", "collection"), self.commands)
+            _counter(lines, "mongodb_command_failures_total", "MongoDB commands that failed.",
+                     ("route", "command", "collection"), self.failures)
+            _counter(lines, "mongodb_documents_returned_total", "Documents returned by MongoDB commands.",
+                     ("route", "command", "collection"), self.returned)
+        for name, (help_text, value) in (gauges or {}).items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs + ([extra] if extra else [])) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram(lines, name, help_text, label_names, series):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, h in sorted(series.items()):
+        cumulative = 0
+        for bound, count in zip(h.buckets + ("+Inf",), h.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_labels(label_names, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(label_names, key)} {h.sum:.6f}")
+        lines.append(f"{name}_count{_labels(label_names, key)} {h.count}")
+
+
+def _counter(lines, name, help_text, label_names, series):
+    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for key, value in sorted(series.items()):
+        lines.append(f"{name}{_labels(label_names, key)} {value}")
+
+
+metrics = Metrics()
+
+
+# ---------------------------------------------------------------------------
+# MONGODB COMMANDS — attributed to the request in the current context
+# ---------------------------------------------------------------------------
+
+def _returned(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+    return reply.get("n", 0)
+
+
+class RequestCommands(CommandListener):
+    def __init__(self, metrics):
+        self.metrics     = metrics
+        self._lock       = threading.Lock()
+        self._collection = {}       # (connection_id, request_id) -> collection, until the reply arrives
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collection[(event.connection_id, event.request_id)] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        self._finish(event, _returned(event.reply), failed=False)
+
+    def failed(self, event):
+        self._finish(event, 0, failed=True)
+
+    def _finish(self, event, returned, failed):
+        seconds = event.duration_micros / 1_000_000
+        state   = _current.get()
+        with self._lock:
+            collection = self._collection.pop((event.connection_id, event.request_id), "")
+            if state is not None:                       # fanout workers share the request's state
+                state["commands"]      += 1
+                state["mongo_seconds"] += seconds
+        route = state["route"] if state is not None else BACKGROUND
+        self.metrics.observe_command(route, event.command_name, collection, seconds, returned, failed)
+
+
+command_metrics = RequestCommands(metrics)
+
+
+# ---------------------------------------------------------------------------
+# REQUESTS — framework-neutral start/finish, wired into Flask by init_app()
+# ---------------------------------------------------------------------------
+
+def start_request(route):
+    state = {"route": route, "start": time.perf_counter(), "commands": 0, "mongo_seconds": 0.0, "recorded": False}
+    return state, _current.set(state)
+
+
+def finish_request(state, method, status):
+    """Record the request once. Returns the Server-Timing header value."""
+    elapsed = time.perf_counter() - state["start"]
+    if not state["recorded"]:
+        state["recorded"] = True
+        metrics.observe_request(state["route"], method, status, elapsed)
+    return (f'app;dur={elapsed * 1000:.1f}, '
+            f'mongo;dur={state["mongo_seconds"] * 1000:.1f};desc="{state["commands"]} commands"')
+
+
+def current_route():
+    """Route of the request in the current context, or "background"."""
+    state = _current.get()
+    return state["route"] if state is not None else BACKGROUND
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def init_app(app):
+    @app.before_request
+    def _start():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        request.environ["instrumentation"] = start_request(route)
+
+    @app.after_request
+    def _finish(response):
+        state, _ = request.environ["instrumentation"]
+        timing   = finish_request(state, request.method, response.status_code)
+        if current_app.debug or SERVER_TIMING:
+            response.headers["Server-Timing"] = timing
+        return response
+
+    @app.teardown_request
+    def _teardown(exc):
+        started = request.environ.pop("instrumentation", None)
+        if started is None:
+            return
+        state, token = started
+        if not state["recorded"]:
+            finish_request(state, request.method, 500)   # unhandled exception: after_request never ran
+        end_request(token)
+
+
+def metrics_response(gauges=None):
+    return Response(metrics.render(gauges), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,26 @@
+from datetime import date, datetime
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+# ---------------------------------------------------------------------------
+# JSON PROVIDER — lets jsonify() take raw PyMongo documents
+#
+# The stdlib encoder walks the document once and only calls default() for
+# values it can't encode itself, so ObjectId / datetime are converted in the
+# same pass that writes the JSON instead of rebuilding every dict and list
+# beforehand.
+# ---------------------------------------------------------------------------
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    # keep MongoDB field order and skip the per-object key sort
+    sort_keys = False
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, ObjectId):
+            return str(o)
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
@@ -0,0 +1,37 @@
+"""
+Add the lowercase users.search copies that /users/search matches against.
+
+    python migrations/backfill_search_fields.py [--all]
+
+Users created before search_users used the search.* fields don't have them
+and won't be found. This sets search.{email,last_name,first_name} from the
+profile with one server-side pipeline update. By default only users without
+a search field are touched; --all recomputes every user.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import db  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill users.search for /users/search")
+    parser.add_argument("--all", action="store_true", help="recompute search fields for every user")
+    args = parser.parse_args()
+
+    ensure_indexes()
+    query  = {} if args.all else {"search": {"$exists": False}}
+    result = db["users"].update_many(query, [{"$set": {"search": {
+        "email":      {"$toLower": {"$ifNull": ["$profile.email", ""]}},
+        "last_name":  {"$toLower": {"$ifNull": ["$profile.last_name", ""]}},
+        "first_name": {"$toLower": {"$ifNull": ["$profile.first_name", ""]}},
+    }}}])
+    print(f"users updated: {result.modified_count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Move embedded users.usage_logs[] into the usage_logs time-series collection.
+
+    python migrations/migrate_usage_logs.py [--dry-run] [--keep-embedded]
+
+For each user that still has an embedded usage_logs array, its logs are
+copied into usage_logs with meta = {user_id, tier} and the array is then
+removed from the user document. ISO-string timestamps are converted to BSON
+dates, which the time-series timeField requires. Safe to re-run: only logs
+whose _id isn't in the collection yet are copied, so a run interrupted
+mid-batch is completed rather than skipped. A log with no _id or a missing
+or unparseable timestamp is reported and left in place, and so is the rest
+of that user's array. users.usage_stats is rebuilt afterwards so the
+analytics endpoints see the moved logs.
+"""
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import db  # noqa: E402
+from indexes import ensure_indexes  # noqa: E402
+from rollups import rebuild_usage_stats  # noqa: E402
+from timestamps import to_datetime  # noqa: E402
+
+BATCH_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded usage logs into the usage_logs collection")
+    parser.add_argument("--dry-run", action="store_true", help="report what would move without writing")
+    parser.add_argument("--keep-embedded", action="store_true", help="copy logs but leave users.usage_logs in place")
+    args = parser.parse_args()
+
+    users_col = db["users"]
+    usage_col = db["usage_logs"]
+    if not args.dry_run:
+        ensure_indexes()
+
+    users_moved = logs_moved = users_skipped = users_kept = logs_unparseable = 0
+    batch, batch_users = [], []
+
+    def flush():
+        if batch:
+            usage_col.insert_many(batch, ordered=False)
+        # only unset arrays whose logs are already written, so an interrupted run loses nothing
+        if batch_users and not args.keep_embedded:
+            users_col.update_many({"_id": {"$in": batch_users}}, {"$unset": {"usage_logs": ""}})
+        batch.clear()
+        batch_users.clear()
+
+    cursor = users_col.find(
+        {"usage_logs.0": {"$exists": True}},
+        {"usage_logs": 1, "subscription.tier": 1},
+    )
+    for user in cursor:
+        logs = user["usage_logs"]
+        # logs added through the API after the switch-over don't count — only copies of this array do
+        copied = {doc["_id"] for doc in usage_col.find(
+            {"meta.user_id": user["_id"], "_id": {"$in": [log.get("_id") for log in logs]}}, {"_id": 1})}
+
+        meta = {"user_id": user["_id"], "tier": user.get("subscription", {}).get("tier")}
+        missing, unparseable = [], 0
+        for log in logs:
+            if log.get("_id") in copied:
+                continue
+            try:
+                timestamp = to_datetime(log.get("timestamp"))
+            except ValueError:
+                timestamp = None
+            if "_id" not in log or not isinstance(timestamp, datetime):
+                unparseable += 1                # left in the array for a manual look
+                continue
+            missing.append({**log, "timestamp": timestamp, "meta": meta})
+
+        if missing:
+            batch.extend(missing)
+            logs_moved  += len(missing)
+            users_moved += 1
+        elif not unparseable:
+            users_skipped += 1                  # every log copied on an earlier run
+        if unparseable:
+            users_kept       += 1
+            logs_unparseable += unparseable
+        else:
+            batch_users.append(user["_id"])
+
+        if args.dry_run:
+            batch.clear()
+            batch_users.clear()
+        elif len(batch) >= BATCH_SIZE:
+            flush()
+
+    if not args.dry_run:
+        flush()
+
+    prefix = "[dry run] " if args.dry_run else ""
+    print(f"{prefix}users migrated : {users_moved}")
+    print(f"{prefix}logs migrated  : {logs_moved}")
+    print(f"{prefix}users skipped  : {users_skipped} (already in usage_logs)")
+    print(f"{prefix}users kept     : {users_kept} ({logs_unparseable} logs with no _id or an unparseable timestamp)")
+    if not args.dry_run and users_moved:
+        stats = rebuild_usage_stats()
+        print(f"usage_stats rebuilt : {stats['with_usage']} users with usage, {stats['without_usage']} without")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Convert ISO-string timestamps to BSON dates.
+
+    python migrations/normalize_timestamps.py [--verify] [--dry-run]
+
+Before timestamps were stored as dates, the write routes saved
+datetime.utcnow().isoformat() strings while seed_data.py saved dates, so
+activity_logs, anomaly_flags and the logs embedded in them and in users
+hold a mix. Range filters can't match both types with one index range.
+This rewrites every string value in the fields listed in FIELDS as a naive
+UTC date, then rebuilds the dashboard rollup. Safe to re-run: only string
+values are touched, and each update is conditional on the value it read,
+so a concurrent write is left alone and picked up by the next run.
+
+--verify only reports the BSON type distribution of each field.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import db  # noqa: E402
+from rollups import rebuild as rebuild_rollups  # noqa: E402
+from timestamps import to_datetime  # noqa: E402
+
+BATCH_SIZE = 1000
+
+# collection -> [(array holding the field or None, field path)]
+FIELDS = {
+    "activity_logs": [
+        (None, "timestamp"),
+    ],
+    "anomaly_flags": [
+        (None, "detected_at"),
+        ("resolution_logs", "timestamp"),
+    ],
+    "users": [
+        (None, "profile.created_at"),
+        (None, "profile.last_login"),
+        ("api_keys", "created_at"),
+        ("api_keys", "last_used"),
+        ("alerts", "triggered_at"),
+    ],
+}
+
+
+def get_path(doc, path):
+    for key in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc
+
+
+def full_path(array, field):
+    return f"{array}.{field}" if array else field
+
+
+def type_distribution(col, array, field):
+    path     = full_path(array, field)
+    pipeline = [{"$unwind": f"${array}"}] if array else []
+    pipeline += [
+        {"$group": {"_id": {"$type": f"${path}"}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+    ]
+    return {r["_id"]: r["count"] for r in col.aggregate(pipeline)}
+
+
+def verify():
+    remaining = 0
+    for name, fields in FIELDS.items():
+        for array, field in fields:
+            counts = type_distribution(db[name], array, field)
+            remaining += counts.get("string", 0)
+            summary = ", ".join(f"{t}: {n}" for t, n in counts.items()) or "no values"
+            print(f"{name + '.' + full_path(array, field):40} {summary}")
+    print(f"\nstring timestamps remaining: {remaining}")
+    return remaining
+
+
+def convert(doc, fields):
+    """Return (filter, $set) that replaces this document's string timestamps, or None."""
+    match, update = {"_id": doc["_id"]}, {}
+    for array, field in fields:
+        if array is None:
+            value = get_path(doc, field)
+            if isinstance(value, str):
+                match[field]  = value
+                update[field] = to_datetime(value)
+        elif array not in update and isinstance(doc.get(array), list):
+            items = doc[array]
+            array_fields = [f for a, f in fields if a == array]
+            converted = []
+            for item in items:
+                item = dict(item)
+                for f in array_fields:
+                    if isinstance(item.get(f), str):
+                        item[f] = to_datetime(item[f])
+                converted.append(item)
+            if converted != items:
+                match[array]  = items
+                update[array] = converted
+    return (match, {"$set": update}) if update else None
+
+
+def migrate(dry_run=False):
+    for name, fields in FIELDS.items():
+        col   = db[name]
+        query = {"$or": [{full_path(a, f): {"$type": "string"}} for a, f in fields]}
+        projection = {(a or f): 1 for a, f in fields}
+
+        converted = skipped = 0
+        batch = []
+        for doc in col.find(query, projection):
+            try:
+                change = convert(doc, fields)
+            except ValueError:
+                skipped += 1                     # unparseable string — left for a manual look
+                continue
+            if change:
+                converted += 1
+                batch.append(UpdateOne(*change))
+            if len(batch) >= BATCH_SIZE:
+                if not dry_run:
+                    col.bulk_write(batch, ordered=False)
+                batch.clear()
+        if batch and not dry_run:
+            col.bulk_write(batch, ordered=False)
+
+        prefix = "[dry run] " if dry_run else ""
+        print(f"{prefix}{name:15} documents converted: {converted}  unparseable: {skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert ISO-string timestamps to BSON dates")
+    parser.add_argument("--verify", action="store_true", help="only report the type distribution of each field")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+
+    if args.verify:
+        sys.exit(1 if verify() else 0)
+
+    migrate(dry_run=args.dry_run)
+    if not args.dry_run:
+        errors = rebuild_rollups().get("errors")
+        print(f"dashboard rollup partially rebuilt: {errors}" if errors else "dashboard rollup rebuilt")
+        print()
+        verify()
+
+
+if __name__ == "__main__":
+    main()
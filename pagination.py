@@ -0,0 +1,134 @@
+import base64
+import binascii
+
+import bson
+from bson.errors import InvalidBSON
+from flask import jsonify, request
+
+# ---------------------------------------------------------------------------
+# PAGINATION — page-number and keyset (cursor) pagination for list endpoints
+#
+# Lists are ordered by (sort_field, _id) — descending unless the caller asks
+# for ascending — or by _id alone. A cursor is the BSON-encoded sort key of
+# the last document on a page, so the next page resumes with a range query
+# instead of skipping over everything before it. BSON keeps the key's type
+# (datetime vs string) intact through the round trip.
+# ---------------------------------------------------------------------------
+
+MAX_PAGE_SIZE = 100
+
+
+def get_pagination(args=None):
+    args = request.args if args is None else args
+    try:
+        page_num  = max(1, int(args.get("pn", 1)))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(args.get("ps", args.get("limit", 10)))))
+    except ValueError:
+        page_num, page_size = 1, 10
+    return page_num, page_size
+
+
+def get_field(doc, path):
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+
+def encode_cursor(doc, sort_field=None):
+    key = {"id": doc["_id"]}
+    if sort_field:
+        key["v"] = get_field(doc, sort_field)
+    return base64.urlsafe_b64encode(bson.encode(key)).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the decoded sort key; raises ValueError for anything that isn't one of ours."""
+    try:
+        key = bson.decode(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, InvalidBSON, IndexError) as e:
+        raise ValueError("malformed cursor") from e
+    if "id" not in key:
+        raise ValueError("malformed cursor")
+    return key
+
+
+def keyset_filter(key, sort_field=None, direction=-1):
+    if not sort_field:
+        return {"_id": {"$gt": key["id"]}}
+    op    = "$lt" if direction < 0 else "$gt"
+    value = key.get("v")
+    # null/missing sorts below every value — last when descending, first when ascending —
+    # and never satisfies $lt/$gt, so its position needs its own branch
+    if value is None:
+        after = [{sort_field: {"$ne": None}}] if direction > 0 else []
+        return {"$or": [{sort_field: None, "_id": {op: key["id"]}}, *after]}
+    after = [{sort_field: None}] if direction < 0 else []
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: key["id"]}},
+        *after,
+    ]}
+
+
+def plan_page(query, sort_field=None, direction=-1, args=None):
+    """
+    Work out the find() for one page from ?pn/ps/limit/cursor. Returns (plan, error)
+    where error is a (message, field, code) tuple.
+    """
+    args = request.args if args is None else args
+    page_num, page_size = get_pagination(args)
+    plan = {
+        "filter":     query,
+        "sort":       [(sort_field, direction), ("_id", direction)] if sort_field else [("_id", 1)],
+        "skip":       (page_num - 1) * page_size,
+        "limit":      page_size + 1,      # one extra document tells us whether another page exists
+        "page_num":   page_num,
+        "page_size":  page_size,
+        "sort_field": sort_field,
+        "cursor":     args.get("cursor"),
+        "total":      args.get("include_total", "false").lower(),
+    }
+    if plan["cursor"]:
+        try:
+            key = decode_cursor(plan["cursor"])
+        except ValueError:
+            return None, ("Invalid cursor", "cursor", 422)
+        after = keyset_filter(key, sort_field, direction)
+        plan["filter"] = {"$and": [query, after]} if query else after
+        plan["skip"]   = 0
+    return plan, None
+
+
+def finish_page(docs, plan):
+    """Drop the look-ahead document and build the page meta (totals are added by the caller)."""
+    has_more = len(docs) > plan["page_size"]
+    docs     = docs[:plan["page_size"]]
+    meta     = {"per_page": plan["page_size"]}
+    if not plan["cursor"]:
+        meta["page"] = plan["page_num"]
+    meta["next_cursor"] = encode_cursor(docs[-1], plan["sort_field"]) if has_more else None
+    return docs, meta
+
+
+def paginate(col, query, sort_field=None, projection=None, direction=-1):
+    """
+    Fetch one page of col.find(query). Returns (docs, meta, error).
+
+    ?cursor= resumes after a previous page's next_cursor; without it pn/ps
+    page numbers still work. ?include_total=true adds an exact count,
+    ?include_total=estimate the collection's estimated size.
+    """
+    plan, error = plan_page(query, sort_field, direction)
+    if error:
+        message, field, code = error
+        return None, None, (jsonify({"error": message, "field": field}), code)
+
+    docs = list(col.find(plan["filter"], projection).sort(plan["sort"]).skip(plan["skip"]).limit(plan["limit"]))
+    docs, meta = finish_page(docs, plan)
+
+    if plan["total"] == "true":
+        meta["total"] = col.count_documents(query)
+    elif plan["total"] == "estimate":
+        meta["total_estimate"] = col.estimated_document_count()
+    meta["next_cursor"] = meta.pop("next_cursor")      # keep it last
+    return docs, meta, None
@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# ---------------------------------------------------------------------------
+# PASSWORD HASHING — bcrypt on a bounded pool, with per-email login limits
+#
+# bcrypt is deliberately slow, so a burst of logins (shift change, SSO
+# outage) can otherwise occupy every request thread. hash_password and
+# check_password run on a small dedicated pool (BCRYPT_WORKERS) and refuse
+# new work with PasswordPoolBusy once BCRYPT_MAX_PENDING jobs are queued, so
+# the rest of the API keeps its threads. The cost factor is BCRYPT_ROUNDS;
+# check_password reports hashes made with a different cost so /login can
+# rehash them while it has the plaintext.
+#
+# LoginLimiter counts failed attempts per email in a sliding window and
+# rejects an email that reached the limit before any lookup or hashing.
+# Like the response cache it is per process, so each worker counts its own.
+# ---------------------------------------------------------------------------
+
+BCRYPT_ROUNDS      = int(os.environ.get("BCRYPT_ROUNDS", 12))
+BCRYPT_WORKERS     = int(os.environ.get("BCRYPT_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+BCRYPT_MAX_PENDING = int(os.environ.get("BCRYPT_MAX_PENDING", BCRYPT_WORKERS * 8))
+
+LOGIN_MAX_FAILURES = int(os.environ.get("LOGIN_MAX_FAILURES", 5))
+LOGIN_WINDOW       = int(os.environ.get("LOGIN_FAILURE_WINDOW_SECONDS", 300))
+LOGIN_TRACKED      = 100_000          # emails remembered at once; the least recently failed are forgotten first
+
+
+class PasswordPoolBusy(Exception):
+    """Every bcrypt worker is busy and the queue is full — the caller should answer 503."""
+
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_slots    = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds=rounds or BCRYPT_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode("utf-8"), salt).decode("utf-8")
+
+
+def hash_rounds(hashed):
+    """Cost factor of a "$2b$12$..." hash, or None if it isn't one."""
+    parts = hashed.split("$")
+    return int(parts[2]) if len(parts) > 3 and parts[2].isdigit() else None
+
+
+def check_password(password, hashed):
+    """Returns (matches, needs_rehash) — needs_rehash when the hash's cost isn't BCRYPT_ROUNDS."""
+    matches = _run(bcrypt.checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+    return matches, matches and hash_rounds(hashed) != BCRYPT_ROUNDS
+
+
+class LoginLimiter:
+    def __init__(self, max_failures=LOGIN_MAX_FAILURES, window=LOGIN_WINDOW, max_size=LOGIN_TRACKED):
+        self.max_failures = max_failures
+        self.window       = window
+        self.max_size     = max_size
+        self._lock        = threading.Lock()
+        self._failures    = OrderedDict()      # email -> [failure times, oldest first]
+
+    def retry_after(self, email):
+        """Seconds until email may try again, or 0 if it may try now."""
+        now = time.monotonic()
+        with self._lock:
+            key = email.lower()
+            if key not in self._failures:
+                return 0
+            times = self._recent(key, now)
+            if not times:
+                del self._failures[key]
+            if len(times) < self.max_failures:
+                return 0
+            return max(1, int(times[0] + self.window - now) + 1)
+
+    def failed(self, email):
+        now = time.monotonic()
+        with self._lock:
+            key = email.lower()
+            self._recent(key, now).append(now)
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.max_size:
+                self._failures.popitem(last=False)
+
+    def succeeded(self, email):
+        with self._lock:
+            self._failures.pop(email.lower(), None)
+
+    def _recent(self, key, now):
+        times = self._failures.setdefault(key, [])
+        while times and times[0] <= now - self.window:
+            times.pop(0)
+        return times
+
+
+login_limiter = LoginLimiter()
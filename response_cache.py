@@ -0,0 +1,198 @@
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request
+
+# ---------------------------------------------------------------------------
+# RESPONSE CACHE — for GET endpoints whose result only changes when a source
+# collection is written
+#
+# @cached("users", ...) stores the JSON body of a 200 response under the
+# route + normalised query string, tagged with the collections it reads.
+# @invalidates("users", ...) on a write route drops every entry carrying
+# one of those tags once the write succeeds. Responses carry ETag and
+# Last-Modified so clients can revalidate and get a 304.
+#
+# The default backend is an in-process LRU, so a write handled by one worker
+# only clears that worker's entries; RESPONSE_CACHE_TTL bounds how stale the
+# others can get. A backend shared by all workers (e.g. Redis) can be
+# plugged in with set_backend().
+#
+# A view that was running when its tags were invalidated computed its body
+# from the old data, so store() is handed the tags' generations from before
+# the view ran and drops the body if any of them moved. Cached analytics
+# views read through analytics_db, which may be a lagging secondary, so for
+# RESPONSE_CACHE_REPLICA_LAG seconds after an invalidation the tag's
+# responses are served but not stored. A secondary further behind than that
+# can still put pre-write data in the cache, for at most RESPONSE_CACHE_TTL.
+# ---------------------------------------------------------------------------
+
+
+class CacheBackend(ABC):
+    """Interface a shared cache store implements."""
+
+    @abstractmethod
+    def get(self, key):
+        ...
+
+    @abstractmethod
+    def set(self, key, entry, tags, ttl):
+        ...
+
+    @abstractmethod
+    def invalidate(self, tags):
+        ...
+
+
+class LRUBackend(CacheBackend):
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self._entries = OrderedDict()        # key -> (entry, tags, monotonic expiry)
+        self._tagged  = {}                   # tag -> set of keys
+        self._lock    = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[2] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def set(self, key, entry, tags, ttl):
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (entry, tags, time.monotonic() + ttl)
+            for tag in tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tagged.get(tag, ())):
+                    self._drop(key)
+
+    def _drop(self, key):
+        item = self._entries.pop(key, None)
+        if item is None:
+            return
+        for tag in item[1]:
+            keys = self._tagged.get(tag)
+            if keys:
+                keys.discard(key)
+
+
+CACHE_TTL   = int(os.environ.get("RESPONSE_CACHE_TTL", 300))
+REPLICA_LAG = float(os.environ.get("RESPONSE_CACHE_REPLICA_LAG", 10))
+
+_backend = LRUBackend(max_size=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)))
+
+_tag_lock    = threading.Lock()
+_generations = {}                    # tag -> number of invalidations this process has made
+_invalidated = {}                    # tag -> monotonic time of the latest one
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def invalidate(*tags):
+    with _tag_lock:
+        now = time.monotonic()
+        for tag in tags:
+            _generations[tag] = _generations.get(tag, 0) + 1
+            _invalidated[tag] = now
+        _backend.invalidate(tags)
+
+
+def generation(tags):
+    """Snapshot of the tags' invalidation counters, taken before a view computes its body."""
+    with _tag_lock:
+        return tuple(_generations.get(tag, 0) for tag in tags)
+
+
+def cache_key(path=None, args=None):
+    path = request.path if path is None else path
+    args = request.args if args is None else args
+    query = "&".join(f"{k}={v}" for k, v in sorted(args.items(multi=True)))
+    return f"{path}?{query}"
+
+
+def lookup(key):
+    return _backend.get(key)
+
+
+def store(key, body, status, mimetype, tags, since):
+    """
+    Cache a response body under key. Returns the entry, which carries its ETag and Last-Modified,
+    or None if a tag was invalidated after the `since` generation snapshot or within REPLICA_LAG.
+    """
+    entry = {
+        "body":          body,
+        "status":        status,
+        "mimetype":      mimetype,
+        "etag":          hashlib.sha1(body).hexdigest(),
+        "last_modified": datetime.now(timezone.utc).replace(microsecond=0),
+    }
+    with _tag_lock:
+        settled = time.monotonic() - REPLICA_LAG
+        if since != tuple(_generations.get(tag, 0) for tag in tags):
+            return None
+        if any(_invalidated.get(tag, settled) > settled for tag in tags):
+            return None
+        _backend.set(key, entry, tags, CACHE_TTL)
+    return entry
+
+
+def _conditional(entry):
+    response = Response(entry["body"], status=entry["status"], mimetype=entry["mimetype"])
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+
+def cached(*tags):
+    """Cache a GET view's 200 responses (unless marked no-store), tagged with the collections it reads."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key   = cache_key()
+            entry = lookup(key)
+            if entry is not None:
+                return _conditional(entry)
+
+            since    = generation(tags)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or "no-store" in response.headers.get("Cache-Control", ""):
+                return response
+
+            entry = store(key, response.get_data(), response.status_code, response.mimetype, tags, since)
+            return response if entry is None else _conditional(entry)
+        return decorated
+    return decorator
+
+
+def invalidates(*tags):
+    """Drop cached responses tagged with any of these collections after a successful write."""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code < 400:
+                invalidate(*tags)
+            return response
+        return decorated
+    return decorator
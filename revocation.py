@@ -0,0 +1,156 @@
+import datetime
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------------------------------------------------------------------
+# REVOCATION CACHE — in-process front for the blacklisted_tokens collection
+#
+# Revoked token ids (the JWT "jti" claim) are held in a bloom filter. A miss
+# means the token is definitely not revoked and needs no database read; only
+# a hit is confirmed against MongoDB, and the answer is remembered. Each
+# worker polls blacklisted_tokens for entries written since its last poll so
+# a logout handled by another worker is picked up within one poll interval,
+# and the filter is rebuilt from scratch periodically so it doesn't fill up
+# with ids of tokens that have long expired.
+# ---------------------------------------------------------------------------
+
+
+def token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def revocation_id(token, payload):
+    """The id a token is blacklisted under — its jti, or a hash for tokens issued without one."""
+    return payload.get("jti") or token_hash(token)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.size   = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits   = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.sha256(item.encode("utf-8")).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationCache:
+    def __init__(self, collection, capacity=100_000, error_rate=0.001, max_size=10_000,
+                 poll_interval=5, rebuild_interval=3600):
+        self.collection       = collection
+        self.capacity         = capacity
+        self.error_rate       = error_rate
+        self.max_size         = max_size
+        self.poll_interval    = poll_interval
+        self.rebuild_interval = rebuild_interval
+
+        self._bloom   = None             # loaded on first check, not at import
+        self._revoked = OrderedDict()    # confirmed revoked jtis
+        self._clear   = OrderedDict()    # bloom false positives confirmed not revoked
+        self._lock      = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        self._next_poll    = 0.0
+        self._next_rebuild = 0.0
+        self._last_seen    = None
+
+    def is_revoked(self, jti):
+        """Return True if the token id has been blacklisted."""
+        self._refresh()
+        if jti not in self._bloom:
+            return False
+
+        with self._lock:
+            if jti in self._revoked:
+                self._revoked.move_to_end(jti)
+                return True
+            if jti in self._clear:
+                self._clear.move_to_end(jti)
+                return False
+
+        revoked = self.collection.find_one({"jti": jti}, {"_id": 1}) is not None
+        if revoked:
+            self.mark_revoked(jti)
+        else:
+            with self._lock:
+                self._remember(self._clear, jti)
+        return revoked
+
+    def mark_revoked(self, jti):
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+            self._clear.pop(jti, None)
+            self._remember(self._revoked, jti)
+
+    def _remember(self, cache, key):
+        cache[key] = None
+        cache.move_to_end(key)
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+
+    # -- keeping the filter in step with the collection ---------------------
+
+    def _refresh(self):
+        if self._bloom is None:
+            with self._load_lock:
+                if self._bloom is None:
+                    self._rebuild()
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_rebuild:
+                action = self._rebuild
+                self._next_rebuild = now + self.rebuild_interval
+            elif now >= self._next_poll:
+                action = self._poll
+            else:
+                return
+            self._next_poll = now + self.poll_interval
+        action()
+
+    def _rebuild(self):
+        started = datetime.datetime.now(datetime.UTC)
+        bloom   = BloomFilter(self.capacity, self.error_rate)
+        for doc in self.collection.find({}, {"jti": 1, "token": 1}):
+            jti = self._doc_id(doc)
+            if "jti" not in doc:
+                # entries written before jti was introduced only carry the raw token —
+                # backfill the id so the confirming lookup in is_revoked can find them
+                self.collection.update_one({"_id": doc["_id"]}, {"$set": {"jti": jti}})
+            bloom.add(jti)
+
+        now = time.monotonic()
+        with self._lock:
+            self._bloom        = bloom
+            self._last_seen    = started
+            self._next_poll    = now + self.poll_interval
+            self._next_rebuild = now + self.rebuild_interval
+
+    def _poll(self):
+        with self._lock:
+            # overlap the previous window so writes from skewed clocks aren't missed
+            since = self._last_seen - datetime.timedelta(seconds=2 * self.poll_interval)
+            self._last_seen = datetime.datetime.now(datetime.UTC)
+
+        for doc in self.collection.find({"invalidated_at": {"$gte": since}}, {"jti": 1, "token": 1}):
+            self.mark_revoked(self._doc_id(doc))
+
+    @staticmethod
+    def _doc_id(doc):
+        # entries written before jti was introduced only carry the raw token
+        return doc.get("jti") or token_hash(doc["token"])
@@ -0,0 +1,340 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import analytics_db, db
+from fanout import run_parallel
+from timestamps import to_datetime
+
+# ---------------------------------------------------------------------------
+# DASHBOARD ROLLUPS — one pre-aggregated document behind /dashboard/summary
+#
+# The write routes keep the counters current with $inc: each change is
+# expressed as the counters the document contributed before and after it.
+# Activity is counted in hourly buckets so "last 24h" is a sum over at most
+# 25 numbers. Anything that writes around the routes (seeding, migrations,
+# bulk tools) is reconciled by a full rebuild, run when the rollup is older
+# than ROLLUP_MAX_AGE_SECONDS, on ?fresh=true, or via `flask rebuild-rollups`;
+# its seven sub-queries run in parallel through fanout.run_parallel. A stale
+# rollup is still served while one background thread rebuilds it; the
+# rebuilding_until lease on the primary's document keeps other workers (and
+# reads from a lagging secondary) from starting a second rebuild.
+# ---------------------------------------------------------------------------
+
+ROLLUP_ID          = "summary"
+ROLLUP_MAX_AGE     = int(os.environ.get("ROLLUP_MAX_AGE_SECONDS", 3600))
+REBUILD_TIMEOUT_MS = int(os.environ.get("ROLLUP_REBUILD_TIMEOUT_MS", 5000))
+REBUILD_LEASE      = timedelta(milliseconds=REBUILD_TIMEOUT_MS * 2)   # also the retry delay after a failed rebuild
+
+rollups_col      = db["dashboard_rollups"]
+rollups_read_col = analytics_db["dashboard_rollups"]
+
+log         = logging.getLogger("rollups")
+_refreshing = threading.Lock()            # held while this process has a rebuild thread running
+
+
+def hour_key(timestamp):
+    return to_datetime(timestamp).strftime("%Y%m%d%H")
+
+
+# ---------------------------------------------------------------------------
+# COUNTERS — what a single document contributes to the rollup
+# ---------------------------------------------------------------------------
+
+def user_counters(user):
+    if not user:
+        return {}
+    subscription = user.get("subscription", {})
+    counters = {"total_users": 1}
+    if subscription.get("status") == "active":
+        counters["active_users"] = 1
+    if subscription.get("tier"):
+        counters[f"tier_breakdown.{subscription['tier']}"] = 1
+    if user.get("metadata", {}).get("churn_risk"):
+        counters[f"churn_risk_breakdown.{user['metadata']['churn_risk']}"] = 1
+    return counters
+
+
+def anomaly_counters(flag):
+    if not flag or flag.get("resolved"):
+        return {}
+    counters = {"open_anomalies": 1}
+    if flag.get("severity") == "critical":
+        counters["critical_anomalies"] = 1
+    return counters
+
+
+def apply_set(doc, fields):
+    """Copy of doc with a dotted-path $set applied — the 'after' side of an update."""
+    doc = dict(doc)
+    for path, value in fields.items():
+        target = doc
+        *parents, leaf = path.split(".")
+        for key in parents:
+            target[key] = dict(target.get(key) or {})
+            target = target[key]
+        target[leaf] = value
+    return doc
+
+
+def _record(before, after):
+    inc = dict(after)
+    for key, value in before.items():
+        inc[key] = inc.get(key, 0) - value
+    inc = {k: v for k, v in inc.items() if v}
+    if inc:
+        rollups_col.update_one({"_id": ROLLUP_ID}, {"$inc": inc}, upsert=True)
+
+
+def record_user(before=None, after=None):
+    _record(user_counters(before), user_counters(after))
+
+
+def record_anomaly(before=None, after=None):
+    _record(anomaly_counters(before), anomaly_counters(after))
+
+
+def activity_increments(timestamps, sign=1):
+    inc = {}
+    for ts in filter(None, timestamps):
+        key = f"activity_hourly.{hour_key(ts)}"
+        inc[key] = inc.get(key, 0) + sign
+    return inc
+
+
+def record_activity(timestamps, sign=1):
+    inc = activity_increments(timestamps, sign)
+    if inc:
+        rollups_col.update_one({"_id": ROLLUP_ID}, {"$inc": inc}, upsert=True)
+
+
+# ---------------------------------------------------------------------------
+# REBUILD / READ
+# ---------------------------------------------------------------------------
+
+def _counts_by(col, field):
+    pipeline = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+    return {r["_id"]: r["count"] for r in col.aggregate(pipeline) if r["_id"]}
+
+
+def _activity_hourly(since):
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$group": {
+            "_id":   {"$dateToString": {"format": "%Y%m%d%H", "date": "$timestamp"}},
+            "count": {"$sum": 1},
+        }},
+    ]
+    return {r["_id"]: r["count"] for r in analytics_db["activity_logs"].aggregate(pipeline)}
+
+
+def rebuild():
+    """
+    Recompute the rollup from the source collections and replace it. The
+    sub-queries run in parallel under REBUILD_TIMEOUT_MS; if any of them fail
+    only the fields that were computed are written, rebuilt_at is left alone
+    so the next read retries, and the returned doc carries an "errors" map.
+    """
+    now     = datetime.utcnow()
+    cutoff  = (now - timedelta(hours=24)).replace(minute=0, second=0, microsecond=0)
+    users   = analytics_db["users"]
+    flags   = analytics_db["anomaly_flags"]
+
+    fields, errors = run_parallel({
+        "total_users":          lambda: users.count_documents({}),
+        "active_users":         lambda: users.count_documents({"subscription.status": "active"}),
+        "open_anomalies":       lambda: flags.count_documents({"resolved": False}),
+        "critical_anomalies":   lambda: flags.count_documents({"severity": "critical", "resolved": False}),
+        "tier_breakdown":       lambda: _counts_by(users, "subscription.tier"),
+        "churn_risk_breakdown": lambda: _counts_by(users, "metadata.churn_risk"),
+        "activity_hourly":      lambda: _activity_hourly(cutoff),
+    }, REBUILD_TIMEOUT_MS)
+
+    if not errors:
+        doc = {"_id": ROLLUP_ID, **fields, "rebuilt_at": now}
+        rollups_col.replace_one({"_id": ROLLUP_ID}, doc, upsert=True)
+        return doc
+
+    doc = rollups_col.find_one_and_update(
+        {"_id": ROLLUP_ID}, {"$set": fields}, upsert=True, return_document=ReturnDocument.AFTER,
+    ) if fields else (rollups_col.find_one({"_id": ROLLUP_ID}) or {"_id": ROLLUP_ID})
+    return {**doc, "errors": errors}
+
+
+def is_stale(doc, now):
+    return doc is None or "rebuilt_at" not in doc or doc["rebuilt_at"] < now - timedelta(seconds=ROLLUP_MAX_AGE)
+
+
+def format_summary(doc, now):
+    cutoff = hour_key(now - timedelta(hours=24))
+    summary = {
+        "total_users":          doc.get("total_users", 0),
+        "active_users":         doc.get("active_users", 0),
+        "open_anomalies":       doc.get("open_anomalies", 0),
+        "critical_anomalies":   doc.get("critical_anomalies", 0),
+        "activity_last_24h":    sum(n for hour, n in doc.get("activity_hourly", {}).items() if hour >= cutoff),
+        "tier_breakdown":       _nonzero_by_count(doc.get("tier_breakdown", {})),
+        "churn_risk_breakdown": _nonzero_by_count(doc.get("churn_risk_breakdown", {})),
+        "rebuilt_at":           doc.get("rebuilt_at"),
+    }
+    if doc.get("errors"):
+        summary["errors"] = doc["errors"]      # partial rebuild: these fields are from the previous rollup
+    return summary
+
+
+def claim_rebuild(now):
+    """
+    Take the rebuild lease if the primary's rollup is still stale and nobody holds an
+    unexpired lease. Returns True if this caller should rebuild. A full rebuild's
+    replace_one drops the lease; a partial one leaves it to expire.
+    """
+    try:
+        rollups_col.update_one(
+            {"_id": ROLLUP_ID, "$and": [
+                {"$or": [{"rebuilt_at": {"$exists": False}},
+                         {"rebuilt_at": {"$lt": now - timedelta(seconds=ROLLUP_MAX_AGE)}}]},
+                {"$or": [{"rebuilding_until": {"$exists": False}}, {"rebuilding_until": {"$lt": now}}]},
+            ]},
+            {"$set": {"rebuilding_until": now + REBUILD_LEASE}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False                            # the document exists but is fresh or leased
+    return True
+
+
+def refresh_in_background():
+    """Rebuild a stale rollup on a background thread, unless this process or another is already at it."""
+    if not _refreshing.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            if claim_rebuild(datetime.utcnow()):
+                rebuild()
+        except Exception:
+            log.exception("dashboard rollup rebuild failed")
+        finally:
+            _refreshing.release()
+
+    threading.Thread(target=run, name="rollup-rebuild", daemon=True).start()
+
+
+def read_summary(fresh=False):
+    """
+    Return the dashboard summary from the rollup. It is rebuilt in the request when
+    missing or asked to; a stale rollup is served as is while it rebuilds in the background.
+    """
+    now = datetime.utcnow()
+    doc = None if fresh else rollups_read_col.find_one({"_id": ROLLUP_ID})
+    if doc is None:
+        doc = rebuild()
+    elif is_stale(doc, now):
+        refresh_in_background()
+    return format_summary(doc, now)
+
+
+def _nonzero_by_count(counts):
+    return {k: v for k, v in sorted(counts.items(), key=lambda kv: -kv[1]) if v}
+
+
+# ---------------------------------------------------------------------------
+# USAGE STATS — per-user running totals on users.usage_stats
+#
+# usage_stats = {count, avg_api_calls, rebuilt_at?, and the sums api_calls,
+# storage_mb, read_ops, write_ops, delete_ops, cache_hit_pct} over the user's
+# usage_logs. The usage log routes apply each change as the difference between
+# what the log contributed before and after it, in one pipeline update so the
+# stored average moves with the sums. Logs live in the time-series collection,
+# so that update is a second write after the log itself; anything that drifts
+# (bulk imports, seeding with an older script) is fixed by rebuild_usage_stats,
+# run with `flask repair-usage-stats`.
+# ---------------------------------------------------------------------------
+
+USAGE_SUMS  = ("api_calls", "storage_mb", "read_ops", "write_ops", "delete_ops", "cache_hit_pct")
+EMPTY_USAGE = {"count": 0, **{field: 0 for field in USAGE_SUMS}, "avg_api_calls": None}
+
+users_col = db["users"]
+
+
+def usage_counters(log):
+    if not log:
+        return {}
+    metrics   = log.get("metrics", {})
+    breakdown = metrics.get("breakdown", {})
+    return {
+        "count":         1,
+        "api_calls":     metrics.get("api_calls", 0),
+        "storage_mb":    metrics.get("storage_mb", 0),
+        "read_ops":      breakdown.get("read_ops", 0),
+        "write_ops":     breakdown.get("write_ops", 0),
+        "delete_ops":    breakdown.get("delete_ops", 0),
+        "cache_hit_pct": breakdown.get("cache_hit_pct", 0),
+    }
+
+
+def average_api_calls(stats="$usage_stats"):
+    return {"$cond": [
+        {"$gt": [f"{stats}.count", 0]},
+        {"$round": [{"$divide": [f"{stats}.api_calls", f"{stats}.count"]}, 2]},
+        None,
+    ]}
+
+
+def record_usage(user_id, before=None, after=None):
+    before, after = usage_counters(before), usage_counters(after)
+    inc = {k: after.get(k, 0) - before.get(k, 0) for k in set(before) | set(after)}
+    inc = {k: v for k, v in inc.items() if v}
+    if not inc:
+        return
+    # $inc can't be combined with a computed field, so the increments are $add in a pipeline update
+    users_col.update_one({"_id": user_id}, [
+        {"$set": {
+            f"usage_stats.{field}": {"$add": [{"$ifNull": [f"$usage_stats.{field}", 0]}, value]}
+            for field, value in inc.items()
+        }},
+        {"$set": {"usage_stats.avg_api_calls": average_api_calls()}},
+    ])
+
+
+def rebuild_usage_stats():
+    """
+    Recompute every user's usage_stats from usage_logs with $merge; users
+    without logs get EMPTY_USAGE. Usage writes that land during the rebuild
+    can be overwritten, so run it when ingestion is quiet.
+    """
+    now = datetime.utcnow()
+    db["usage_logs"].aggregate([
+        {"$group": {
+            "_id":           "$meta.user_id",
+            "count":         {"$sum": 1},
+            "api_calls":     {"$sum": "$metrics.api_calls"},
+            "storage_mb":    {"$sum": "$metrics.storage_mb"},
+            "read_ops":      {"$sum": "$metrics.breakdown.read_ops"},
+            "write_ops":     {"$sum": "$metrics.breakdown.write_ops"},
+            "delete_ops":    {"$sum": "$metrics.breakdown.delete_ops"},
+            "cache_hit_pct": {"$sum": "$metrics.breakdown.cache_hit_pct"},
+        }},
+        {"$project": {"_id": 1, "usage_stats": {
+            "count":         "$count",
+            **{field: f"${field}" for field in USAGE_SUMS},
+            "avg_api_calls": average_api_calls("$$ROOT"),
+            "rebuilt_at":    now,
+        }}},
+        {"$merge": {
+            "into":           "users",
+            "on":             "_id",
+            "whenMatched":    [{"$set": {"usage_stats": "$$new.usage_stats"}}],
+            "whenNotMatched": "discard",                 # logs of deleted users
+        }},
+    ])
+    emptied = users_col.update_many(
+        {"$or": [{"usage_stats.rebuilt_at": {"$lt": now}}, {"usage_stats.rebuilt_at": {"$exists": False}}]},
+        {"$set": {"usage_stats": {**EMPTY_USAGE, "rebuilt_at": now}}},
+    ).modified_count
+    with_usage = users_col.count_documents({"usage_stats.rebuilt_at": now, "usage_stats.count": {"$gt": 0}})
+    return {"rebuilt_at": now, "with_usage": with_usage, "without_usage": emptied}
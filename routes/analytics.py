@@ -1,23 +1,29 @@
+import os
+from datetime import datetime
 from flask import Blueprint, jsonify, request
-from bson import ObjectId
-from config import db
+from config import analytics_db, db
 from auth import analyst_or_admin
+from fanout import run_parallel
+from pagination import decode_cursor, encode_cursor, get_pagination, paginate
+from response_cache import cached
+from timestamps import time_bounds
+import rollups
 
 analytics_bp = Blueprint("analytics", __name__)
 
-users_col         = db["users"]
-activity_logs_col = db["activity_logs"]
-anomaly_flags_col = db["anomaly_flags"]
+# read-only aggregations — routed by MONGO_ANALYTICS_READ_PREFERENCE
+users_col         = analytics_db["users"]
+activity_logs_col = analytics_db["activity_logs"]
+anomaly_flags_col = analytics_db["anomaly_flags"]
+usage_col         = analytics_db["usage_logs"]
 
+# deadline for the sub-queries an endpoint runs in parallel (see fanout.py)
+ANALYTICS_TIMEOUT_MS = int(os.environ.get("ANALYTICS_QUERY_TIMEOUT_MS", 10000))
 
-def serialize_doc(doc):
-    if isinstance(doc, list):
-        return [serialize_doc(d) for d in doc]
-    if isinstance(doc, dict):
-        return {k: serialize_doc(v) for k, v in doc.items()}
-    if isinstance(doc, ObjectId):
-        return str(doc)
-    return doc
+# Each endpoint's pipeline is built by a plain function of the query args that
+# returns (pipeline, error), error being a (message, field, code) tuple. The
+# views here run them with pymongo; asgi.py runs the same pipelines with the
+# async driver.
 
 
 def err(msg, field=None, code=400):
@@ -27,6 +33,103 @@ def err(msg, field=None, code=400):
     return jsonify(body), code
 
 
+def run_pipelines(col, pipelines):
+    """Aggregate each {name: pipeline} on col in parallel, skipping None. Returns (results, errors)."""
+    tasks = {name: (lambda p=p: list(col.aggregate(p))) for name, p in pipelines.items() if p}
+    return run_parallel(tasks, ANALYTICS_TIMEOUT_MS)
+
+
+def results_body(pipelines, found, count_key):
+    """{threshold, <count_key>, results, buckets} from whichever sub-queries finished."""
+    body = {"threshold": pipelines["threshold"]}
+    if "results" in found:
+        body[count_key] = len(found["results"])
+        body["results"] = found["results"]
+    if "buckets" in found:
+        body["buckets"] = found["buckets"]
+    return body
+
+
+def partial_response(body, found, errors):
+    """200 with an "errors" map when some sub-queries failed (not cached); 504 when all of them did."""
+    if not errors:
+        return jsonify(body), 200
+    if not found:
+        return jsonify({"error": "Query failed or timed out", "errors": errors}), 504
+    response = jsonify({**body, "errors": errors})
+    response.headers["Cache-Control"] = "no-store"
+    return response, 200
+
+
+BUCKET_UNITS = {"hour", "day"}
+
+
+def time_range_stages(args, field="timestamp"):
+    """Leading $match stage for ?from=&to= or ?window= (see timestamps.py). Returns (stages, error)."""
+    bounds, error = time_bounds(args)
+    if error:
+        return None, error
+    return ([{"$match": {field: bounds}}] if bounds else []), None
+
+
+def bucket_unit(args):
+    """?bucket=hour|day for a per-window trend series. Returns (unit or None, error)."""
+    unit = args.get("bucket")
+    if unit and unit not in BUCKET_UNITS:
+        return None, ("bucket must be hour or day", "bucket", 422)
+    return unit, None
+
+
+def threshold_arg(args, default):
+    try:
+        threshold = int(args.get("threshold", default))
+    except ValueError:
+        return None, ("threshold must be an integer", "threshold", 422)
+    if threshold <= 0:
+        return None, ("threshold must be greater than 0", "threshold", 422)
+    return threshold, None
+
+
+def bucket_stages(unit, field, accumulators):
+    """Group into $dateTrunc buckets of unit, oldest first."""
+    return [
+        {"$group": {"_id": {"$dateTrunc": {"date": f"${field}", "unit": unit}}, **accumulators}},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "bucket": "$_id", **{k: 1 for k in accumulators}}},
+    ]
+
+
+# joins the owning user's email onto usage_logs rows grouped or keyed by user_id
+def lookup_user_email(local_field):
+    return {
+        "$lookup": {
+            "from":         "users",
+            "localField":   local_field,
+            "foreignField": "_id",
+            "pipeline":     [{"$project": {"_id": 0, "email": "$profile.email"}}],
+            "as":           "user",
+        }
+    }
+
+
+def usage_query(args, logs_pipeline, stats_pipeline):
+    """
+    All-time usage figures come from the users.usage_stats running totals (see
+    rollups.py); a ?from/to/window range needs the raw usage_logs. Returns
+    ({"collection", "pipeline"}, error).
+    """
+    if not any(args.get(arg) for arg in ("from", "to", "window")):
+        return {"collection": "users", "pipeline": stats_pipeline}, None
+    pipeline, error = logs_pipeline(args)
+    if error:
+        return None, error
+    return {"collection": "usage_logs", "pipeline": pipeline}, None
+
+
+# users that have at least one usage log — the predicate of the partial usage_stats index
+HAS_USAGE = {"$match": {"usage_stats.count": {"$gt": 0}}}
+
+
 # ---------------------------------------------------------------------------
 # DASHBOARD SUMMARY — single call for frontend overview page
 # ---------------------------------------------------------------------------
@@ -34,89 +137,87 @@ def err(msg, field=None, code=400):
 @analytics_bp.route("/dashboard/summary", methods=["GET"])
 @analyst_or_admin
 def dashboard_summary():
-    total_users    = users_col.count_documents({})
-    active_users   = users_col.count_documents({"subscription.status": "active"})
-    open_anomalies = anomaly_flags_col.count_documents({"resolved": False})
-    critical_count = anomaly_flags_col.count_documents({"severity": "critical", "resolved": False})
-
-    # activity in last 24h using string prefix match (timestamps stored as ISO strings)
-    from datetime import datetime, timedelta
-    cutoff = (datetime.utcnow() - timedelta(hours=24)).isoformat()
-    activity_24h = activity_logs_col.count_documents({"timestamp": {"$gte": cutoff}})
-
-    # tier breakdown via aggregation
-    tier_pipeline = [
-        {"$group": {"_id": "$subscription.tier", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-    ]
-    tier_results = list(users_col.aggregate(tier_pipeline))
-    tier_breakdown = {r["_id"]: r["count"] for r in tier_results if r["_id"]}
-
-    # churn risk breakdown
-    churn_pipeline = [
-        {"$group": {"_id": "$metadata.churn_risk", "count": {"$sum": 1}}},
-    ]
-    churn_results = list(users_col.aggregate(churn_pipeline))
-    churn_breakdown = {r["_id"]: r["count"] for r in churn_results if r["_id"]}
-
-    return jsonify({
-        "total_users":       total_users,
-        "active_users":      active_users,
-        "open_anomalies":    open_anomalies,
-        "critical_anomalies": critical_count,
-        "activity_last_24h": activity_24h,
-        "tier_breakdown":    tier_breakdown,
-        "churn_risk_breakdown": churn_breakdown,
-    }), 200
+    # one document read — see rollups.py for how the counters are maintained
+    fresh = request.args.get("fresh", "false").lower() == "true"
+    return jsonify(rollups.read_summary(fresh=fresh)), 200
 
 
 # ---------------------------------------------------------------------------
 # AVERAGE API CALLS PER USER
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/avg-api-calls", methods=["GET"])
-@analyst_or_admin
-def avg_api_calls_per_user():
-    pipeline = [
-        {"$unwind": "$usage_logs"},
+def avg_api_calls_pipeline(args):
+    time_match, error = time_range_stages(args)
+    if error:
+        return None, error
+
+    return time_match + [
         {
             "$group": {
-                "_id":             "$_id",
-                "email":           {"$first": "$profile.email"},
-                "subscription_tier": {"$first": "$subscription.tier"},
-                "avg_api_calls":   {"$avg": "$usage_logs.metrics.api_calls"},
-                "total_api_calls": {"$sum": "$usage_logs.metrics.api_calls"},
+                "_id":             "$meta.user_id",
+                "subscription_tier": {"$first": "$meta.tier"},
+                "avg_api_calls":   {"$avg": "$metrics.api_calls"},
+                "total_api_calls": {"$sum": "$metrics.api_calls"},
             }
         },
+        lookup_user_email("_id"),
         {
             "$project": {
-                "email":             1,
+                "email":             {"$first": "$user.email"},
                 "subscription_tier": 1,
                 "avg_api_calls":     {"$round": ["$avg_api_calls", 2]},
                 "total_api_calls":   1,
             }
         },
         {"$sort": {"avg_api_calls": -1}},
-    ]
-    results = list(users_col.aggregate(pipeline))
-    return jsonify(serialize_doc(results)), 200
+    ], None
+
+
+AVG_API_CALLS_STATS_PIPELINE = [
+    HAS_USAGE,
+    {"$sort": {"usage_stats.avg_api_calls": -1}},
+    {
+        "$project": {
+            "email":             "$profile.email",
+            "subscription_tier": "$subscription.tier",
+            "avg_api_calls":     "$usage_stats.avg_api_calls",
+            "total_api_calls":   "$usage_stats.api_calls",
+        }
+    },
+]
+
+
+def avg_api_calls_query(args):
+    return usage_query(args, avg_api_calls_pipeline, AVG_API_CALLS_STATS_PIPELINE)
+
+
+@analytics_bp.route("/analytics/avg-api-calls", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs", "users")
+def avg_api_calls_per_user():
+    query, error = avg_api_calls_query(request.args)
+    if error:
+        return err(*error)
+    results = list(analytics_db[query["collection"]].aggregate(query["pipeline"]))
+    return jsonify(results), 200
 
 
 # ---------------------------------------------------------------------------
 # AVERAGE API CALLS BY SUBSCRIPTION TIER
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/avg-api-calls-by-tier", methods=["GET"])
-@analyst_or_admin
-def avg_api_calls_by_tier():
-    pipeline = [
-        {"$unwind": "$usage_logs"},
+def avg_api_calls_by_tier_pipeline(args):
+    time_match, error = time_range_stages(args)
+    if error:
+        return None, error
+
+    return time_match + [
         {
             "$group": {
-                "_id":             "$subscription.tier",
-                "avg_api_calls":   {"$avg": "$usage_logs.metrics.api_calls"},
-                "total_api_calls": {"$sum": "$usage_logs.metrics.api_calls"},
-                "avg_storage_mb":  {"$avg": "$usage_logs.metrics.storage_mb"},
+                "_id":             "$meta.tier",
+                "avg_api_calls":   {"$avg": "$metrics.api_calls"},
+                "total_api_calls": {"$sum": "$metrics.api_calls"},
+                "avg_storage_mb":  {"$avg": "$metrics.storage_mb"},
             }
         },
         {
@@ -128,61 +229,121 @@ def avg_api_calls_by_tier():
             }
         },
         {"$sort": {"avg_api_calls": -1}},
-    ]
-    results = list(users_col.aggregate(pipeline))
-    return jsonify(serialize_doc(results)), 200
+    ], None
+
+
+# averages are per log, as on usage_logs: summed totals over summed counts
+AVG_API_CALLS_BY_TIER_STATS_PIPELINE = [
+    HAS_USAGE,
+    {
+        "$group": {
+            "_id":             "$subscription.tier",
+            "logs":            {"$sum": "$usage_stats.count"},
+            "total_api_calls": {"$sum": "$usage_stats.api_calls"},
+            "storage_mb":      {"$sum": "$usage_stats.storage_mb"},
+        }
+    },
+    {
+        "$project": {
+            "tier":            "$_id",
+            "avg_api_calls":   {"$round": [{"$divide": ["$total_api_calls", "$logs"]}, 2]},
+            "total_api_calls": 1,
+            "avg_storage_mb":  {"$round": [{"$divide": ["$storage_mb", "$logs"]}, 2]},
+        }
+    },
+    {"$sort": {"avg_api_calls": -1}},
+]
+
+
+def avg_api_calls_by_tier_query(args):
+    return usage_query(args, avg_api_calls_by_tier_pipeline, AVG_API_CALLS_BY_TIER_STATS_PIPELINE)
+
+
+@analytics_bp.route("/analytics/avg-api-calls-by-tier", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs")
+def avg_api_calls_by_tier():
+    query, error = avg_api_calls_by_tier_query(request.args)
+    if error:
+        return err(*error)
+    results = list(analytics_db[query["collection"]].aggregate(query["pipeline"]))
+    return jsonify(results), 200
 
 
 # ---------------------------------------------------------------------------
 # HIGH USAGE ANOMALY DETECTION
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/high-usage", methods=["GET"])
-@analyst_or_admin
-def high_usage_anomalies():
-    try:
-        threshold = int(request.args.get("threshold", 50000))
-    except ValueError:
-        return err("threshold must be an integer", "threshold", 422)
-    if threshold <= 0:
-        return err("threshold must be greater than 0", "threshold", 422)
-
-    pipeline = [
-        {"$unwind": "$usage_logs"},
-        {"$match": {"usage_logs.metrics.api_calls": {"$gt": threshold}}},
+def high_usage_pipelines(args):
+    """Returns ({"threshold", "results", "buckets"}, error) — buckets is None unless ?bucket= is given."""
+    threshold, error = threshold_arg(args, 50000)
+    if error:
+        return None, error
+    time_match, error = time_range_stages(args)
+    if error:
+        return None, error
+    bucket, error = bucket_unit(args)
+    if error:
+        return None, error
+
+    # the time bound leads so only that slice of the time-series buckets is unpacked
+    match   = time_match + [{"$match": {"metrics.api_calls": {"$gt": threshold}}}]
+    results = match + [
+        {"$sort": {"metrics.api_calls": -1}},
+        lookup_user_email("meta.user_id"),
         {
             "$project": {
-                "_id":              1,
-                "email":            "$profile.email",
-                "subscription_tier": "$subscription.tier",
-                "api_calls":        "$usage_logs.metrics.api_calls",
-                "endpoint":         "$usage_logs.request.endpoint",
-                "region":           "$usage_logs.request.region",
-                "timestamp":        "$usage_logs.timestamp",
+                "_id":              "$meta.user_id",
+                "email":            {"$first": "$user.email"},
+                "subscription_tier": "$meta.tier",
+                "api_calls":        "$metrics.api_calls",
+                "endpoint":         "$request.endpoint",
+                "region":           "$request.region",
+                "timestamp":        1,
             }
         },
-        {"$sort": {"api_calls": -1}},
     ]
-    results = list(users_col.aggregate(pipeline))
-    return jsonify({"threshold": threshold, "count": len(results), "results": serialize_doc(results)}), 200
+    buckets = None
+    if bucket:
+        buckets = match + bucket_stages(bucket, "timestamp", {
+            "count":     {"$sum": 1},
+            "users":     {"$addToSet": "$meta.user_id"},
+            "api_calls": {"$sum": "$metrics.api_calls"},
+        }) + [{"$set": {"users": {"$size": "$users"}}}]
+    return {"threshold": threshold, "results": results, "buckets": buckets}, None
+
+
+@analytics_bp.route("/analytics/high-usage", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs", "users")
+def high_usage_anomalies():
+    pipelines, error = high_usage_pipelines(request.args)
+    if error:
+        return err(*error)
+
+    found, errors = run_pipelines(usage_col, {"results": pipelines["results"], "buckets": pipelines["buckets"]})
+    return partial_response(results_body(pipelines, found, "count"), found, errors)
 
 
 # ---------------------------------------------------------------------------
 # FAILED LOGIN DETECTION — aggregation on activity_logs collection
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/failed-logins", methods=["GET"])
-@analyst_or_admin
-def detect_failed_logins():
-    try:
-        threshold = int(request.args.get("threshold", 3))
-    except ValueError:
-        return err("threshold must be an integer", "threshold", 422)
-    if threshold <= 0:
-        return err("threshold must be greater than 0", "threshold", 422)
-
-    pipeline = [
-        {"$match": {"action_type": "failed_login"}},
+def failed_logins_pipelines(args):
+    """Returns ({"threshold", "results", "buckets"}, error) — buckets is None unless ?bucket= is given."""
+    threshold, error = threshold_arg(args, 3)
+    if error:
+        return None, error
+    time_match, error = time_range_stages(args)
+    if error:
+        return None, error
+    bucket, error = bucket_unit(args)
+    if error:
+        return None, error
+
+    # action_type + timestamp lead so the (action_type, timestamp, _id) index bounds the scan
+    match   = [{"$match": {"action_type": "failed_login", **(time_match[0]["$match"] if time_match else {})}}]
+    results = match + [
         {
             "$group": {
                 "_id":          "$user_id",
@@ -194,104 +355,116 @@ def detect_failed_logins():
         {"$match": {"count": {"$gte": threshold}}},
         {"$sort": {"count": -1}},
     ]
-    results = list(activity_logs_col.aggregate(pipeline))
-    return jsonify({"threshold": threshold, "flagged_users": len(results), "results": serialize_doc(results)}), 200
+    buckets = None
+    if bucket:
+        buckets = match + bucket_stages(bucket, "timestamp", {
+            "count": {"$sum": 1},
+            "users": {"$addToSet": "$user_id"},
+        }) + [{"$set": {"users": {"$size": "$users"}}}]
+    return {"threshold": threshold, "results": results, "buckets": buckets}, None
+
+
+@analytics_bp.route("/analytics/failed-logins", methods=["GET"])
+@analyst_or_admin
+@cached("activity_logs")
+def detect_failed_logins():
+    pipelines, error = failed_logins_pipelines(request.args)
+    if error:
+        return err(*error)
+
+    found, errors = run_pipelines(activity_logs_col, {"results": pipelines["results"], "buckets": pipelines["buckets"]})
+    return partial_response(results_body(pipelines, found, "flagged_users"), found, errors)
 
 
 # ---------------------------------------------------------------------------
 # ANOMALY SUMMARY BY SEVERITY
 # ---------------------------------------------------------------------------
 
+ANOMALY_SUMMARY_PIPELINE = [
+    {
+        "$group": {
+            "_id":       "$severity",
+            "total":     {"$sum": 1},
+            "resolved":  {"$sum": {"$cond": ["$resolved", 1, 0]}},
+            "avg_score": {"$avg": "$anomaly_score"},
+        }
+    },
+    {
+        "$project": {
+            "severity":   "$_id",
+            "total":      1,
+            "resolved":   1,
+            "unresolved": {"$subtract": ["$total", "$resolved"]},
+            "avg_score":  {"$round": ["$avg_score", 2]},
+        }
+    },
+    {"$sort": {"total": -1}},
+]
+
+
 @analytics_bp.route("/analytics/anomaly-summary", methods=["GET"])
 @analyst_or_admin
+@cached("anomaly_flags")
 def anomaly_summary():
-    pipeline = [
-        {
-            "$group": {
-                "_id":       "$severity",
-                "total":     {"$sum": 1},
-                "resolved":  {"$sum": {"$cond": ["$resolved", 1, 0]}},
-                "avg_score": {"$avg": "$anomaly_score"},
-            }
-        },
-        {
-            "$project": {
-                "severity":   "$_id",
-                "total":      1,
-                "resolved":   1,
-                "unresolved": {"$subtract": ["$total", "$resolved"]},
-                "avg_score":  {"$round": ["$avg_score", 2]},
-            }
-        },
-        {"$sort": {"total": -1}},
-    ]
-    results = list(anomaly_flags_col.aggregate(pipeline))
-    return jsonify(serialize_doc(results)), 200
+    results = list(anomaly_flags_col.aggregate(ANOMALY_SUMMARY_PIPELINE))
+    return jsonify(results), 200
 
 
 # ---------------------------------------------------------------------------
 # SEARCH ACTIVITY LOGS — multi-param filter + pagination
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/search-logs", methods=["GET"])
-@analyst_or_admin
-def search_activity_logs():
+def search_logs_filter(args):
     query = {}
 
-    if request.args.get("action_types"):
-        types = [t.strip() for t in request.args.get("action_types").split(",")]
+    if args.get("action_types"):
+        types = [t.strip() for t in args.get("action_types").split(",")]
         query["action_type"] = {"$in": types}
-    if request.args.get("regions"):
-        regions = [r.strip() for r in request.args.get("regions").split(",")]
+    if args.get("regions"):
+        regions = [r.strip() for r in args.get("regions").split(",")]
         query["network.region"] = {"$in": regions}
-    if request.args.get("status_code"):
+    if args.get("status_code"):
         try:
-            query["performance.status_code"] = int(request.args.get("status_code"))
+            query["performance.status_code"] = int(args.get("status_code"))
         except ValueError:
-            return err("status_code must be an integer", "status_code", 422)
+            return None, ("status_code must be an integer", "status_code", 422)
+    return query, None
 
-    try:
-        page_num  = max(1, int(request.args.get("pn", 1)))
-        page_size = min(100, max(1, int(request.args.get("ps", 10))))
-    except ValueError:
-        page_num, page_size = 1, 10
 
-    skip  = (page_num - 1) * page_size
-    total = activity_logs_col.count_documents(query)
-    logs  = list(activity_logs_col.find(query).sort("timestamp", -1).skip(skip).limit(page_size))
+@analytics_bp.route("/analytics/search-logs", methods=["GET"])
+@analyst_or_admin
+def search_activity_logs():
+    query, error = search_logs_filter(request.args)
+    if error:
+        return err(*error)
 
-    return jsonify({
-        "total":    total,
-        "page":     page_num,
-        "per_page": page_size,
-        "logs":     serialize_doc(logs),
-    }), 200
+    logs, meta, error = paginate(activity_logs_col, query, "timestamp")
+    if error:
+        return error
+
+    return jsonify({**meta, "logs": logs}), 200
 
 
 # ---------------------------------------------------------------------------
 # GEO QUERY — find activity near a location using $geoNear
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/nearby-activity", methods=["GET"])
-@analyst_or_admin
-def nearby_activity():
+def nearby_activity_pipeline(args):
     try:
-        lng          = float(request.args.get("lng", -0.1278))
-        lat          = float(request.args.get("lat", 51.5074))
-        max_distance = int(request.args.get("max_distance", 5000000))
+        lng          = float(args.get("lng", -0.1278))
+        lat          = float(args.get("lat", 51.5074))
+        max_distance = int(args.get("max_distance", 5000000))
     except ValueError:
-        return err("lng and lat must be numbers, max_distance must be integer", code=422)
+        return None, ("lng and lat must be numbers, max_distance must be integer", None, 422)
 
     if not (-180 <= lng <= 180):
-        return err("lng must be between -180 and 180", "lng", 422)
+        return None, ("lng must be between -180 and 180", "lng", 422)
     if not (-90 <= lat <= 90):
-        return err("lat must be between -90 and 90", "lat", 422)
+        return None, ("lat must be between -90 and 90", "lat", 422)
     if max_distance <= 0:
-        return err("max_distance must be greater than 0", "max_distance", 422)
-
-    activity_logs_col.create_index([("network.location", "2dsphere")])
+        return None, ("max_distance must be greater than 0", "max_distance", 422)
 
-    pipeline = [
+    return [
         {
             "$geoNear": {
                 "near":          {"type": "Point", "coordinates": [lng, lat]},
@@ -311,80 +484,194 @@ def nearby_activity():
             }
         },
         {"$limit": 20},
-    ]
+    ], None
+
+
+@analytics_bp.route("/analytics/nearby-activity", methods=["GET"])
+@analyst_or_admin
+def nearby_activity():
+    pipeline, error = nearby_activity_pipeline(request.args)
+    if error:
+        return err(*error)
 
     results = list(activity_logs_col.aggregate(pipeline))
-    return jsonify({"count": len(results), "results": serialize_doc(results)}), 200
+    return jsonify({"count": len(results), "results": results}), 200
 
 
 # ---------------------------------------------------------------------------
-# USER RISK REPORT — $lookup cross-collection join (advanced DB technique)
+# USER RISK REPORT — anomaly-driven: group anomaly_flags by user, then $lookup
+#
+# The grouping reads only user_id/severity/resolved/anomaly_score, which the
+# anomaly_flags index covers, and only users that made it onto the page are
+# joined from `users`. ?severity= narrows the anomalies counted, ?tier= the
+# users. Pages are ordered (critical_count, unresolved_count) descending and
+# resumed with ?cursor=. ?materialized=true reads the user_risk_report
+# collection instead, which `flask refresh-risk-report` rebuilds with $merge.
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/user-risk-report", methods=["GET"])
-@analyst_or_admin
-def user_risk_report():
-    pipeline = [
+RISK_SEVERITIES = {"low", "medium", "high", "critical"}
+RISK_TIERS      = {"free", "pro", "enterprise"}
+RISK_SORT       = {"critical_count": -1, "unresolved_count": -1, "_id": 1}
+RISK_REPORT     = "user_risk_report"
+
+
+def risk_by_user_stages(severities=None):
+    """anomaly_flags -> one document per user with the report's counters, highest risk first."""
+    match = {"user_id": {"$ne": None}}
+    if severities:
+        match["severity"] = {"$in": severities}
+    return [
+        {"$match": match},
         {
-            "$lookup": {
-                "from":         "anomaly_flags",
-                "localField":   "_id",
-                "foreignField": "user_id",
-                "as":           "anomalies",
+            "$group": {
+                "_id":               "$user_id",
+                "total_anomalies":   {"$sum": 1},
+                "critical_count":    {"$sum": {"$cond": [{"$eq": ["$severity", "critical"]}, 1, 0]}},
+                "unresolved_count":  {"$sum": {"$cond": [{"$eq": ["$resolved", False]}, 1, 0]}},
+                "avg_anomaly_score": {"$avg": "$anomaly_score"},
             }
         },
+        {"$sort": RISK_SORT},
+    ]
+
+
+def lookup_risk_user(tier=None):
+    """Join the user's profile fields; users outside ?tier= (or deleted) are dropped."""
+    return [
         {
-            "$project": {
-                "email":          "$profile.email",
-                "tier":           "$subscription.tier",
-                "status":         "$subscription.status",
-                "churn_risk":     "$metadata.churn_risk",
-                "total_anomalies": {"$size": "$anomalies"},
-                "critical_count": {
-                    "$size": {
-                        "$filter": {
-                            "input": "$anomalies",
-                            "cond":  {"$eq": ["$$this.severity", "critical"]},
-                        }
-                    }
-                },
-                "unresolved_count": {
-                    "$size": {
-                        "$filter": {
-                            "input": "$anomalies",
-                            "cond":  {"$eq": ["$$this.resolved", False]},
-                        }
+            "$lookup": {
+                "from":         "users",
+                "localField":   "_id",
+                "foreignField": "_id",
+                "pipeline":     ([{"$match": {"subscription.tier": tier}}] if tier else []) + [{
+                    "$project": {
+                        "_id":        0,
+                        "email":      "$profile.email",
+                        "tier":       "$subscription.tier",
+                        "status":     "$subscription.status",
+                        "churn_risk": "$metadata.churn_risk",
                     }
-                },
-                "avg_anomaly_score": {
-                    "$round": [{"$avg": "$anomalies.anomaly_score"}, 3]
-                },
+                }],
+                "as":           "user",
             }
         },
-        {"$match": {"total_anomalies": {"$gt": 0}}},
-        {"$sort": {"critical_count": -1, "unresolved_count": -1}},
+        {"$match": {"user": {"$ne": []}}},
+    ]
+
+
+RISK_PROJECTION = {
+    "$project": {
+        "email":             {"$first": "$user.email"},
+        "tier":              {"$first": "$user.tier"},
+        "status":            {"$first": "$user.status"},
+        "churn_risk":        {"$first": "$user.churn_risk"},
+        "total_anomalies":   1,
+        "critical_count":    1,
+        "unresolved_count":  1,
+        "avg_anomaly_score": {"$round": ["$avg_anomaly_score", 3]},
+    }
+}
+
+
+def risk_cursor_match(cursor):
+    """$match resuming after the row a next_cursor was built from. Returns (stages, error)."""
+    if not cursor:
+        return [], None
+    try:
+        key = decode_cursor(cursor)
+        critical, unresolved = key["v"]
+    except (ValueError, KeyError, TypeError):
+        return None, ("Invalid cursor", "cursor", 422)
+    return [{"$match": {"$or": [
+        {"critical_count": {"$lt": critical}},
+        {"critical_count": critical, "unresolved_count": {"$lt": unresolved}},
+        {"critical_count": critical, "unresolved_count": unresolved, "_id": {"$gt": key["id"]}},
+    ]}}], None
+
+
+def user_risk_report_query(args):
+    """
+    ?severity=high,critical  ?tier=pro  ?limit= (max 100)  ?cursor=  ?materialized=true
+    Returns ({"collection", "pipeline", "page_size"}, error).
+    """
+    severities = [s.strip() for s in args.get("severity", "").split(",") if s.strip()]
+    if any(s not in RISK_SEVERITIES for s in severities):
+        return None, (f"severity must be one or more of: {', '.join(sorted(RISK_SEVERITIES))}", "severity", 422)
+    tier = args.get("tier")
+    if tier and tier not in RISK_TIERS:
+        return None, (f"tier must be one of: {', '.join(sorted(RISK_TIERS))}", "tier", 422)
+    materialized = args.get("materialized", "false").lower() == "true"
+    if materialized and severities:
+        return None, ("severity can't be combined with materialized=true", "severity", 422)
+    resume, error = risk_cursor_match(args.get("cursor"))
+    if error:
+        return None, error
+    _, page_size = get_pagination(args)
+
+    if materialized:
+        match    = [{"$match": {"tier": tier}}] if tier else []
+        pipeline = match + [{"$sort": RISK_SORT}] + resume + [{"$limit": page_size + 1}]
+        return {"collection": RISK_REPORT, "pipeline": pipeline, "page_size": page_size}, None
+
+    # $limit stops pulling rows through the $lookup once the page is full
+    pipeline = risk_by_user_stages(severities) + resume + lookup_risk_user(tier) + [
+        {"$limit": page_size + 1},
+        RISK_PROJECTION,
     ]
+    return {"collection": "anomaly_flags", "pipeline": pipeline, "page_size": page_size}, None
 
-    results = list(users_col.aggregate(pipeline))
-    return jsonify(serialize_doc(results)), 200
+
+def risk_report_page(rows, query):
+    """Drop the look-ahead row and build {per_page, count, next_cursor, results}."""
+    has_more = len(rows) > query["page_size"]
+    rows     = rows[:query["page_size"]]
+    cursor   = None
+    if has_more:
+        last   = rows[-1]
+        cursor = encode_cursor({"_id": last["_id"], "v": [last["critical_count"], last["unresolved_count"]]}, "v")
+    return {"per_page": query["page_size"], "count": len(rows), "next_cursor": cursor, "results": rows}
+
+
+def refresh_user_risk_report(database=db):
+    """Rebuild the user_risk_report collection with $merge and drop users no longer in it."""
+    refreshed_at = datetime.utcnow()
+    database["anomaly_flags"].aggregate(risk_by_user_stages() + lookup_risk_user() + [
+        RISK_PROJECTION,
+        {"$set": {"refreshed_at": refreshed_at}},
+        {"$merge": {"into": RISK_REPORT, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ])
+    removed = database[RISK_REPORT].delete_many({"refreshed_at": {"$lt": refreshed_at}}).deleted_count
+    return {"refreshed_at": refreshed_at, "users": database[RISK_REPORT].count_documents({}), "removed": removed}
+
+
+@analytics_bp.route("/analytics/user-risk-report", methods=["GET"])
+@analyst_or_admin
+@cached("users", "anomaly_flags")
+def user_risk_report():
+    query, error = user_risk_report_query(request.args)
+    if error:
+        return err(*error)
+    rows = list(analytics_db[query["collection"]].aggregate(query["pipeline"]))
+    return jsonify(risk_report_page(rows, query)), 200
 
 
 # ---------------------------------------------------------------------------
 # BREAKDOWN OF READ/WRITE/DELETE OPS — uses metrics.breakdown (4th level)
 # ---------------------------------------------------------------------------
 
-@analytics_bp.route("/analytics/ops-breakdown", methods=["GET"])
-@analyst_or_admin
-def ops_breakdown():
-    pipeline = [
-        {"$unwind": "$usage_logs"},
+def ops_breakdown_pipeline(args):
+    time_match, error = time_range_stages(args)
+    if error:
+        return None, error
+
+    return time_match + [
         {
             "$group": {
-                "_id":          "$subscription.tier",
-                "total_reads":  {"$sum": "$usage_logs.metrics.breakdown.read_ops"},
-                "total_writes": {"$sum": "$usage_logs.metrics.breakdown.write_ops"},
-                "total_deletes": {"$sum": "$usage_logs.metrics.breakdown.delete_ops"},
-                "avg_cache_hit": {"$avg": "$usage_logs.metrics.breakdown.cache_hit_pct"},
+                "_id":          "$meta.tier",
+                "total_reads":  {"$sum": "$metrics.breakdown.read_ops"},
+                "total_writes": {"$sum": "$metrics.breakdown.write_ops"},
+                "total_deletes": {"$sum": "$metrics.breakdown.delete_ops"},
+                "avg_cache_hit": {"$avg": "$metrics.breakdown.cache_hit_pct"},
             }
         },
         {
@@ -397,6 +684,44 @@ def ops_breakdown():
             }
         },
         {"$sort": {"total_reads": -1}},
-    ]
-    results = list(users_col.aggregate(pipeline))
-    return jsonify(serialize_doc(results)), 200
\ No newline at end of file
+    ], None
+
+
+OPS_BREAKDOWN_STATS_PIPELINE = [
+    HAS_USAGE,
+    {
+        "$group": {
+            "_id":           "$subscription.tier",
+            "logs":          {"$sum": "$usage_stats.count"},
+            "total_reads":   {"$sum": "$usage_stats.read_ops"},
+            "total_writes":  {"$sum": "$usage_stats.write_ops"},
+            "total_deletes": {"$sum": "$usage_stats.delete_ops"},
+            "cache_hit_pct": {"$sum": "$usage_stats.cache_hit_pct"},
+        }
+    },
+    {
+        "$project": {
+            "tier":          "$_id",
+            "total_reads":   1,
+            "total_writes":  1,
+            "total_deletes": 1,
+            "avg_cache_hit": {"$round": [{"$divide": ["$cache_hit_pct", "$logs"]}, 1]},
+        }
+    },
+    {"$sort": {"total_reads": -1}},
+]
+
+
+def ops_breakdown_query(args):
+    return usage_query(args, ops_breakdown_pipeline, OPS_BREAKDOWN_STATS_PIPELINE)
+
+
+@analytics_bp.route("/analytics/ops-breakdown", methods=["GET"])
+@analyst_or_admin
+@cached("usage_logs")
+def ops_breakdown():
+    query, error = ops_breakdown_query(request.args)
+    if error:
+        return err(*error)
+    results = list(analytics_db[query["collection"]].aggregate(query["pipeline"]))
+    return jsonify(results), 200
@@ -1,14 +1,24 @@
+import json
 import random
 import re
 import string
+import zlib
 from datetime import datetime
 
-import bcrypt
 from bson import ObjectId
-from flask import Blueprint, jsonify, request
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 
+import rollups
 from auth import admin_required, analyst_or_admin
 from config import db
+from indexes import USERS_TEXT_SEARCH
+from pagination import paginate
+from passwords import PasswordPoolBusy, hash_password
+from response_cache import invalidates
+from timestamps import time_bounds
+from write_behind import WRITE_BEHIND_ENABLED, activity_queue
 
 user_bp = Blueprint("users", __name__)
 
@@ -16,6 +26,7 @@ users_col         = db["users"]
 login_col         = db["login"]
 activity_logs_col = db["activity_logs"]
 anomaly_flags_col = db["anomaly_flags"]
+usage_col         = db["usage_logs"]          # time-series, meta = {user_id, tier}
 
 # ---------------------------------------------------------------------------
 # CONSTANTS — validation
@@ -29,6 +40,11 @@ VALID_ALERT_TYPES = {"threshold_breach", "security_event", "billing_alert", "per
 VALID_REGIONS     = {"eu-west", "us-east", "us-west", "ap-south", "ap-northeast", "sa-east", "af-south"}
 VALID_METHODS     = {"GET", "POST", "PUT", "DELETE", "PATCH"}
 
+# fields the dashboard rollup / users.usage_stats count — fetched as the 'before' side of updates/deletes
+USER_ROLLUP_FIELDS    = {"subscription.status": 1, "subscription.tier": 1, "metadata.churn_risk": 1}
+ANOMALY_ROLLUP_FIELDS = {"severity": 1, "resolved": 1}
+USAGE_STATS_FIELDS    = {"metrics.api_calls": 1, "metrics.storage_mb": 1, "metrics.breakdown": 1}
+
 REGION_COORDS = {
     "eu-west":      {"type": "Point", "coordinates": [-0.1278,    51.5074]},
     "us-east":      {"type": "Point", "coordinates": [-77.0369,   38.9072]},
@@ -48,18 +64,6 @@ def build_id_query(id):
     return {"_id": ObjectId(id)} if ObjectId.is_valid(id) else {"_id": id}
 
 
-def serialize_doc(doc):
-    if isinstance(doc, list):
-        return [serialize_doc(d) for d in doc]
-    if isinstance(doc, dict):
-        return {k: serialize_doc(v) for k, v in doc.items()}
-    if isinstance(doc, ObjectId):
-        return str(doc)
-    if isinstance(doc, datetime):
-        return doc.isoformat()
-    return doc
-
-
 def err(msg, field=None, code=400):
     body = {"error": msg}
     if field:
@@ -71,13 +75,54 @@ def validate_email(email):
     return bool(re.match(r"^[\w\.-]+@[\w\.-]+\.\w{2,}$", email))
 
 
-def get_pagination():
-    try:
-        page_num  = max(1, int(request.args.get("pn", 1)))
-        page_size = min(100, max(1, int(request.args.get("ps", 10))))
-    except ValueError:
-        page_num, page_size = 1, 10
-    return page_num, page_size
+SEARCH_FIELDS   = ("email", "last_name", "first_name")   # profile.<f> mirrored lowercase into search.<f>
+SEARCH_MAX_TERM = 100
+
+
+def search_fields(profile):
+    """Lowercase copies of the searchable profile fields, stored as users.search."""
+    return {f: (profile.get(f) or "").lower() for f in SEARCH_FIELDS}
+
+
+def prefix_match(term):
+    # anchored, escaped and case-sensitive against a lowercase copy, so the index gives tight bounds
+    return {"$regex": "^" + re.escape(term.lower())}
+
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def ndjson_response(cursor):
+    """Stream a cursor as NDJSON, gzip-compressed when the client accepts it."""
+    compress = "gzip" in request.headers.get("Accept-Encoding", "")
+    dumps    = current_app.json.dumps
+
+    def generate():
+        gz     = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = []
+        size   = 0
+        for doc in cursor.batch_size(EXPORT_BATCH_SIZE):
+            line = dumps(doc) + "\n"
+            buffer.append(line)
+            size += len(line)
+            if size >= EXPORT_CHUNK_SIZE:
+                chunk = "".join(buffer).encode("utf-8")
+                buffer, size = [], 0
+                chunk = gz.compress(chunk) if gz else chunk
+                if chunk:
+                    yield chunk
+        chunk = "".join(buffer).encode("utf-8")
+        if gz:
+            chunk = gz.compress(chunk) + gz.flush()
+        if chunk:
+            yield chunk
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
 
 # ---------------------------------------------------------------------------
@@ -86,6 +131,7 @@ def get_pagination():
 
 @user_bp.route("/users", methods=["POST"])
 @admin_required
+@invalidates("users")
 def create_user():
     data = request.get_json()
     if not data:
@@ -109,7 +155,10 @@ def create_user():
     if users_col.find_one({"profile.email": email}):
         return err("Email already exists", "email", 409)
 
-    hashed  = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    try:
+        hashed = hash_password(password)
+    except PasswordPoolBusy:
+        return err("Password hashing is busy, try again shortly", code=503)
     user_id = ObjectId()
 
     user_doc = {
@@ -118,9 +167,10 @@ def create_user():
             "first_name": first_name,
             "last_name":  last_name,
             "email":      email,
-            "created_at": datetime.utcnow().isoformat(),
+            "created_at": datetime.utcnow(),
             "last_login": None,
         },
+        "search": search_fields({"email": email, "first_name": first_name, "last_name": last_name}),
         "subscription": {
             "tier":           tier,
             "status":         "active",
@@ -148,7 +198,6 @@ def create_user():
                 },
             },
         },
-        "usage_logs": [],
         "api_keys":   [],
         "alerts":     [],
         "metadata": {
@@ -161,15 +210,13 @@ def create_user():
     }
 
     users_col.insert_one(user_doc)
+    rollups.record_user(after=user_doc)
     return jsonify({"message": "User created", "user_id": str(user_id)}), 201
 
 
 @user_bp.route("/users", methods=["GET"])
 @admin_required
 def get_users():
-    page_num, page_size = get_pagination()
-    skip = (page_num - 1) * page_size
-
     query = {}
     if request.args.get("tier"):
         query["subscription.tier"] = request.args.get("tier")
@@ -177,33 +224,43 @@ def get_users():
         query["subscription.status"] = request.args.get("status")
 
     projection = {"profile": 1, "subscription.tier": 1, "subscription.status": 1}
-    total = users_col.count_documents(query)
-    users = list(users_col.find(query, projection).skip(skip).limit(page_size))
+    users, meta, error = paginate(users_col, query, projection=projection)
+    if error:
+        return error
 
-    return jsonify({
-        "total":    total,
-        "page":     page_num,
-        "per_page": page_size,
-        "users":    serialize_doc(users),
-    }), 200
+    return jsonify({**meta, "users": users}), 200
 
 
 @user_bp.route("/users/search", methods=["GET"])
 @admin_required
 def search_users():
-    query = {}
-    if request.args.get("email"):
-        query["profile.email"] = {"$regex": request.args.get("email"), "$options": "i"}
+    query, sort_field = {}, None
+    for field in SEARCH_FIELDS:
+        term = request.args.get(field, "").strip()
+        if not term:
+            continue
+        if len(term) > SEARCH_MAX_TERM:
+            return err(f"{field} must be at most {SEARCH_MAX_TERM} characters", field, 422)
+        query[f"search.{field}"] = prefix_match(term)
+        sort_field = sort_field or f"search.{field}"      # first term in SEARCH_FIELDS order drives the index
+
+    q = request.args.get("q", "").strip()
+    if q:
+        if len(q) > SEARCH_MAX_TERM:
+            return err(f"q must be at most {SEARCH_MAX_TERM} characters", "q", 422)
+        if USERS_TEXT_SEARCH:
+            query["$text"] = {"$search": q}
+        else:
+            query["$or"] = [{f"search.{f}": prefix_match(q)} for f in SEARCH_FIELDS]
+        # q alone: page in search.email order, which its (search.email, _id) index supplies
+        sort_field = sort_field or f"search.{SEARCH_FIELDS[0]}"
+
     if request.args.get("tier"):
         query["subscription.tier"] = {"$in": request.args.get("tier").split(",")}
     if request.args.get("status"):
         query["subscription.status"] = request.args.get("status")
     if request.args.get("churn_risk"):
         query["metadata.churn_risk"] = request.args.get("churn_risk")
-    if request.args.get("first_name"):
-        query["profile.first_name"] = {"$regex": request.args.get("first_name"), "$options": "i"}
-    if request.args.get("last_name"):
-        query["profile.last_name"] = {"$regex": request.args.get("last_name"), "$options": "i"}
 
     if not query:
         return err("Provide at least one search parameter")
@@ -214,8 +271,15 @@ def search_users():
         "subscription.status": 1,
         "metadata.churn_risk": 1,
     }
-    users = list(users_col.find(query, projection))
-    return jsonify({"count": len(users), "users": serialize_doc(users)}), 200
+    if sort_field:
+        projection[sort_field] = 1                         # needed for the next_cursor
+    users, meta, error = paginate(users_col, query, sort_field, projection, direction=1)
+    if error:
+        return error
+
+    for user in users:
+        user.pop("search", None)
+    return jsonify({**meta, "count": len(users), "users": users}), 200
 
 
 @user_bp.route("/users/<string:id>", methods=["GET"])
@@ -224,11 +288,12 @@ def get_one_user(id):
     user = users_col.find_one(build_id_query(id))
     if user is None:
         return err("User not found", code=404)
-    return jsonify(serialize_doc(user)), 200
+    return jsonify(user), 200
 
 
 @user_bp.route("/users/<string:id>", methods=["PUT"])
 @admin_required
+@invalidates("users", "usage_logs")
 def update_user(id):
     data = request.get_json() or {}
     fields = {}
@@ -241,6 +306,9 @@ def update_user(id):
         fields["profile.first_name"] = data["first_name"].strip()
     if "last_name" in data:
         fields["profile.last_name"] = data["last_name"].strip()
+    for f in SEARCH_FIELDS:
+        if f"profile.{f}" in fields:
+            fields[f"search.{f}"] = fields[f"profile.{f}"].lower()
     if "subscription_tier" in data:
         if data["subscription_tier"] not in VALID_TIERS:
             return err(f"tier must be one of: {', '.join(sorted(VALID_TIERS))}", "subscription_tier", 422)
@@ -257,29 +325,43 @@ def update_user(id):
     if not fields:
         return err("No valid fields provided to update")
 
-    result = users_col.update_one(build_id_query(id), {"$set": fields})
-    if result.matched_count == 0:
+    before = users_col.find_one_and_update(
+        build_id_query(id), {"$set": fields},
+        projection=USER_ROLLUP_FIELDS, return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
         return err("User not found", code=404)
+    rollups.record_user(before, rollups.apply_set(before, fields))
+
+    if "subscription.tier" in fields:
+        usage_col.update_many(
+            {"meta.user_id": build_id_query(id)["_id"]},
+            {"$set": {"meta.tier": fields["subscription.tier"]}},
+        )
 
     return jsonify({"message": "User updated"}), 200
 
 
 @user_bp.route("/users/<string:id>", methods=["DELETE"])
 @admin_required
+@invalidates("users", "usage_logs")
 def delete_user(id):
-    result = users_col.delete_one(build_id_query(id))
-    if result.deleted_count == 0:
+    before = users_col.find_one_and_delete(build_id_query(id), projection=USER_ROLLUP_FIELDS)
+    if before is None:
         return err("User not found", code=404)
+    rollups.record_user(before=before)
     login_col.delete_one({"user_id": id})
+    usage_col.delete_many({"meta.user_id": build_id_query(id)["_id"]})
     return jsonify({"message": "User deleted"}), 200
 
 
 # ---------------------------------------------------------------------------
-# USAGE LOGS — sub-documents (4-level nesting via metrics.breakdown)
+# USAGE LOGS — usage_logs time-series collection (4-level nesting via metrics.breakdown)
 # ---------------------------------------------------------------------------
 
 @user_bp.route("/users/<string:id>/usage", methods=["POST"])
 @admin_required
+@invalidates("usage_logs")
 def add_usage_log(id):
     data = request.get_json() or {}
 
@@ -307,9 +389,17 @@ def add_usage_log(id):
     if method not in VALID_METHODS:
         return err(f"method must be one of: {', '.join(VALID_METHODS)}", "method", 422)
 
+    user = users_col.find_one(build_id_query(id), {"subscription.tier": 1})
+    if user is None:
+        return err("User not found", code=404)
+
     log = {
         "_id":       ObjectId(),
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),             # time-series timeField must be a BSON date
+        "meta": {
+            "user_id": user["_id"],
+            "tier":    user.get("subscription", {}).get("tier"),
+        },
         "metrics": {
             "api_calls":       api_calls,
             "storage_mb":      storage_mb,
@@ -332,36 +422,28 @@ def add_usage_log(id):
         "location": REGION_COORDS.get(region, REGION_COORDS["eu-west"]),
     }
 
-    result = users_col.update_one(build_id_query(id), {"$push": {"usage_logs": log}})
-    if result.matched_count == 0:
-        return err("User not found", code=404)
-
+    usage_col.insert_one(log)
+    rollups.record_usage(user["_id"], after=log)
     return jsonify({"message": "Usage log added", "log_id": str(log["_id"])}), 201
 
 
 @user_bp.route("/users/<string:id>/usage", methods=["GET"])
 @analyst_or_admin
 def get_usage_logs(id):
-    user = users_col.find_one(build_id_query(id))
+    user = users_col.find_one(build_id_query(id), {"_id": 1})
     if user is None:
         return err("User not found", code=404)
 
-    logs      = user.get("usage_logs", [])
-    page_num, page_size = get_pagination()
-    total     = len(logs)
-    start     = (page_num - 1) * page_size
-    paginated = logs[start: start + page_size]
+    logs, meta, error = paginate(usage_col, {"meta.user_id": user["_id"]}, "timestamp")
+    if error:
+        return error
 
-    return jsonify({
-        "total":    total,
-        "page":     page_num,
-        "per_page": page_size,
-        "logs":     serialize_doc(paginated),
-    }), 200
+    return jsonify({**meta, "logs": logs}), 200
 
 
 @user_bp.route("/users/<string:user_id>/usage/<string:log_id>", methods=["PUT"])
 @admin_required
+@invalidates("usage_logs")
 def update_usage_log(user_id, log_id):
     data   = request.get_json() or {}
     fields = {}
@@ -373,7 +455,7 @@ def update_usage_log(user_id, log_id):
             return err("api_calls must be an integer", "api_calls", 422)
         if v <= 0:
             return err("api_calls must be greater than 0", "api_calls", 422)
-        fields["usage_logs.$.metrics.api_calls"] = v
+        fields["metrics.api_calls"] = v
 
     if "storage_mb" in data:
         try:
@@ -382,35 +464,35 @@ def update_usage_log(user_id, log_id):
             return err("storage_mb must be a number", "storage_mb", 422)
         if v <= 0:
             return err("storage_mb must be greater than 0", "storage_mb", 422)
-        fields["usage_logs.$.metrics.storage_mb"] = v
+        fields["metrics.storage_mb"] = v
 
     if "endpoint" in data:
-        fields["usage_logs.$.request.endpoint"] = data["endpoint"]
+        fields["request.endpoint"] = data["endpoint"]
 
     if not fields:
         return err("No valid fields provided to update")
 
     log_oid = ObjectId(log_id) if ObjectId.is_valid(log_id) else log_id
-    result  = users_col.update_one(
-        {**build_id_query(user_id), "usage_logs._id": log_oid},
-        {"$set": fields},
-    )
-    if result.matched_count == 0:
+    query   = {"_id": log_oid, "meta.user_id": build_id_query(user_id)["_id"]}
+    # time-series collections have no findAndModify, so the 'before' side is read first
+    before  = usage_col.find_one(query, USAGE_STATS_FIELDS)
+    if before is None or usage_col.update_one(query, {"$set": fields}).matched_count == 0:
         return err("User or usage log not found", code=404)
+    rollups.record_usage(query["meta.user_id"], before, rollups.apply_set(before, fields))
 
     return jsonify({"message": "Usage log updated"}), 200
 
 
 @user_bp.route("/users/<string:user_id>/usage/<string:log_id>", methods=["DELETE"])
 @admin_required
+@invalidates("usage_logs")
 def delete_usage_log(user_id, log_id):
     log_oid = ObjectId(log_id) if ObjectId.is_valid(log_id) else log_id
-    result  = users_col.update_one(
-        build_id_query(user_id),
-        {"$pull": {"usage_logs": {"_id": log_oid}}},
-    )
-    if result.matched_count == 0:
-        return err("User not found", code=404)
+    query   = {"_id": log_oid, "meta.user_id": build_id_query(user_id)["_id"]}
+    before  = usage_col.find_one(query, USAGE_STATS_FIELDS)
+    if before is None or usage_col.delete_one(query).deleted_count == 0:
+        return err("User or usage log not found", code=404)
+    rollups.record_usage(query["meta.user_id"], before=before)
     return jsonify({"message": "Usage log deleted"}), 200
 
 
@@ -441,7 +523,7 @@ def add_api_key(id):
     key = {
         "_id":        ObjectId(),
         "key_prefix": f"sk_{env}_{rand_suffix}",
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": datetime.utcnow(),
         "last_used":  None,
         "revoked":    False,
         "permissions": permissions,
@@ -457,7 +539,7 @@ def get_api_keys(id):
     user = users_col.find_one(build_id_query(id))
     if user is None:
         return err("User not found", code=404)
-    return jsonify(serialize_doc(user.get("api_keys", []))), 200
+    return jsonify(user.get("api_keys", [])), 200
 
 
 @user_bp.route("/users/<string:user_id>/api-keys/<string:key_id>/revoke", methods=["PUT"])
@@ -510,7 +592,7 @@ def add_alert(id):
         "alert_type":   alert_type,
         "message":      message,
         "severity":     severity,
-        "triggered_at": datetime.utcnow().isoformat(),
+        "triggered_at": datetime.utcnow(),
         "acknowledged": False,
     }
 
@@ -527,7 +609,7 @@ def get_alerts(id):
     user = users_col.find_one(build_id_query(id))
     if user is None:
         return err("User not found", code=404)
-    return jsonify(serialize_doc(user.get("alerts", []))), 200
+    return jsonify(user.get("alerts", [])), 200
 
 
 @user_bp.route("/users/<string:user_id>/alerts/<string:alert_id>/acknowledge", methods=["PUT"])
@@ -560,33 +642,42 @@ def delete_alert(user_id, alert_id):
 # ACTIVITY LOGS — standalone collection
 # ---------------------------------------------------------------------------
 
-@user_bp.route("/activity-logs", methods=["POST"])
-@admin_required
-def create_activity_log():
-    data        = request.get_json() or {}
+BULK_MAX_ITEMS  = 10_000
+BULK_CHUNK_SIZE = 1000
+
+
+def build_activity_log(data):
+    """
+    Validate one activity log payload. Returns (log, error) where error is an
+    (message, field, code) tuple suitable for err(*error).
+    """
+    if not isinstance(data, dict):
+        return None, ("activity log must be a JSON object", None, 400)
+
     user_id     = data.get("user_id", "")
-    action_type = data.get("action_type", "").strip()
+    action_type = data.get("action_type", "")
 
     if not user_id:
-        return err("user_id is required", "user_id")
-    if not action_type:
-        return err("action_type is required", "action_type")
+        return None, ("user_id is required", "user_id", 400)
+    if not isinstance(action_type, str) or not action_type.strip():
+        return None, ("action_type is required", "action_type", 400)
+    action_type = action_type.strip()
 
     region = data.get("region", "eu-west")
     if region not in VALID_REGIONS:
-        return err(f"region must be one of: {', '.join(sorted(VALID_REGIONS))}", "region", 422)
+        return None, (f"region must be one of: {', '.join(sorted(VALID_REGIONS))}", "region", 422)
 
     try:
         response_time = int(data.get("response_time_ms", 200))
         status_code   = int(data.get("status_code", 200))
         bytes_tx      = int(data.get("bytes_transferred", 0))
     except (ValueError, TypeError):
-        return err("response_time_ms, status_code, bytes_transferred must be integers", code=422)
+        return None, ("response_time_ms, status_code, bytes_transferred must be integers", None, 422)
 
     if response_time < 0:
-        return err("response_time_ms must be >= 0", "response_time_ms", 422)
+        return None, ("response_time_ms must be >= 0", "response_time_ms", 422)
     if status_code < 100 or status_code > 599:
-        return err("status_code must be a valid HTTP status (100-599)", "status_code", 422)
+        return None, ("status_code must be a valid HTTP status (100-599)", "status_code", 422)
 
     log = {
         "user_id":     ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id,
@@ -608,51 +699,157 @@ def create_activity_log():
             "status_code":       status_code,
             "bytes_transferred": bytes_tx,
         },
-        "timestamp":  datetime.utcnow().isoformat(),
+        "timestamp":  datetime.utcnow(),
         "session_id": data.get("session_id", ""),
     }
+    return log, None
+
+
+@user_bp.route("/activity-logs", methods=["POST"])
+@admin_required
+@invalidates("activity_logs")
+def create_activity_log():
+    log, error = build_activity_log(request.get_json() or {})
+    if error:
+        return err(*error)
+
+    if WRITE_BEHIND_ENABLED:
+        if not activity_queue.put(log):
+            body, code = err("Ingestion queue is full, retry shortly", code=429)
+            return body, code, {"Retry-After": "1"}
+        return jsonify({"message": "Activity log queued", "log_id": str(log["_id"])}), 202
 
     result = activity_logs_col.insert_one(log)
+    rollups.record_activity([log["timestamp"]])
     return jsonify({"message": "Activity log created", "log_id": str(result.inserted_id)}), 201
 
 
-@user_bp.route("/activity-logs", methods=["GET"])
-@analyst_or_admin
-def get_activity_logs():
-    page_num, page_size = get_pagination()
-    skip = (page_num - 1) * page_size
+def read_bulk_items():
+    """Parse a JSON array or NDJSON body. Returns (items, parse_errors, error)."""
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        items, parse_errors = [], []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                parse_errors.append(len(items))
+                items.append(None)
+        return items, parse_errors, None
 
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        return None, None, err("Body must be a JSON array or NDJSON (Content-Type: application/x-ndjson)")
+    return data, [], None
+
+
+@user_bp.route("/activity-logs/bulk", methods=["POST"])
+@admin_required
+@invalidates("activity_logs")
+def bulk_create_activity_logs():
+    items, parse_errors, error = read_bulk_items()
+    if error:
+        return error
+    if not items:
+        return err("No activity logs provided")
+    if len(items) > BULK_MAX_ITEMS:
+        return err(f"At most {BULK_MAX_ITEMS} activity logs per request", code=413)
+
+    errors  = [{"index": i, "error": "Invalid JSON"} for i in parse_errors]
+    skip    = set(parse_errors)
+    pending = []                          # (original index, document)
+    for i, data in enumerate(items):
+        if i in skip:
+            continue
+        log, item_error = build_activity_log(data)
+        if item_error:
+            message, field, _ = item_error
+            errors.append({"index": i, "error": message, **({"field": field} if field else {})})
+        else:
+            pending.append((i, log))
+
+    inserted = 0
+    for start in range(0, len(pending), BULK_CHUNK_SIZE):
+        chunk  = pending[start: start + BULK_CHUNK_SIZE]
+        failed = set()
+        try:
+            result    = activity_logs_col.insert_many([log for _, log in chunk], ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted += e.details.get("nInserted", 0)
+            for write_error in e.details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                errors.append({"index": chunk[write_error["index"]][0], "error": write_error.get("errmsg", "Write failed")})
+        rollups.record_activity([log["timestamp"] for n, (_, log) in enumerate(chunk) if n not in failed])
+
+    errors.sort(key=lambda e: e["index"])
+    return jsonify({
+        "message":  "Activity logs processed",
+        "received": len(items),
+        "inserted": inserted,
+        "failed":   len(errors),
+        "errors":   errors,
+    }), 201 if not errors else 207
+
+
+def activity_log_filters(args):
+    """
+    Filters shared by the activity log listing and export (and the async app).
+    Returns (query, error) where error is a (message, field, code) tuple.
+    """
     query = {}
-    if request.args.get("user_id"):
-        uid = request.args.get("user_id")
+    if args.get("user_id"):
+        uid = args.get("user_id")
         query["user_id"] = ObjectId(uid) if ObjectId.is_valid(uid) else uid
-    if request.args.get("action_type"):
-        query["action_type"] = request.args.get("action_type")
-    if request.args.get("region"):
-        query["network.region"] = request.args.get("region")
-    if request.args.get("status_code"):
+    if args.get("action_type"):
+        query["action_type"] = args.get("action_type")
+    if args.get("region"):
+        query["network.region"] = args.get("region")
+    if args.get("status_code"):
         try:
-            query["performance.status_code"] = int(request.args.get("status_code"))
+            query["performance.status_code"] = int(args.get("status_code"))
         except ValueError:
-            return err("status_code must be an integer", "status_code", 422)
+            return None, ("status_code must be an integer", "status_code", 422)
 
-    date_filter = {}
-    if request.args.get("from"):
-        date_filter["$gte"] = request.args.get("from")
-    if request.args.get("to"):
-        date_filter["$lte"] = request.args.get("to")
-    if date_filter:
-        query["timestamp"] = date_filter
+    bounds, error = time_bounds(args)
+    if error:
+        return None, error
+    if bounds:
+        query["timestamp"] = bounds
 
-    total = activity_logs_col.count_documents(query)
-    logs  = list(activity_logs_col.find(query).sort("timestamp", -1).skip(skip).limit(page_size))
+    return query, None
+
+
+def build_activity_log_query():
+    """activity_log_filters() for the current request. Returns (query, error response)."""
+    query, error = activity_log_filters(request.args)
+    if error:
+        return None, err(*error)
+    return query, None
 
-    return jsonify({
-        "total":    total,
-        "page":     page_num,
-        "per_page": page_size,
-        "logs":     serialize_doc(logs),
-    }), 200
+
+@user_bp.route("/activity-logs", methods=["GET"])
+@analyst_or_admin
+def get_activity_logs():
+    query, error = build_activity_log_query()
+    if error:
+        return error
+
+    logs, meta, error = paginate(activity_logs_col, query, "timestamp")
+    if error:
+        return error
+
+    return jsonify({**meta, "logs": logs}), 200
+
+
+@user_bp.route("/activity-logs/export", methods=["GET"])
+@analyst_or_admin
+def export_activity_logs():
+    query, error = build_activity_log_query()
+    if error:
+        return error
+    return ndjson_response(activity_logs_col.find(query).sort([("timestamp", -1), ("_id", -1)]))
 
 
 @user_bp.route("/activity-logs/<string:id>", methods=["GET"])
@@ -661,11 +858,12 @@ def get_activity_log(id):
     log = activity_logs_col.find_one(build_id_query(id))
     if log is None:
         return err("Activity log not found", code=404)
-    return jsonify(serialize_doc(log)), 200
+    return jsonify(log), 200
 
 
 @user_bp.route("/activity-logs/<string:id>", methods=["PUT"])
 @admin_required
+@invalidates("activity_logs")
 def update_activity_log(id):
     data   = request.get_json() or {}
     fields = {}
@@ -701,10 +899,12 @@ def update_activity_log(id):
 
 @user_bp.route("/activity-logs/<string:id>", methods=["DELETE"])
 @admin_required
+@invalidates("activity_logs")
 def delete_activity_log(id):
-    result = activity_logs_col.delete_one(build_id_query(id))
-    if result.deleted_count == 0:
+    before = activity_logs_col.find_one_and_delete(build_id_query(id), projection={"timestamp": 1})
+    if before is None:
         return err("Activity log not found", code=404)
+    rollups.record_activity([before.get("timestamp")], sign=-1)
     return jsonify({"message": "Activity log deleted"}), 200
 
 
@@ -714,6 +914,7 @@ def delete_activity_log(id):
 
 @user_bp.route("/anomaly-flags", methods=["POST"])
 @admin_required
+@invalidates("anomaly_flags")
 def create_anomaly_flag():
     data    = request.get_json() or {}
     user_id = data.get("user_id", "")
@@ -746,7 +947,7 @@ def create_anomaly_flag():
         "anomaly_score": anomaly_score,
         "severity":   severity,
         "category":   category,
-        "detected_at": datetime.utcnow().isoformat(),
+        "detected_at": datetime.utcnow(),
         "resolved":   False,
         "resolution_logs": [],
         "evidence": {
@@ -764,34 +965,47 @@ def create_anomaly_flag():
     }
 
     result = anomaly_flags_col.insert_one(flag)
+    rollups.record_anomaly(after=flag)
     return jsonify({"message": "Anomaly flag created", "flag_id": str(result.inserted_id)}), 201
 
 
-@user_bp.route("/anomaly-flags", methods=["GET"])
-@analyst_or_admin
-def get_anomaly_flags():
-    page_num, page_size = get_pagination()
-    skip = (page_num - 1) * page_size
-
+def build_anomaly_flag_query():
+    """Filters shared by the anomaly flag listing and export. Returns (query, error)."""
     query = {}
     if request.args.get("severity"):
         if request.args.get("severity") not in VALID_SEVERITIES:
-            return err(f"severity must be one of: {', '.join(sorted(VALID_SEVERITIES))}", "severity", 422)
+            return None, err(f"severity must be one of: {', '.join(sorted(VALID_SEVERITIES))}", "severity", 422)
         query["severity"] = request.args.get("severity")
     if request.args.get("category"):
         query["category"] = request.args.get("category")
     if request.args.get("resolved"):
         query["resolved"] = request.args.get("resolved").lower() == "true"
+    if request.args.get("source"):
+        query["source"] = request.args.get("source")
+    return query, None
 
-    total = anomaly_flags_col.count_documents(query)
-    flags = list(anomaly_flags_col.find(query).sort("detected_at", -1).skip(skip).limit(page_size))
 
-    return jsonify({
-        "total":    total,
-        "page":     page_num,
-        "per_page": page_size,
-        "flags":    serialize_doc(flags),
-    }), 200
+@user_bp.route("/anomaly-flags", methods=["GET"])
+@analyst_or_admin
+def get_anomaly_flags():
+    query, error = build_anomaly_flag_query()
+    if error:
+        return error
+
+    flags, meta, error = paginate(anomaly_flags_col, query, "detected_at")
+    if error:
+        return error
+
+    return jsonify({**meta, "flags": flags}), 200
+
+
+@user_bp.route("/anomaly-flags/export", methods=["GET"])
+@analyst_or_admin
+def export_anomaly_flags():
+    query, error = build_anomaly_flag_query()
+    if error:
+        return error
+    return ndjson_response(anomaly_flags_col.find(query).sort([("detected_at", -1), ("_id", -1)]))
 
 
 @user_bp.route("/anomaly-flags/<string:id>", methods=["GET"])
@@ -800,11 +1014,12 @@ def get_anomaly_flag(id):
     flag = anomaly_flags_col.find_one(build_id_query(id))
     if flag is None:
         return err("Anomaly flag not found", code=404)
-    return jsonify(serialize_doc(flag)), 200
+    return jsonify(flag), 200
 
 
 @user_bp.route("/anomaly-flags/<string:id>", methods=["PUT"])
 @admin_required
+@invalidates("anomaly_flags")
 def update_anomaly_flag(id):
     data   = request.get_json() or {}
     fields = {}
@@ -827,24 +1042,31 @@ def update_anomaly_flag(id):
     if not fields:
         return err("No valid fields provided to update")
 
-    result = anomaly_flags_col.update_one(build_id_query(id), {"$set": fields})
-    if result.matched_count == 0:
+    before = anomaly_flags_col.find_one_and_update(
+        build_id_query(id), {"$set": fields},
+        projection=ANOMALY_ROLLUP_FIELDS, return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
         return err("Anomaly flag not found", code=404)
+    rollups.record_anomaly(before, rollups.apply_set(before, fields))
 
     return jsonify({"message": "Anomaly flag updated"}), 200
 
 
 @user_bp.route("/anomaly-flags/<string:id>", methods=["DELETE"])
 @admin_required
+@invalidates("anomaly_flags")
 def delete_anomaly_flag(id):
-    result = anomaly_flags_col.delete_one(build_id_query(id))
-    if result.deleted_count == 0:
+    before = anomaly_flags_col.find_one_and_delete(build_id_query(id), projection=ANOMALY_ROLLUP_FIELDS)
+    if before is None:
         return err("Anomaly flag not found", code=404)
+    rollups.record_anomaly(before=before)
     return jsonify({"message": "Anomaly flag deleted"}), 200
 
 
 @user_bp.route("/anomaly-flags/<string:id>/resolve", methods=["POST"])
 @analyst_or_admin
+@invalidates("anomaly_flags")
 def add_resolution_log(id):
     data = request.get_json() or {}
     note = data.get("note", "").strip()
@@ -861,24 +1083,27 @@ def add_resolution_log(id):
         "admin_email":  data.get("admin_email", ""),
         "note":         note,
         "action_taken": action,
-        "timestamp":    datetime.utcnow().isoformat(),
+        "timestamp":    datetime.utcnow(),
     }
 
-    result = anomaly_flags_col.update_one(
+    before = anomaly_flags_col.find_one_and_update(
         build_id_query(id),
         {
             "$push": {"resolution_logs": resolution},
             "$set":  {"resolved": True},
         },
+        projection=ANOMALY_ROLLUP_FIELDS, return_document=ReturnDocument.BEFORE,
     )
-    if result.matched_count == 0:
+    if before is None:
         return err("Anomaly flag not found", code=404)
+    rollups.record_anomaly(before, rollups.apply_set(before, {"resolved": True}))
 
     return jsonify({"message": "Resolution log added", "resolution_id": str(resolution["_id"])}), 201
 
 
 @user_bp.route("/anomaly-flags/<string:flag_id>/resolve/<string:res_id>", methods=["DELETE"])
 @admin_required
+@invalidates("anomaly_flags")
 def delete_resolution_log(flag_id, res_id):
     res_oid = ObjectId(res_id) if ObjectId.is_valid(res_id) else res_id
     result  = anomaly_flags_col.update_one(
@@ -1,10 +1,18 @@
+import argparse
+import multiprocessing
+import os
 import random
 import bcrypt
 import string
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from bson import ObjectId
 from pymongo import MongoClient
 
+from indexes import ensure_collections
+from passwords import BCRYPT_ROUNDS
+
 # ---------------------------------------------------------------------------
 # CONFIG
 # ---------------------------------------------------------------------------
@@ -17,20 +25,10 @@ API_KEYS_PER_USER           = (1, 3)
 ALERTS_PER_USER             = (1, 3)
 RESOLUTION_LOGS_PER_ANOMALY = (1, 3)
 
-client = MongoClient("mongodb://localhost:27017/")
-db     = client["saas_monitoring"]
-
-users_col         = db["users"]
-login_col         = db["login"]
-activity_logs_col = db["activity_logs"]
-anomaly_flags_col = db["anomaly_flags"]
+MONGO_URI     = "mongodb://localhost:27017/"
+DATABASE_NAME = "saas_monitoring"
 
-print("Dropping old collections...")
-users_col.drop()
-login_col.drop()
-activity_logs_col.drop()
-anomaly_flags_col.drop()
-print("Collections dropped. Seeding fresh data...\n")
+SEEDED_COLLECTIONS = ["users", "login", "activity_logs", "anomaly_flags", "usage_logs"]
 
 # ---------------------------------------------------------------------------
 # REFERENCE DATA
@@ -144,7 +142,8 @@ def rand_str(length=12):
 
 
 def hash_password(raw="password123"):
-    return bcrypt.hashpw(raw.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    # same BCRYPT_ROUNDS cost as the API, so seeded operators aren't rehashed on first login
+    return bcrypt.hashpw(raw.encode("utf-8"), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
 
 
 # ---------------------------------------------------------------------------
@@ -229,7 +228,7 @@ def generate_resolution_logs(admin_ids, admin_emails):
 
 
 # ---------------------------------------------------------------------------
-# SEED OPERATORS — admin + analyst accounts in login collection
+# DOCUMENT BUILDERS — one top-level document each, reused by benchmarks/loadtest
 # ---------------------------------------------------------------------------
 
 OPERATOR_ACCOUNTS = [
@@ -239,36 +238,20 @@ OPERATOR_ACCOUNTS = [
     {"email": "analyst2@cloudmetrics.io","role": "analyst"},
 ]
 
-operator_ids    = []
-operator_emails = []
 
-for op in OPERATOR_ACCOUNTS:
-    op_id = ObjectId()
-    operator_ids.append(op_id)
-    operator_emails.append(op["email"])
-    login_col.insert_one({
+def build_operator(op, op_id, password_hash):
+    return {
         "email":               op["email"],
-        "password":            hash_password("password123"),
+        "password":            password_hash,
         "role":                op["role"],
         "user_id":             str(op_id),
         "failed_attempts":     0,
         "last_password_change": random_date(180, 10),
-    })
-
-print(f"  ✓ operators     — {len(OPERATOR_ACCOUNTS)} login accounts seeded (2 admin, 2 analyst)")
-
-admin_ids    = [oid for oid, op in zip(operator_ids, OPERATOR_ACCOUNTS) if op["role"] == "admin"]
-admin_emails = [op["email"] for op in OPERATOR_ACCOUNTS if op["role"] == "admin"]
-
-
-# ---------------------------------------------------------------------------
-# SEED MONITORED USERS (SaaS customers — data, not system operators)
-# ---------------------------------------------------------------------------
+    }
 
-user_ids    = []
-user_emails = []
 
-for i in range(NUM_USERS):
+def build_user(i):
+    """Monitored user number i — the index keeps generated emails unique."""
     fname  = FIRST_NAMES[i % len(FIRST_NAMES)]
     lname  = random.choice(LAST_NAMES)
     domain = random.choice(COMPANY_DOMAINS)
@@ -276,12 +259,8 @@ for i in range(NUM_USERS):
     tier   = random.choice(SUBSCRIPTION_TIERS)
     status = random.choice(ACCOUNT_STATUSES)
 
-    user_id = ObjectId()
-    user_ids.append(user_id)
-    user_emails.append(email)
-
-    user_doc = {
-        "_id": user_id,
+    return {
+        "_id": ObjectId(),
         "profile": {
             "first_name": fname,
             "last_name":  lname,
@@ -293,6 +272,7 @@ for i in range(NUM_USERS):
             "timezone":   random.choice(TIMEZONES),
             "language":   random.choice(LANGUAGES),
         },
+        "search": {"email": email.lower(), "last_name": lname.lower(), "first_name": fname.lower()},
         "subscription": {
             "tier":           tier,
             "status":         status,
@@ -324,7 +304,6 @@ for i in range(NUM_USERS):
                 },
             },
         },
-        "usage_logs": generate_usage_logs(),
         "api_keys":   generate_api_keys(tier),
         "alerts":     generate_alerts(),
         "metadata": {
@@ -335,20 +314,34 @@ for i in range(NUM_USERS):
             "churn_risk":    random.choice(["low", "medium", "high"]),
         },
     }
-    users_col.insert_one(user_doc)
 
-print(f"  ✓ users         — {users_col.count_documents({})} monitored users inserted")
 
+def build_usage_logs(user):
+    """Time-series usage_logs documents for a user built by build_user()."""
+    meta = {"user_id": user["_id"], "tier": user["subscription"]["tier"]}
+    return [{**log, "meta": meta} for log in generate_usage_logs()]
 
-# ---------------------------------------------------------------------------
-# SEED ACTIVITY LOGS
-# ---------------------------------------------------------------------------
 
-activity_docs = []
-for _ in range(NUM_ACTIVITY_LOGS):
-    idx    = random.randint(0, NUM_USERS - 1)
+def build_usage_stats(logs):
+    """users.usage_stats for a user's usage logs — the running totals the usage log routes maintain."""
+    metrics = [log["metrics"] for log in logs]
+    stats   = {
+        "count":         len(metrics),
+        "api_calls":     sum(m["api_calls"] for m in metrics),
+        "storage_mb":    sum(m["storage_mb"] for m in metrics),
+        "read_ops":      sum(m["breakdown"]["read_ops"] for m in metrics),
+        "write_ops":     sum(m["breakdown"]["write_ops"] for m in metrics),
+        "delete_ops":    sum(m["breakdown"]["delete_ops"] for m in metrics),
+        "cache_hit_pct": sum(m["breakdown"]["cache_hit_pct"] for m in metrics),
+    }
+    stats["avg_api_calls"] = round(stats["api_calls"] / stats["count"], 2) if stats["count"] else None
+    return stats
+
+
+def build_activity_log(user_ids, user_emails):
+    idx    = random.randint(0, len(user_ids) - 1)
     region = random.choice(REGIONS)
-    activity_docs.append({
+    return {
         "user_id":     user_ids[idx],
         "user_email":  user_emails[idx],
         "action_type": random.choice(ACTION_TYPES),
@@ -371,21 +364,13 @@ for _ in range(NUM_ACTIVITY_LOGS):
         },
         "timestamp":  random_date(180),
         "session_id": rand_str(16),
-    })
-
-activity_logs_col.insert_many(activity_docs)
-print(f"  ✓ activity_logs — {activity_logs_col.count_documents({})} documents inserted")
+    }
 
 
-# ---------------------------------------------------------------------------
-# SEED ANOMALY FLAGS
-# ---------------------------------------------------------------------------
-
-anomaly_docs = []
-for _ in range(NUM_ANOMALY_FLAGS):
-    idx      = random.randint(0, NUM_USERS - 1)
+def build_anomaly_flag(user_ids, user_emails, admin_ids, admin_emails):
+    idx      = random.randint(0, len(user_ids) - 1)
     resolved = random.choice([True, False])
-    anomaly_docs.append({
+    return {
         "user_id":    user_ids[idx],
         "user_email": user_emails[idx],
         "reason":     random.choice(ANOMALY_REASONS),
@@ -409,18 +394,177 @@ for _ in range(NUM_ANOMALY_FLAGS):
             "notification_sent": True,
             "admin_alerted":     random.choice([True, False]),
         },
-    })
+    }
 
-anomaly_flags_col.insert_many(anomaly_docs)
-print(f"  ✓ anomaly_flags — {anomaly_flags_col.count_documents({})} documents inserted")
 
 # ---------------------------------------------------------------------------
-# DONE
+# SEEDING — batches are generated and written by a pool of worker processes
+#
+# Building documents is the slow part, so each worker takes a whole batch:
+# it generates the documents and writes them with one unordered insert_many
+# on its own MongoClient. With --seed, every batch reseeds `random` from
+# (seed, collection, first index), so a dataset is reproducible whatever
+# order the workers finish in (ObjectIds aside).
 # ---------------------------------------------------------------------------
 
-print("\nDatabase seeded successfully.")
-print("  Database    : saas_monitoring")
-print("  Collections : users, login, activity_logs, anomaly_flags")
-print("\nOperator accounts (all password: password123):")
-for op in OPERATOR_ACCOUNTS:
-    print(f"  {op['role']:8}  {op['email']}")
\ No newline at end of file
+_worker = {}
+
+
+def _init_worker(uri, db_name, seed, refs=None):
+    _worker["db"]   = MongoClient(uri)[db_name]
+    _worker["seed"] = seed
+    _worker["refs"] = refs
+
+
+def _reseed(collection, first):
+    if _worker["seed"] is not None:
+        random.seed(f"{_worker['seed']}:{collection}:{first}")
+
+
+def _users_batch(first, count):
+    _reseed("users", first)
+    docs  = [build_user(i) for i in range(first, first + count)]
+    usage = []
+    for doc in docs:
+        logs = build_usage_logs(doc)
+        doc["usage_stats"] = build_usage_stats(logs)
+        usage += logs
+    _worker["db"]["users"].insert_many(docs, ordered=False)
+    _worker["db"]["usage_logs"].insert_many(usage, ordered=False)
+    return [doc["_id"] for doc in docs], [doc["profile"]["email"] for doc in docs], len(usage)
+
+
+def _activity_batch(first, count):
+    _reseed("activity_logs", first)
+    refs = _worker["refs"]
+    docs = [build_activity_log(refs["user_ids"], refs["user_emails"]) for _ in range(count)]
+    _worker["db"]["activity_logs"].insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def _anomaly_batch(first, count):
+    _reseed("anomaly_flags", first)
+    refs = _worker["refs"]
+    docs = [
+        build_anomaly_flag(refs["user_ids"], refs["user_emails"], refs["admin_ids"], refs["admin_emails"])
+        for _ in range(count)
+    ]
+    _worker["db"]["anomaly_flags"].insert_many(docs, ordered=False)
+    return len(docs)
+
+
+def _run_batches(task, first, total, batch, workers, initargs):
+    """Yield task(first_index, count) results in batch order, from a process pool when workers > 1."""
+    batches = [(start, min(batch, first + total - start)) for start in range(first, first + total, batch)]
+    if workers <= 1:
+        _init_worker(*initargs)
+        for args in batches:
+            yield task(*args)
+        return
+    # spawn, not fork: the parent already holds a MongoClient (and its monitor threads) via indexes/config
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs) as pool:
+        # in submission order, so user_ids lines up with batch indexes however the workers finish
+        futures = [pool.submit(task, *args) for args in batches]
+        for future in futures:
+            yield future.result()
+
+
+def reset(db):
+    for name in SEEDED_COLLECTIONS:
+        db[name].drop()
+    ensure_collections(db)      # recreate usage_logs as a time-series collection
+
+
+def seed_operators(db, password_hash):
+    """
+    Admin + analyst accounts in the login collection, skipping any that already
+    exist. Every account shares one precomputed password hash. Returns (admin_ids, admin_emails).
+    """
+    existing = {doc["email"] for doc in db["login"].find({}, {"email": 1})}
+    missing  = [build_operator(op, ObjectId(), password_hash) for op in OPERATOR_ACCOUNTS if op["email"] not in existing]
+    if missing:
+        db["login"].insert_many(missing, ordered=False)
+
+    admins = list(db["login"].find({"role": "admin"}, {"email": 1, "user_id": 1}))
+    return [ObjectId(a["user_id"]) for a in admins], [a["email"] for a in admins]
+
+
+def seed_database(uri=MONGO_URI, db_name=DATABASE_NAME, users=NUM_USERS, activity=NUM_ACTIVITY_LOGS,
+                  anomalies=NUM_ANOMALY_FLAGS, workers=1, batch=1000, seed=None, append=False, log=print):
+    """
+    Seed db_name with operators, users (with usage logs, API keys and alerts),
+    activity logs and anomaly flags. Drops the collections first unless append
+    is set; appended users are numbered after the existing ones and activity /
+    anomalies reference existing users as well as new ones. Returns the counts written.
+    """
+    db = MongoClient(uri)[db_name]
+    if append:
+        log("Appending to existing collections...")
+    else:
+        log("Dropping old collections...")
+        reset(db)
+        log("Collections dropped. Seeding fresh data...\n")
+
+    if seed is not None:
+        random.seed(seed)
+    admin_ids, admin_emails = seed_operators(db, hash_password("password123"))
+    log(f"  ✓ operators     — {len(OPERATOR_ACCOUNTS)} login accounts ({len(admin_ids)} admin)")
+
+    user_ids, user_emails = [], []
+    first_user = 0
+    if append:
+        for doc in db["users"].find({}, {"profile.email": 1}):
+            user_ids.append(doc["_id"])
+            user_emails.append(doc["profile"]["email"])
+        first_user = len(user_ids)
+
+    usage_count = 0
+    for ids, emails, usage in _run_batches(_users_batch, first_user, users, batch, workers, (uri, db_name, seed)):
+        user_ids.extend(ids)
+        user_emails.extend(emails)
+        usage_count += usage
+    log(f"  ✓ users         — {users} monitored users inserted")
+    log(f"  ✓ usage_logs    — {usage_count} usage logs inserted")
+
+    if (activity or anomalies) and not user_ids:
+        raise SystemExit("activity logs and anomaly flags need users — seed some with --users")
+    refs     = {"user_ids": user_ids, "user_emails": user_emails, "admin_ids": admin_ids, "admin_emails": admin_emails}
+    initargs = (uri, db_name, seed, refs)
+
+    written = sum(_run_batches(_activity_batch, 0, activity, batch, workers, initargs))
+    log(f"  ✓ activity_logs — {written} documents inserted")
+
+    written = sum(_run_batches(_anomaly_batch, 0, anomalies, batch, workers, initargs))
+    log(f"  ✓ anomaly_flags — {written} documents inserted")
+
+    return {"users": users, "usage_logs": usage_count, "activity_logs": activity, "anomaly_flags": anomalies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database with synthetic data")
+    parser.add_argument("--users", type=int, default=NUM_USERS)
+    parser.add_argument("--activity", type=int, default=NUM_ACTIVITY_LOGS, help="activity logs")
+    parser.add_argument("--anomalies", type=int, default=NUM_ANOMALY_FLAGS, help="anomaly flags")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="generator processes")
+    parser.add_argument("--batch", type=int, default=1000, help="documents per insert_many")
+    parser.add_argument("--seed", type=int, help="random seed for a reproducible dataset")
+    parser.add_argument("--append", action="store_true", help="add to the existing data instead of dropping it")
+    parser.add_argument("--uri", default=os.environ.get("MONGO_URI", MONGO_URI))
+    parser.add_argument("--db", default=DATABASE_NAME, help="database name")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed_database(args.uri, args.db, args.users, args.activity, args.anomalies,
+                  args.workers, args.batch, args.seed, args.append)
+
+    print(f"\nDatabase seeded successfully in {time.perf_counter() - start:.1f}s.")
+    print(f"  Database    : {args.db}")
+    print(f"  Collections : {', '.join(SEEDED_COLLECTIONS)}")
+    print("\nOperator accounts (all password: password123):")
+    for op in OPERATOR_ACCOUNTS:
+        print(f"    {op['role']:8}  {op['email']}")
+
+
+if __name__ == "__main__":
+    main()
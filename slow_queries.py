@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import PyMongoError
+from pymongo.monitoring import CommandListener
+
+from instrumentation import current_route
+from timestamps import time_bounds
+
+# ---------------------------------------------------------------------------
+# SLOW QUERY CAPTURE — every command the app sends, from any route
+#
+# SlowQueryMonitor sits on the MongoClient next to the metrics listener, so
+# it sees every command without each route having to call a wrapper. A
+# command slower than SLOW_QUERY_MS is logged with its normalized shape
+# (field names and operators kept, values replaced by "?") and handed to a
+# background thread. That thread re-runs it as explain("executionStats") and
+# writes the outcome to the capped slow_queries collection: whether the plan
+# has a COLLSCAN, and how many keys/documents were examined per document
+# returned. Each shape is explained at most once per
+# SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS; repeats are still recorded, without a plan.
+# GET /admin/slow-queries groups the collection by shape.
+# ---------------------------------------------------------------------------
+
+SLOW_QUERY_MS      = int(os.environ.get("SLOW_QUERY_MS", 200))
+EXPLAIN_ENABLED    = os.environ.get("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+EXPLAIN_INTERVAL   = int(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS", 300))
+EXPLAIN_TIMEOUT_MS = int(os.environ.get("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", 10_000))
+QUEUE_MAX_SIZE     = 1000
+
+# commands explain() accepts; anything else is logged and recorded without a plan
+EXPLAINABLE   = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# added by the driver, not part of what the route asked for; aggregate needs its cursor option to be explained
+DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "maxTimeMS"}
+BATCH_FIELDS  = {"cursor", "batchSize"}
+# never captured: the capture's own traffic and server housekeeping
+IGNORED       = {"explain", "hello", "isMaster", "ismaster", "ping", "endSessions", "killCursors", "saslStart",
+                 "saslContinue", "serverStatus"}
+
+log = logging.getLogger("slow_queries")
+
+
+def normalize(value):
+    """Replace literal values with "?", keeping field names and operators. Lists collapse to their distinct shapes."""
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = normalize(item)
+            if shape != "?" and shape not in shapes:
+                shapes.append(shape)
+        return shapes or "?"
+    return "?"
+
+
+def command_shape(command_name, command):
+    """Normalized form of a command body, without the collection name or driver fields."""
+    return {
+        k: normalize(v) for k, v in command.items()
+        if k != command_name and k not in DRIVER_FIELDS | BATCH_FIELDS and not k.startswith("$")
+    }
+
+
+def shape_hash(command_name, collection, shape):
+    key = json.dumps([command_name, collection, shape], sort_keys=True)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _walk(node, stages, stats):
+    if isinstance(node, dict):
+        if isinstance(node.get("stage"), str):
+            stages.add(node["stage"])
+        execution = node.get("executionStats")
+        if isinstance(execution, dict):
+            stats["docs_examined"] += execution.get("totalDocsExamined", 0)
+            stats["keys_examined"] += execution.get("totalKeysExamined", 0)
+            stats["returned"]      += execution.get("nReturned", 0)
+        for child in node.values():
+            _walk(child, stages, stats)
+    elif isinstance(node, list):
+        for child in node:
+            _walk(child, stages, stats)
+
+
+def plan_summary(explain):
+    """Stages, COLLSCAN flag and examined/returned counts from find, aggregate or write explain output."""
+    stages = set()
+    stats  = {"docs_examined": 0, "keys_examined": 0, "returned": 0}
+    _walk(explain, stages, stats)
+    returned = max(stats["returned"], 1)
+    return {
+        "stages":             sorted(stages),
+        "collscan":           "COLLSCAN" in stages,
+        **stats,
+        "docs_examined_ratio": round(stats["docs_examined"] / returned, 2),
+        "keys_examined_ratio": round(stats["keys_examined"] / returned, 2),
+    }
+
+
+class SlowQueryMonitor(CommandListener):
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, explain=EXPLAIN_ENABLED):
+        self.threshold_ms = threshold_ms
+        self.explain      = explain
+        self.client       = None          # set by use_client(); explain and writes go through it
+        self._lock        = threading.Lock()
+        self._started     = {}            # (connection_id, request_id) -> (command, database)
+        self._explained   = {}            # shape hash -> monotonic time of its last explain
+        self._queue       = queue.Queue(maxsize=QUEUE_MAX_SIZE)
+        self._thread      = None
+
+    def use_client(self, client):
+        self.client = client
+
+    # -- listener ------------------------------------------------------------
+
+    def started(self, event):
+        if event.command_name in IGNORED:
+            return
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (event.command, event.database_name)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if started is None or duration_ms < self.threshold_ms:
+            return
+
+        command, database = started
+        collection = command.get("collection" if event.command_name == "getMore" else event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+        if collection == "slow_queries":
+            return
+
+        shape  = command_shape(event.command_name, command)
+        digest = shape_hash(event.command_name, collection, shape)
+        route  = current_route()
+        log.warning("slow %s on %s.%s took %.0f ms (route %s) shape=%s",
+                    event.command_name, database, collection, duration_ms, route,
+                    json.dumps(shape, sort_keys=True, default=str))
+
+        entry = {
+            "at":          datetime.utcnow(),
+            "route":       route,
+            "database":    database,
+            "collection":  collection,
+            "command":     event.command_name,
+            "duration_ms": round(duration_ms, 1),
+            "failed":      failed,
+            "shape":       json.dumps(shape, sort_keys=True, default=str),
+            "shape_hash":  digest,
+            "plan":        None,
+        }
+        to_explain = None
+        if self.explain and event.command_name in EXPLAINABLE and self._due(digest):
+            to_explain = {k: v for k, v in command.items() if k not in DRIVER_FIELDS and not k.startswith("$")}
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((entry, to_explain))
+        except queue.Full:
+            pass                                    # capture is best-effort; the log line above still exists
+
+    def _due(self, digest):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._explained.get(digest, -EXPLAIN_INTERVAL) < EXPLAIN_INTERVAL:
+                return False
+            self._explained[digest] = now
+            return True
+
+    # -- worker --------------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            entry, command = self._queue.get()
+            if self.client is None:
+                continue
+            database = self.client[entry["database"]]
+            if command is not None:
+                if any("$out" in stage or "$merge" in stage for stage in command.get("pipeline", [])):
+                    entry["explain_error"] = "pipelines with $out / $merge can't be explained with executionStats"
+                else:
+                    try:
+                        explain = database.command("explain", command, verbosity="executionStats",
+                                                   maxTimeMS=EXPLAIN_TIMEOUT_MS)
+                        entry["plan"] = plan_summary(explain)
+                    except PyMongoError as e:
+                        entry["explain_error"] = str(e)
+            try:
+                database["slow_queries"].insert_one(entry)
+            except PyMongoError:
+                pass
+
+
+slow_query_monitor = SlowQueryMonitor()
+
+
+# ---------------------------------------------------------------------------
+# REPORT — worst offenders by shape
+# ---------------------------------------------------------------------------
+
+OFFENDER_SORTS = {"total": "total_ms", "max": "max_ms", "count": "count", "examined": "docs_examined_ratio"}
+
+
+def worst_offenders_pipeline(bounds=None, sort="total", limit=20):
+    """Slow-query samples grouped by shape, each with its newest plan summary."""
+    match = [{"$match": {"at": bounds}}] if bounds else []
+    return match + [
+        {"$sort": {"at": -1}},
+        {"$group": {
+            "_id":        "$shape_hash",
+            "command":    {"$first": "$command"},
+            "collection": {"$first": "$collection"},
+            "shape":      {"$first": "$shape"},
+            "routes":     {"$addToSet": "$route"},
+            "count":      {"$sum": 1},
+            "total_ms":   {"$sum": "$duration_ms"},
+            "avg_ms":     {"$avg": "$duration_ms"},
+            "max_ms":     {"$max": "$duration_ms"},
+            "last_seen":  {"$first": "$at"},
+            "plans":      {"$push": "$plan"},         # newest first; most samples of a shape have no plan
+        }},
+        {"$set": {
+            "plan":     {"$first": {"$filter": {"input": "$plans", "cond": {"$ne": ["$$this", None]}}}},
+            "avg_ms":   {"$round": ["$avg_ms", 1]},
+            "total_ms": {"$round": ["$total_ms", 1]},
+        }},
+        {"$set": {
+            "collscan":            {"$ifNull": ["$plan.collscan", None]},
+            "docs_examined_ratio": {"$ifNull": ["$plan.docs_examined_ratio", None]},
+        }},
+        {"$project": {"plans": 0}},
+        {"$sort": {OFFENDER_SORTS[sort]: -1}},
+        {"$limit": limit},
+    ]
+
+
+def worst_offenders_query(args):
+    """
+    ?window= / ?from=&to=, ?sort=total|max|count|examined, ?limit= (max 100), ?shape=<hash>.
+    Returns ({"pipeline" or "filter", "limit"}, error) — ?shape= lists that shape's recent samples instead.
+    """
+    bounds, error = time_bounds(args)
+    if error:
+        return None, error
+    sort = args.get("sort", "total")
+    if sort not in OFFENDER_SORTS:
+        return None, (f"sort must be one of: {', '.join(OFFENDER_SORTS)}", "sort", 422)
+    try:
+        limit = int(args.get("limit", 20))
+    except ValueError:
+        return None, ("limit must be an integer", "limit", 422)
+    if not 1 <= limit <= 100:
+        return None, ("limit must be between 1 and 100", "limit", 422)
+
+    if args.get("shape"):
+        query = {"shape_hash": args["shape"], **({"at": bounds} if bounds else {})}
+        return {"filter": query, "limit": limit}, None
+    return {"pipeline": worst_offenders_pipeline(bounds, sort, limit), "limit": limit}, None
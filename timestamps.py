@@ -0,0 +1,68 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+# ---------------------------------------------------------------------------
+# TIMESTAMPS — every stored timestamp is a BSON date in naive UTC
+#
+# Range filters only use an index as a single range when every value in the
+# field has the same BSON type, and a date never compares equal to (or
+# inside a range of) ISO strings. Write routes therefore store datetime
+# objects, query parameters are parsed into datetimes before they reach a
+# filter, and migrations/normalize_timestamps.py converts any ISO strings
+# written before this was enforced.
+# ---------------------------------------------------------------------------
+
+WINDOW_RE    = re.compile(r"^(\d+)([mhd])$")
+WINDOW_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def to_datetime(value):
+    """datetime (aware or naive) or ISO 8601 string -> naive UTC datetime. Raises ValueError."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def time_bounds(args):
+    """
+    Bounds for ?from=&to= (ISO 8601) or ?window= (e.g. 30m, 24h, 7d — ending now),
+    as a {"$gte": ..., "$lte": ...} filter value. Returns (bounds or None, error)
+    where error is a (message, field, code) tuple. A date-only `to` covers that whole day.
+    """
+    bounds = {}
+    if args.get("window"):
+        if args.get("from"):
+            return None, ("use either window or from, not both", "window", 422)
+        match = WINDOW_RE.match(args.get("window"))
+        if not match:
+            return None, ("window must be a number followed by m, h or d (e.g. 24h)", "window", 422)
+        try:
+            bounds["$gte"] = datetime.utcnow() - timedelta(**{WINDOW_UNITS[match[2]]: int(match[1])})
+        except OverflowError:
+            return None, ("window reaches before the earliest supported date", "window", 422)
+
+    for arg in ("from", "to"):
+        raw = args.get(arg)
+        if not raw:
+            continue
+        try:
+            value = to_datetime(raw)
+        except ValueError:
+            return None, (f"{arg} must be an ISO 8601 date or datetime", arg, 422)
+        if arg == "from":
+            bounds["$gte"] = value
+        elif len(raw) == 10:                      # YYYY-MM-DD
+            try:
+                bounds["$lt"] = value + timedelta(days=1)
+            except OverflowError:
+                bounds["$lte"] = datetime.max         # 9999-12-31 has no next day
+        else:
+            bounds["$lte"] = value
+
+    upper = bounds.get("$lte", bounds.get("$lt"))
+    if "$gte" in bounds and upper is not None and bounds["$gte"] > upper:
+        return None, ("from must be before to", "from", 422)
+    return (bounds or None), None
+
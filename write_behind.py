@@ -0,0 +1,182 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import response_cache
+import rollups
+from config import db
+
+# ---------------------------------------------------------------------------
+# WRITE-BEHIND INGESTION — optional buffer between POST /activity-logs and Mongo
+#
+# With ACTIVITY_WRITE_BEHIND=true, validated activity logs are given an _id
+# and put on a bounded in-process queue; the request returns 202 straight
+# away. A background thread drains the queue with insert_many whenever a
+# batch fills up or the flush interval passes. When Mongo is unavailable the
+# batch is retried with backoff while new events keep queueing, and once the
+# queue is full callers get a 429. Because _ids are assigned up front, a
+# retried batch that was partly written only hits duplicate-key errors for the
+# documents already stored, which are counted as written. Anything still
+# queued is flushed at interpreter exit.
+#
+# Events live in this process until flushed — a hard kill loses at most one
+# queue's worth. Metrics are served at GET /health/ingest.
+# ---------------------------------------------------------------------------
+
+WRITE_BEHIND_ENABLED = os.environ.get("ACTIVITY_WRITE_BEHIND", "false").lower() == "true"
+QUEUE_MAX_SIZE       = int(os.environ.get("WRITE_BEHIND_MAX_QUEUE", 10_000))
+BATCH_SIZE           = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 500))
+FLUSH_INTERVAL       = int(os.environ.get("WRITE_BEHIND_FLUSH_MS", 200)) / 1000
+SHUTDOWN_TIMEOUT     = int(os.environ.get("WRITE_BEHIND_SHUTDOWN_SECONDS", 10))
+MAX_BACKOFF          = 5.0
+DUPLICATE_KEY        = 11000
+
+log = logging.getLogger("write_behind")
+
+
+class WriteBehindQueue:
+    def __init__(self, col, max_size=QUEUE_MAX_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, on_flush=None):
+        self.col            = col
+        self.batch_size     = batch_size
+        self.flush_interval = flush_interval
+        self.on_flush       = on_flush
+        self._queue   = queue.Queue(maxsize=max_size)
+        self._stop    = threading.Event()
+        self._thread  = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "rejected": 0, "written": 0, "failed": 0,
+            "flushes": 0, "retries": 0, "flush_ms_total": 0.0, "flush_ms_max": 0.0,
+            "last_flush_at": None,
+        }
+
+    def put(self, doc):
+        """Queue a document for writing, giving it an _id. Returns False when the queue is full."""
+        self._ensure_started()
+        doc.setdefault("_id", ObjectId())
+        try:
+            self._queue.put_nowait(doc)
+        except queue.Full:
+            self._count(rejected=1)
+            return False
+        self._count(enqueued=1)
+        return True
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT):
+        """Stop the worker after it has written everything already queued."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        flushes = stats.pop("flushes")
+        total   = stats.pop("flush_ms_total")
+        return {
+            "queue_depth":      self._queue.qsize(),
+            "queue_max":        self._queue.maxsize,
+            "batch_size":       self.batch_size,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            "flushes":          flushes,
+            "avg_flush_ms":     round(total / flushes, 2) if flushes else 0.0,
+            "max_flush_ms":     round(stats.pop("flush_ms_max"), 2),
+            **stats,
+        }
+
+    # -- worker --------------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-write-behind", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self._stats[key] += value
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        # wait up to flush_interval for the batch to fill; past that, take only what is already queued
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = self._next_batch()
+                if batch:
+                    self._write(batch)
+            except Exception:
+                # the flush thread must outlive any bad batch, or the queue fills and ingest 429s for good
+                log.exception("write-behind flush failed")
+                time.sleep(FLUSH_INTERVAL)
+
+    def _write(self, batch):
+        backoff = 0.1
+        while True:
+            start = time.perf_counter()
+            failed = set()
+            try:
+                self.col.insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # duplicates are documents an earlier, interrupted attempt already stored
+                failed = {w["index"] for w in e.details.get("writeErrors", []) if w.get("code") != DUPLICATE_KEY}
+            except PyMongoError:
+                if self._stop.is_set() and backoff > MAX_BACKOFF:
+                    self._count(failed=len(batch))     # shutting down and Mongo still unreachable
+                    return
+                self._count(retries=1)
+                time.sleep(min(backoff, MAX_BACKOFF))
+                backoff *= 2
+                continue
+
+            elapsed = (time.perf_counter() - start) * 1000
+            written = [doc for n, doc in enumerate(batch) if n not in failed]
+            with self._stats_lock:
+                self._stats["written"]        += len(written)
+                self._stats["failed"]         += len(failed)
+                self._stats["flushes"]        += 1
+                self._stats["flush_ms_total"] += elapsed
+                self._stats["flush_ms_max"]    = max(self._stats["flush_ms_max"], elapsed)
+                self._stats["last_flush_at"]   = datetime.utcnow()
+            if self.on_flush and written:
+                try:
+                    self.on_flush(written)
+                except Exception:
+                    # the batch is already stored; derived state is reconciled by the rollup rebuild
+                    log.exception("write-behind on_flush hook failed for %d documents", len(written))
+            return
+
+
+def _after_activity_flush(docs):
+    rollups.record_activity([doc["timestamp"] for doc in docs])
+    response_cache.invalidate("activity_logs")
+
+
+activity_queue = WriteBehindQueue(db["activity_logs"], on_flush=_after_activity_flush)